@@ -0,0 +1,276 @@
+"""
+Vectorized breakpoints and bucket assignment for portfolio sorts.
+
+Portfolio sorts compute percentile breakpoints of a characteristic within
+every formation date (e.g. every June) and assign each stock the bucket of
+its value. Instead of a Python loop over years with a row-wise `apply`,
+the breakpoints of all dates and percentiles are computed from one sort of
+the panel, and bucket codes are assigned with `np.searchsorted` on each
+date's segment of rows.
+
+Breakpoints are returned as a DataFrame indexed by date (one column per
+percentile), so they can be inspected, stored and reused. Quantiles use
+linear interpolation, as `pd.Series.quantile`.
+
+Only interior percentiles (strictly between 0 and 1) are breakpoints: K
+breakpoints give K + 1 buckets. Using the 100th percentile as a breakpoint
+puts the largest stock of every year in a bucket of its own.
+
+Fama-French sorts use NYSE breakpoints: the percentiles are computed from
+NYSE stocks only and applied to all stocks. `breakpoint_table` computes the
+breakpoints of a reference universe and keeps them in a table keyed by
+(variable, date column, percentiles, universe), in memory and as parquet
+files in `CACHE_DIR`, so later runs and other sorts reuse them. Every date
+of the table also stores a fingerprint of the reference values it was
+computed from; only dates that are missing from the table, or whose
+reference values changed (a data re-pull, or a variable of the same name
+defined differently elsewhere), are computed.
+
+Functions:
+- grouped_quantiles(values, groups, percentiles): Breakpoints for every group.
+- sorted_quantiles(sorted_values, counts, percentiles): The same for values already sorted by group.
+- bucket_codes(values, groups, breakpoints, side): Integer bucket codes (-1 if missing).
+- interior_breakpoints(breakpoints): Distinct inner breakpoints, as `pd.cut` bins after `drop_duplicates`.
+- universe_mask(df, universe): Rows of the reference universe ("all" or "nyse").
+- breakpoint_table(df, variable, percentiles, ...): Cached breakpoints of a universe.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import config
+
+TERCILE_PERCENTILES = (0.3, 0.7)
+QUINTILE_PERCENTILES = (0.2, 0.4, 0.6, 0.8)
+DECILE_PERCENTILES = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+
+CACHE_DIR = Path(config.DATA_DIR) / "derived" / "breakpoints"
+UNIVERSES = ("all", "nyse")
+
+
+def _group_codes(groups, uniques=None):
+    """Integer codes of `groups` (-1 for missing or unknown) and the sorted unique groups."""
+    if uniques is None:
+        codes, uniques = pd.factorize(groups, sort=True)
+        return codes, pd.Index(uniques)
+    return pd.Index(uniques).get_indexer(groups), pd.Index(uniques)
+
+
+def grouped_quantiles(values, groups, percentiles):
+    """
+    Quantiles of `values` within every group, for all groups and
+    percentiles at once. Missing values are ignored.
+
+    Parameters:
+    values (array-like): Characteristic values.
+    groups (array-like): Group of every value, e.g. the formation year.
+    percentiles (sequence of float): Percentiles in [0, 1].
+
+    Returns:
+    pd.DataFrame: One row per group (sorted), one column per percentile.
+    Groups without values have missing breakpoints.
+    """
+    values = np.asarray(values, dtype=float)
+    percentiles = np.asarray(percentiles, dtype=float)
+    codes, uniques = _group_codes(groups)
+    n_groups = len(uniques)
+
+    keep = ~np.isnan(values) & (codes >= 0)
+    v, c = values[keep], codes[keep]
+    order = np.lexsort((v, c))
+    v = v[order]
+
+    table = sorted_quantiles(v, np.bincount(c, minlength=n_groups), percentiles)
+
+    index = uniques.copy()
+    index.name = getattr(groups, "name", None)
+    return pd.DataFrame(table, index=index, columns=list(percentiles))
+
+
+def sorted_quantiles(sorted_values, counts, percentiles):
+    """
+    Quantiles of every group of values sorted by (group, value), without
+    missing values; group k has `counts[k]` values.
+
+    Returns:
+    np.ndarray: (groups, percentiles) quantiles, missing for empty groups.
+    """
+    v = np.asarray(sorted_values, dtype=float)
+    counts = np.asarray(counts, dtype=np.int64)
+    percentiles = np.asarray(percentiles, dtype=float)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    has_values = counts > 0
+    last = np.maximum(counts - 1, 0)
+
+    # linear interpolation between the order statistics around (n - 1) * q,
+    # computed as in numpy so the result equals `Series.quantile` exactly
+    position = last[:, None] * percentiles[None, :]
+    lo = np.floor(position).astype(np.int64)
+    hi = np.minimum(lo + 1, last[:, None])
+    frac = position - lo
+    if len(v):
+        below = v[np.where(has_values[:, None], starts[:, None] + lo, 0)]
+        above = v[np.where(has_values[:, None], starts[:, None] + hi, 0)]
+    else:
+        below = above = np.full(position.shape, np.nan)
+    diff = above - below
+    table = np.where(frac >= 0.5, above - diff * (1 - frac), below + diff * frac)
+    table[~has_values] = np.nan
+    return table
+
+
+def bucket_codes(values, groups, breakpoints, side="right"):
+    """
+    Bucket of every value among the breakpoints of its group.
+
+    Parameters:
+    values (array-like): Characteristic values.
+    groups (array-like): Group of every value; must index `breakpoints`.
+    breakpoints (pd.DataFrame): Breakpoints by group, as from `grouped_quantiles`.
+    side (str): "right" puts values equal to a breakpoint in the upper
+        bucket, "left" in the lower bucket (as `np.searchsorted`).
+
+    Returns:
+    np.ndarray: int16 codes 0..K for K breakpoints; -1 where the value is
+    missing or its group has no breakpoints.
+    """
+    values = np.asarray(values, dtype=float)
+    codes, _ = _group_codes(groups, breakpoints.index)
+    table = breakpoints.to_numpy(dtype=float)
+    out = np.full(len(values), -1, dtype=np.int16)
+
+    rows = np.flatnonzero((codes >= 0) & ~np.isnan(values))
+    rows = rows[np.argsort(codes[rows], kind="stable")]
+    segment_codes = codes[rows]
+    bounds = np.flatnonzero(np.diff(segment_codes)) + 1
+    for segment in np.split(rows, bounds):
+        if len(segment) == 0:
+            continue
+        bp = table[codes[segment[0]]]
+        if np.isnan(bp).any():
+            continue
+        out[segment] = np.searchsorted(bp, values[segment], side=side)
+    return out
+
+
+def interior_breakpoints(breakpoints):
+    """
+    The distinct breakpoints strictly between the lowest and the highest
+    percentile of every group, padded with +inf on the right.
+
+    These are the inner bin edges of `pd.cut` on quantiles from 0 to 1 after
+    `.drop_duplicates()`, with the first and last edge replaced by -inf and
+    +inf: tied breakpoints merge portfolios instead of creating empty ones.
+    """
+    table = breakpoints.to_numpy(dtype=float)
+    first = np.ones((len(table), 1), dtype=bool)
+    distinct = np.concatenate([first, np.diff(table, axis=1) != 0], axis=1)
+    inner = distinct & (table > table[:, :1]) & (table < table[:, -1:])
+    padded = np.sort(np.where(inner, table, np.inf), axis=1)[:, : max(table.shape[1] - 2, 0)]
+    padded[np.isnan(table).any(axis=1)] = np.nan
+    return pd.DataFrame(padded, index=breakpoints.index)
+
+
+def universe_mask(df, universe="nyse"):
+    """
+    Rows of `df` in the breakpoint universe: "all", or "nyse" for NYSE
+    stocks (`primaryexch == 'N'` in the CIZ format, `exchcd == 1` in SIZ).
+    """
+    if universe == "all":
+        return np.ones(len(df), dtype=bool)
+    if universe == "nyse":
+        if "primaryexch" in df:
+            return (df["primaryexch"] == "N").to_numpy()
+        if "exchcd" in df:
+            return (df["exchcd"] == 1).to_numpy()
+        raise KeyError("NYSE breakpoints need a 'primaryexch' or 'exchcd' column")
+    raise ValueError(f"universe must be one of {UNIVERSES}, not {universe!r}")
+
+
+_BREAKPOINTS = {}
+# column of the cached tables with the fingerprint of every date's reference values
+FINGERPRINT = "fingerprint"
+
+
+def _cache_path(cache_dir, variable, percentiles, universe, date_col="year"):
+    tag = "-".join(f"{100 * p:g}" for p in percentiles)
+    return Path(cache_dir) / f"{variable}_{date_col}_{universe}_p{tag}.parquet"
+
+
+def _fingerprints(values, dates, index):
+    """
+    Order-independent hash of the non-missing `values` of every date in
+    `index`: the wrapped sum of the value hashes, mixed with their count.
+    """
+    values = np.asarray(values, dtype=float)
+    ok = ~np.isnan(values)
+    codes = index.get_indexer(np.asarray(dates)[ok])
+    hashes = pd.util.hash_array(values[ok])[codes >= 0]
+    codes = codes[codes >= 0]
+    sums = np.zeros(len(index), dtype=np.uint64)
+    np.add.at(sums, codes, hashes)
+    counts = np.bincount(codes, minlength=len(index)).astype(np.uint64)
+    return sums + counts * np.uint64(0x9E3779B97F4A7C15)
+
+
+def breakpoint_table(
+    df,
+    variable,
+    percentiles,
+    date_col="year",
+    universe="nyse",
+    cache_dir=CACHE_DIR,
+    refresh=False,
+):
+    """
+    Breakpoints of `variable` for every date in `df`, computed from the
+    stocks in `universe` and cached.
+
+    Breakpoints already in the cache for (variable, date_col, percentiles,
+    universe) are reused for the dates whose reference values in `df` are
+    the ones they were computed from; the other dates are computed from
+    `df` and replace or extend the cached ones. Pass `refresh=True` to
+    recompute every date, or `cache_dir=None` to compute without caching.
+
+    Returns:
+    pd.DataFrame: One row per date of `df` (sorted), one column per
+    percentile, as from `grouped_quantiles`. Dates without reference stocks
+    have missing breakpoints.
+    """
+    # rounded so that e.g. np.linspace(0, 1, 6) and (0, 0.2, ..., 1) share an entry
+    percentiles = tuple(round(float(p), 10) for p in percentiles)
+    dates = pd.Index(pd.unique(df[date_col].dropna())).sort_values()
+    dates.name = date_col
+    reference = universe_mask(df, universe)
+    fingerprints = _fingerprints(df.loc[reference, variable], df.loc[reference, date_col], dates)
+
+    table = None
+    path = None
+    if cache_dir is not None:
+        path = _cache_path(cache_dir, variable, percentiles, universe, date_col)
+        if not refresh:
+            table = _BREAKPOINTS.get(path)
+            if table is None and path.exists():
+                table = pd.read_parquet(path)
+                table.columns = [c if c == FINGERPRINT else float(c) for c in table.columns]
+
+    if table is None:
+        missing = dates
+    else:
+        positions = table.index.get_indexer(dates)
+        cached = np.zeros(len(dates), dtype=np.uint64)
+        cached[positions >= 0] = table[FINGERPRINT].to_numpy(dtype=np.uint64)[positions[positions >= 0]]
+        missing = dates[(positions < 0) | (cached != fingerprints)]
+    if len(missing):
+        rows = reference & df[date_col].isin(missing).to_numpy()
+        new = grouped_quantiles(df.loc[rows, variable], df.loc[rows, date_col], percentiles)
+        new = new.reindex(missing)
+        new[FINGERPRINT] = fingerprints[dates.get_indexer(missing)]
+        table = new if table is None else pd.concat([table.drop(index=missing, errors="ignore"), new]).sort_index()
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            table.set_axis([str(c) for c in table.columns], axis=1).to_parquet(path)
+    if path is not None:
+        _BREAKPOINTS[path] = table
+    return table.drop(columns=FINGERPRINT).reindex(dates)
@@ -0,0 +1,214 @@
+"""
+Bivariate 2x3 portfolios on size and E/P, CF/P and D/P, with and without
+dividends (the `6_Portfolios_ME_{EP,CFP,DP}_2x3[_Wout_Div]` files of Ken
+French's data library).
+
+The portfolios are formed at the end of June of year t as the intersections
+of two size portfolios (NYSE median of June ME) and three portfolios of the
+ratio (30th and 70th NYSE percentiles). E/P and CF/P use accounting data
+of the fiscal year ending in t-1 and ME of December t-1; D/P is the
+dividends paid from July t-1 to June t over ME of June t (see
+`characteristics.add_dividend_yield`). They are held from July t to June t+1.
+
+The six families share one sort: the size median and the 30/70 breakpoints
+of every ratio are computed (and cached) in one `batch_sort_codes` pass,
+every family is a column of one membership matrix, the June assignments of
+all families are carried to the holding months in one `expand_holdings`
+join, and the returns of all families come out of one reduction per return
+column (with and without dividends).
+"""
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import config
+
+
+OUTPUT_DIR = Path(config.OUTPUT_DIR)
+DATA_DIR = Path(config.DATA_DIR)
+
+from calc_op_inv_portfolios import calculate_market_equity, use_dec_market_equity
+from breakpoints import CACHE_DIR, TERCILE_PERCENTILES
+from characteristics import add_dividend_yield
+from cross_section import transform_characteristics
+from month_index import june_formation_month, month_index
+from portfolio_aggregation import membership_portfolios
+from portfolio_holdings import expand_holdings
+from portfolio_sorts import SortDimension, batch_sort_codes, portfolio_codes, portfolio_labels
+
+
+SIZE_DIMENSION = SortDimension('me', [0.5], labels=['SMALL', 'BIG'])
+# sorting ratio -> its name in the Ken French file names
+BIVARIATE_METRICS = {'ep': 'EP', 'cfp': 'CFP', 'dy': 'DP'}
+# return column -> suffix of the family name
+RETURN_VARIANTS = {'ret': '', 'retx': '_Wout_Div'}
+
+
+def merge_CRSP_and_Compustat(crsp_jun, comp, dividend_yield):
+    """
+    Attach the accounting data of the fiscal year ending in calendar year
+    t-1 and the June t dividend yield to the June t CRSP rows, and compute
+    the ratios:
+    - ep: earnings (ni) / December t-1 ME.
+    - cfp: cash flow (ebit + depreciation + deferred taxes, as in
+      `calc_univariate_portfolios`) / December t-1 ME.
+    - dy: trailing 12-month dividends / June t ME (`dividend_yield`, with
+      columns permno, mdate and dy); missing for stocks that paid no dividends.
+    """
+    comp = comp[['gvkey', 'datadate', 'ni', 'ebit', 'dp', 'txditc']]
+    comp['mdate'] = june_formation_month(month_index(comp['datadate']))
+
+    ccm_jun = pd.merge(crsp_jun, comp, how='inner', on=['gvkey', 'mdate'])
+    ccm_jun = pd.merge(ccm_jun, dividend_yield[['permno', 'mdate', 'dy']], how='left', on=['permno', 'mdate'])
+
+    dec_me = ccm_jun['dec_me'].where(ccm_jun['dec_me'] > 0)
+    cf = ccm_jun['ebit'] + ccm_jun['dp'].fillna(0) + ccm_jun['txditc'].fillna(0)
+    ccm_jun['ep'] = ccm_jun['ni'] / dec_me
+    ccm_jun['cfp'] = cf / dec_me
+    ccm_jun['dy'] = ccm_jun['dy'].where(ccm_jun['dy'] > 0)
+    return ccm_jun
+
+
+def metric_dimension(metric, name):
+    """30/70 sort of the non-negative values of `metric` (e.g. LoEP, MedEP, HiEP)."""
+    return SortDimension(
+        metric, TERCILE_PERCENTILES, labels=[f'Lo{name}', f'Med{name}', f'Hi{name}'],
+        side='left', nonnegative=True,
+    )
+
+
+def bivariate_membership(
+    ccm_jun, metrics=BIVARIATE_METRICS, universe=config.BREAKPOINT_UNIVERSE, cache_dir=CACHE_DIR
+):
+    """
+    2x3 portfolio of every stock-year in every ME x ratio family.
+
+    The size median and the 30/70 breakpoints of all ratios are computed per
+    year from the stocks in `universe` in one `batch_sort_codes` call, so
+    the size sort is shared by every family.
+
+    Returns:
+    (np.ndarray, dict): int16 portfolio codes of shape (rows, families), -1
+    where the stock is not in a portfolio of that family, and the portfolio
+    labels of every family (e.g. 'ME_EP' -> ['SMALL LoEP', ..., 'BIG HiEP']).
+    """
+    dimensions = [metric_dimension(metric, name) for metric, name in metrics.items()]
+    codes = batch_sort_codes(
+        ccm_jun, [SIZE_DIMENSION, *dimensions], date_col='year', universe=universe, cache_dir=cache_dir
+    )
+
+    membership = np.empty((len(ccm_jun), len(dimensions)), dtype=np.int16)
+    labels = {}
+    for j, dimension in enumerate(dimensions):
+        pair = [SIZE_DIMENSION, dimension]
+        membership[:, j] = portfolio_codes(codes[[d.name for d in pair]].to_numpy(), pair)
+        labels[f'ME_{metrics[dimension.variable]}'] = portfolio_labels(pair)
+    return membership, labels
+
+
+def bivariate_portfolios(holdings, labels, ret_col='ret', size_col='L_me'):
+    """
+    Monthly value- and equal-weighted returns, firm counts and average size
+    of the portfolios of every family in one reduction.
+
+    `holdings` has one int16 column per family (named as in `labels`) and
+    `date`, `weight`, `ret_col` and `size_col`. Returns the
+    `membership_portfolios` table with the family in `sort`.
+    """
+    return membership_portfolios(
+        holdings['date'],
+        holdings[list(labels)].to_numpy(),
+        labels,
+        holdings[ret_col].to_numpy(),
+        holdings['weight'].to_numpy(),
+        size=holdings[size_col].to_numpy(),
+    )
+
+
+def annual_returns(ports):
+    """Compound the monthly VW and EW returns of every portfolio from January to December."""
+    ports = ports.assign(year=pd.DatetimeIndex(ports['date']).year)
+    gross = ports[['vwret', 'ewret']].add(1).groupby([ports['sort'], ports['portfolio'], ports['year']]).prod()
+    return (gross - 1).reset_index()
+
+
+def formation_characteristics(ccm_jun, membership, labels, metrics=BIVARIATE_METRICS):
+    """
+    Value-weighted average (by June ME) of the sorting ratio of every
+    portfolio when it is formed, e.g. 'vw_ep' for the ME_EP family.
+    """
+    ports = membership_portfolios(
+        ccm_jun['year'], membership, labels, ccm_jun['ret'].to_numpy(), ccm_jun['me'].to_numpy(),
+        vw={metric: ccm_jun[metric].to_numpy() for metric in metrics},
+    )
+    # the VW averages of all ratios come out of the reduction; keep the family's own
+    vw = ports[[f'vw_{metric}' for metric in metrics]].to_numpy()
+    family = pd.Index([f'ME_{name}' for name in metrics.values()]).get_indexer(ports['sort'])
+    ports['vw_metric'] = vw[np.arange(len(ports)), family]
+    return ports.rename(columns={'date': 'year'})
+
+
+def family_sheets(monthly, annual, formation, family, labels, metric_name):
+    """Sheets of one family in the layout of `calc_op_inv_portfolios`."""
+    def table(df, index, values):
+        df = df[df['sort'] == family]
+        return df.pivot(index=index, columns='portfolio', values=values).reindex(columns=labels)
+
+    return {
+        'VW Avg Mo. Ret': table(monthly, 'date', 'vwret'),
+        'EW Avg Mo. Ret': table(monthly, 'date', 'ewret'),
+        'VW Avg Ann. Ret': table(annual, 'year', 'vwret'),
+        'EW Avg Ann. Ret': table(annual, 'year', 'ewret'),
+        'Num Firms': table(monthly, 'date', 'n_firms'),
+        'Avg Firm Size': table(monthly, 'date', 'avg_size'),
+        f'VW Avg {metric_name}': table(formation, 'year', 'vw_metric'),
+    }
+
+
+if __name__ == "__main__":
+    ###########################
+    ## Load Data
+    ###########################
+    # the loaders need the WRDS stack; the functions above do not
+    from load_CRSP_Compustat import load_compustat, load_CRSP_Comp_Link_Table
+
+    comp = load_compustat(data_dir=DATA_DIR)
+    ccm = load_CRSP_Comp_Link_Table(data_dir=DATA_DIR)
+
+    if config.PORTFOLIO_BACKEND == "polars":
+        import polars_backend
+
+        crsp2 = polars_backend.calculate_market_equity(ccm, date_col="date", price_col=None)
+        crsp3, crsp_jun = polars_backend.use_dec_market_equity(crsp2, flavor="siz")
+        crsp3, crsp_jun = polars_backend.collect_to_pandas(crsp3, crsp_jun)
+    else:
+        crsp2 = calculate_market_equity(ccm)
+        crsp3, crsp_jun = use_dec_market_equity(crsp2)
+    crsp3 = add_dividend_yield(crsp3)
+    ccm_jun = merge_CRSP_and_Compustat(crsp_jun, comp, crsp3[crsp3['month'] == 6])
+
+    ############################
+    ## Form the 2x3 Portfolios
+    ############################
+    membership, labels = bivariate_membership(ccm_jun)
+    # the ratios are sorted raw (the sorts drop the negative ones) and their VW
+    # averages use the transformed values (`config.CHARACTERISTIC_TRANSFORM`)
+    transform_characteristics(ccm_jun, list(BIVARIATE_METRICS), date_col='year')
+    families = list(labels)
+    for j, family in enumerate(families):
+        ccm_jun[family] = membership[:, j]
+
+    # June t assignments of all families, held from July t to June t+1
+    holdings = expand_holdings(ccm_jun, crsp3, families, year_col='year', date_col='date',
+                               ret_col='ret', weight_col='wt', value_cols=('retx', 'L_me'))
+    formation = formation_characteristics(ccm_jun, membership, labels)
+
+    metric_names = {f'ME_{name}': name for name in BIVARIATE_METRICS.values()}
+    for ret_col, suffix in RETURN_VARIANTS.items():
+        monthly = bivariate_portfolios(holdings, labels, ret_col=ret_col)
+        annual = annual_returns(monthly)
+        for family in families:
+            sheets = family_sheets(monthly, annual, formation, family, labels[family], metric_names[family])
+            filename = DATA_DIR / 'manual' / f'6_Portfolios_{family}_2x3{suffix}.xlsx'
+            with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=True)
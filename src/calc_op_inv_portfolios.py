@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from pandas.tseries.offsets import YearEnd
 from pathlib import Path
 import config
 
@@ -7,10 +8,16 @@ import config
 OUTPUT_DIR = Path(config.OUTPUT_DIR)
 DATA_DIR = Path(config.DATA_DIR)
 
-# from load_CRSP_Compustat import *
-# from load_CRSP_stock import *
-from load_CRSP_Compustat import *
-from load_CRSP_stock import *
+from panel_index import PanelIndex
+from breakpoints import CACHE_DIR, QUINTILE_PERCENTILES
+from cross_section import transform_characteristics
+from portfolio_sorts import SortDimension, portfolio_codes, portfolio_labels, sort_codes
+from portfolio_aggregation import portfolio_table
+from portfolio_holdings import expand_holdings
+from turnover import portfolio_turnover, transition_matrix
+from segment_kernels import offsets_from_sorted_keys, segment_cumprod, segment_shift
+from month_index import add_month_index_columns, month_index, month_index_to_date
+from rebalancing import MONTHLY, QUARTERLY, accounting_in_force, rebalanced_portfolios
 
 
 # Blue print
@@ -57,32 +64,32 @@ def use_dec_market_equity(crsp2):
     the portfolio.'
 
     """
+    # integer month index, calendar and July-to-June year/month
+    crsp2 = add_month_index_columns(crsp2, "date")
+
     # keep December market cap
-    crsp2["year"] = crsp2["date"].dt.year
-    crsp2["month"] = crsp2["date"].dt.month
     decme = crsp2[crsp2["month"] == 12]
     decme = decme[["permno", "date", "me", "year"]].rename(
         columns={"me": "dec_me"}
     )
 
     ### July to June dates
-    crsp2["ffdate"] = crsp2["date"] + MonthEnd(-6)
-    crsp2["ffyear"] = crsp2["ffdate"].dt.year
-    crsp2["ffmonth"] = crsp2["ffdate"].dt.month
     crsp2["1+retx"] = 1 + crsp2["retx"]
-    crsp2 = crsp2.sort_values(by=["permno", "month"])
+    crsp2 = crsp2.sort_values(by=["permno", "mdate"])
+    panel = PanelIndex.from_frame(crsp2, "permno", "mdate")
 
     # cumret by stock
-    crsp2["cumretx"] = crsp2.groupby(["permno", "ffyear"])["1+retx"].cumprod()
+    ffyear_offsets = offsets_from_sorted_keys(crsp2["permno"].values, crsp2["ffyear"].values)
+    crsp2["cumretx"] = segment_cumprod(crsp2["1+retx"].values, ffyear_offsets)
 
     # lag cumret
-    crsp2["L_cumretx"] = crsp2.groupby(["permno"])["cumretx"].shift(1)
+    crsp2["L_cumretx"] = segment_shift(crsp2["cumretx"].values, panel.id_offsets)
 
     # lag market cap
-    crsp2["L_me"] = crsp2.groupby(["permno"])["me"].shift(1)
+    crsp2["L_me"] = segment_shift(crsp2["me"].values, panel.id_offsets)
 
     # if first permno then use me/(1+retx) to replace the missing value
-    crsp2["count"] = crsp2.groupby(["permno"]).cumcount()
+    crsp2["count"] = panel.cumcount()
     crsp2["L_me"] = np.where(
         crsp2["count"] == 0, crsp2["me"] / crsp2["1+retx"], crsp2["L_me"]
     )
@@ -110,17 +117,17 @@ def use_dec_market_equity(crsp2):
     return crsp3, crsp_jun
 
 def merge_CRSP_and_Compustat(crsp_jun, comp, ccm, crsp3):
-    comp['month_num'] = comp['datadate'].dt.month
-    comp['year'] = comp['datadate'].dt.year
-    ccm['month_num'] = ccm['date'].dt.month
-    ccm['year'] = ccm['date'].dt.year
+    # join on the integer month index rather than on datetime year/month pairs
+    comp['mdate'] = month_index(comp['datadate'])
+    comp['year'] = comp['mdate'] // 12
+    ccm['mdate'] = month_index(ccm['date'])
 
     ccm1 = pd.merge(
-        comp, ccm, how="inner", on=["gvkey", "year", "month_num"]
+        comp, ccm, how="inner", on=["gvkey", "mdate"]
     )
     ccm1["yearend"] = ccm1["datadate"] + YearEnd(0)
    
-    ccm2 = ccm1[["gvkey", "permno", "datadate", "yearend", "date", "retx", "me", "be", "op", "inv", "count", "year"]]
+    ccm2 = ccm1[["gvkey", "permno", "datadate", "yearend", "date", "exchcd", "retx", "me", "be", "op", "inv", "count", "year"]]
 
     op_df = ccm2.groupby(['year', 'permno'])['op'].sum().reset_index().rename(columns={'op': 'year_op'})
     ccm2 = pd.merge(ccm2, op_df, on=['year', 'permno'], how='left')
@@ -130,38 +137,27 @@ def merge_CRSP_and_Compustat(crsp_jun, comp, ccm, crsp3):
 
     # link comp and crsp
     ccm_jun = pd.merge(crsp_jun, ccm2, how="inner", on=["permno", "date"])
-    ccm_jun["beme"] = ccm_jun["be"] * 1000 / ccm_jun["dec_me"]
+    # CRSP `me` and Compustat `be` are both in $ millions
+    ccm_jun["beme"] = ccm_jun["be"] / ccm_jun["dec_me"]
 
     return ccm2, ccm_jun
 
-def assign_portfolio(data, sorting_variable, n_portfolios):
-    """Assign portfolio for a given sorting variable."""
-    
-    breakpoints = (data
-      .get(sorting_variable)
-      .quantile(np.linspace(0, 1, num=n_portfolios+1), 
-                interpolation="linear")
-      .drop_duplicates()
-    )
-    breakpoints.iloc[0] = -np.Inf
-    breakpoints.iloc[breakpoints.size-1] = np.Inf
-    
-    assigned_portfolios = pd.cut(
-      data[sorting_variable],
-      bins=breakpoints,
-      labels=range(1, breakpoints.size),
-      include_lowest=True,
-      right=False
-    )
-    
-    return assigned_portfolios
+# 5x5 independent sort on OP and INV quintiles, formed every year
+OP_INV_DIMENSIONS = [
+    SortDimension('year_op', QUINTILE_PERCENTILES, labels=[f'OP{i}' for i in range(1, 6)], merge_ties=True),
+    SortDimension('year_inv', QUINTILE_PERCENTILES, labels=[f'INV{i}' for i in range(1, 6)], merge_ties=True),
+]
 
 def name_ports(ccm2):
-    ccm2['op_num'] = assign_portfolio(ccm2, 'year_op', 5)
-    ccm2['inv_num'] = assign_portfolio(ccm2, 'year_inv', 5)
-
-    ccm2['opport'] = ccm2['op_num'].replace({1: 'OP1', 2: 'OP2', 3: 'OP3', 4: 'OP4', 5: 'OP5'})
-    ccm2['invport'] = ccm2['inv_num'].replace({1: 'INV1', 2: 'INV2', 3: 'INV3', 4: 'INV4', 5: 'INV5'})
+    codes = sort_codes(ccm2, OP_INV_DIMENSIONS, date_col='year')
+    for j, (num_col, port_col) in enumerate([('op_num', 'opport'), ('inv_num', 'invport')]):
+        dimension = OP_INV_DIMENSIONS[j]
+        ccm2[num_col] = pd.Categorical.from_codes(codes[:, j], categories=range(1, dimension.n_portfolios + 1))
+        ccm2[port_col] = pd.Categorical.from_codes(codes[:, j], categories=dimension.labels)
+    # the 25 OP x INV portfolios, e.g. "OP1 INV5"
+    ccm2['port'] = pd.Categorical.from_codes(
+        portfolio_codes(codes, OP_INV_DIMENSIONS), categories=portfolio_labels(OP_INV_DIMENSIONS)
+    )
 
     return ccm2
 
@@ -176,55 +172,134 @@ def wavg(group, avg_name, weight_name):
     except ZeroDivisionError:
         return np.nan
 
-def create_op_inv_portfolios(ccm4):
+def create_op_inv_portfolios(ccm4, weight_col='me'):
     """Create value-weighted Fama-French portfolios
     and provide count of firms in each portfolio.
+
+    VW and EW returns and counts of every (date, OP, INV) cell come out of one
+    reduction (`portfolio_aggregation.portfolio_table`); EW returns and counts
+    only use stocks with a return.
     """
-    ccm4['weight'] = ccm4['me'] / ccm4.groupby(['date', 'opport', 'invport'])['me'].transform('sum')
-    ccm4['weighted_ret'] = ccm4['retx'] * ccm4['weight']
-    vwret_m = ccm4.groupby(['date', 'opport', 'invport'])['weighted_ret'].sum().reset_index(name='value_weighted_ret')
-    vwret_m = vwret_m.pivot(index="date", columns=["opport",'invport'])
+    table = portfolio_table(ccm4, ['date', 'opport', 'invport'], ret_col='retx', weight_col=weight_col)
+    return op_inv_return_frames(table)
 
-    ccm4['equal_weight'] = 1 / ccm4.groupby(['date', 'opport', 'invport'])['permno'].transform('count')
-    ccm4['equal_weighted_ret'] = ccm4['retx'] * ccm4['equal_weight']
-    ewret_m = ccm4.groupby(['date', 'opport', 'invport'])['equal_weighted_ret'].sum().reset_index(name='equal_weighted_ret')
-    ewret_m = ewret_m.pivot(index="date", columns=["opport",'invport'])
-  
 
+def op_inv_return_frames(table):
+    """VW returns, EW returns and firm counts of a (date, OP, INV) `portfolio_table`, one column per portfolio."""
+    keys = table[['date', 'opport', 'invport']]
+    vwret_m = keys.assign(value_weighted_ret=table['vwret']).pivot(index="date", columns=["opport",'invport'])
+    ewret_m = keys.assign(equal_weighted_ret=table['ewret']).pivot(index="date", columns=["opport",'invport'])
     # firm count
-    num_firms = (
-        ccm4.groupby(["date", "opport", "invport"])["retx"]
-        .count()
-        .reset_index()
-        .rename(columns={"retx": "n_firms"})
+    num_firms = keys.assign(n_firms=table['n_firms']).pivot(index="date", columns=["opport",'invport'], values="n_firms")
+
+    return vwret_m, ewret_m, num_firms
+
+
+
+def create_op_inv_characteristics(holdings, weight_col='weight'):
+    """
+    Returns, counts and characteristics of every (date, OP, INV) portfolio
+    in one reduction, weighted like the returns.
+
+    `holdings` are the monthly holdings of `expand_holdings` with the BE, OP
+    and INV of the formation year and the ME of the month (`me`). CRSP `me`
+    and Compustat `be` are both in $ millions, so `avg_size` is in $ millions
+    and BE/ME is `be / me`, transformed within every month like the sorting
+    characteristics (`config.CHARACTERISTIC_TRANSFORM`).
+    """
+    holdings['beme'] = holdings['be'] / holdings['me']
+    transform_characteristics(holdings, ['beme'], date_col='date')
+    return portfolio_table(
+        holdings, ['date', 'opport', 'invport'], ret_col='retx', weight_col=weight_col, size_col='me',
+        vw_cols=('beme', 'op', 'inv'), ratio_cols={'sum_be_sum_me': ('be', 'me')},
     )
 
-    num_firms = num_firms.pivot(index="date", columns=["opport",'invport'], values="n_firms")
 
+# Schedules of the rebalanced OP x INV sorts written next to the annual one
+REBALANCE_SCHEDULES = [QUARTERLY, MONTHLY]
 
-    return vwret_m, ewret_m, num_firms
 
+def create_rebalanced_op_inv_portfolios(ccm3, crsp3, schedules=REBALANCE_SCHEDULES, cache_dir=CACHE_DIR):
+    """
+    The 5x5 OP x INV portfolios re-formed on other schedules (see `rebalancing.py`).
+
+    At every formation date the stocks are sorted on the OP and INV of the
+    June formation in force (`rebalancing.accounting_in_force`), with the
+    breakpoints of that date's cross-section, and held until the next
+    formation weighted by last month's ME.
+
+    Returns:
+    dict: Schedule name -> (vwret_m, ewret_m, num_firms) as from `create_op_inv_portfolios`.
+    """
+    formations = ccm3.drop_duplicates(['permno', 'formation_year'], keep='last')
+    chars = crsp3[['permno', 'mdate', 'exchcd']].copy()
+    chars[['year_op', 'year_inv']] = accounting_in_force(formations, crsp3, ['year_op', 'year_inv'])
+    holdings = rebalanced_portfolios(
+        chars, crsp3, OP_INV_DIMENSIONS, schedules, ret_col='retx', cache_dir=cache_dir
+    )
+
+    portfolios = {}
+    for name, held in holdings.items():
+        held = held.rename(columns={'year_op': 'opport', 'year_inv': 'invport'})
+        held['date'] = month_index_to_date(held['mdate'])
+        portfolios[name] = create_op_inv_portfolios(held, weight_col='weight')
+    return portfolios
 
 
 if __name__ == "__main__":        
     ###########################
     ## Load Data
     ###########################
+    # the loaders need the WRDS stack; the functions above do not
+    from load_CRSP_Compustat import load_compustat, load_CRSP_stock, load_CRSP_Comp_Link_Table
 
     comp = load_compustat(data_dir=DATA_DIR)
     crsp = load_CRSP_stock(data_dir=DATA_DIR)
     ccm = load_CRSP_Comp_Link_Table(data_dir=DATA_DIR)
 
-    crsp2 = calculate_market_equity(ccm)
-    crsp3, crsp_jun = use_dec_market_equity(crsp2)
+    if config.PORTFOLIO_BACKEND == "polars":
+        import polars_backend
+
+        crsp2 = polars_backend.calculate_market_equity(ccm, date_col="date", price_col=None)
+        crsp3, crsp_jun = polars_backend.use_dec_market_equity(crsp2, flavor="siz")
+        crsp3, crsp_jun = polars_backend.collect_to_pandas(crsp3, crsp_jun)
+    else:
+        crsp2 = calculate_market_equity(ccm)
+        crsp3, crsp_jun = use_dec_market_equity(crsp2)
     ccm2, ccm_jun = merge_CRSP_and_Compustat(crsp_jun, comp, ccm, crsp3)
     
     ############################
     ## Form OP INV Factors
     ############################
+    # the sorts and the VW averages use the transformed OP and INV of the year
+    transform_characteristics(ccm2, ['year_op', 'year_inv', 'op', 'inv'], date_col='year')
     ccm3 = name_ports(ccm2)
 
-    vwret_m, ewret_m, num_firms = create_op_inv_portfolios(ccm3) # create op_inv_portfolios
+    # Fiscal year t-1 accounting data sort the stocks in June of year t; the
+    # portfolios are held from July t to June t+1 and weighted by the June ME
+    # drifted with the cumulative return (`wt`)
+    ccm3['formation_year'] = ccm3['year'] + 1
+    holdings = expand_holdings(ccm3, crsp3, ['opport', 'invport', 'be', 'op', 'inv'], year_col='formation_year',
+                               date_col='date', ret_col='retx', weight_col='wt', value_cols=('me',))
+
+    # returns and characteristics of the same holdings, with the same weights
+    characteristics = create_op_inv_characteristics(holdings, weight_col='weight')
+    if config.PORTFOLIO_BACKEND == "polars":
+        vwret_m, ewret_m, num_firms = polars_backend.create_op_inv_portfolios(holdings, weight_col='weight')
+    else:
+        vwret_m, ewret_m, num_firms = op_inv_return_frames(characteristics)
+    characteristic_sheets = {
+        'Avg Firm Size': 'avg_size',
+        'Sum BE to Sum ME': 'sum_be_sum_me',
+        'VW Avg BE to ME': 'vw_beme',
+        'VW Avg OP': 'vw_op',
+        'VW Avg INV': 'vw_inv',
+    }
+
+    # Turnover of the 25 portfolios from one June formation to the next
+    formations = ccm3.drop_duplicates(['permno', 'formation_year'], keep='last')
+    turnover = portfolio_turnover(formations, 'port', period_col='formation_year', weight_col='me')
+    transitions = transition_matrix(formations, 'port', period_col='formation_year')
 
     filename = DATA_DIR/ 'manual' / '5x5_OP_INV_portfolios.xlsx'
 
@@ -232,3 +307,21 @@ if __name__ == "__main__":
         vwret_m.to_excel(writer, sheet_name='VW Avg Mo. Ret', index=True)
         ewret_m.to_excel(writer, sheet_name='EW Avg Mo. Ret', index=True)
         num_firms.to_excel(writer, sheet_name='Num Firms', index=True)
+        for sheet_name, column in characteristic_sheets.items():
+            characteristics.pivot(index='date', columns=['opport', 'invport'], values=column).to_excel(
+                writer, sheet_name=sheet_name, index=True
+            )
+        turnover.pivot(index='period', columns='portfolio', values='turnover').to_excel(
+            writer, sheet_name='Turnover', index=True
+        )
+        turnover.pivot(index='period', columns='portfolio', values='weight_turnover').to_excel(
+            writer, sheet_name='VW Turnover', index=True
+        )
+        transitions.to_excel(writer, sheet_name='Transitions', index=True)
+
+    # the same sort re-formed quarterly and monthly
+    for name, (vwret, ewret, n_firms) in create_rebalanced_op_inv_portfolios(ccm3, crsp3).items():
+        with pd.ExcelWriter(DATA_DIR / 'manual' / f'5x5_OP_INV_portfolios_{name}.xlsx', engine='xlsxwriter') as writer:
+            vwret.to_excel(writer, sheet_name='VW Avg Mo. Ret', index=True)
+            ewret.to_excel(writer, sheet_name='EW Avg Mo. Ret', index=True)
+            n_firms.to_excel(writer, sheet_name='Num Firms', index=True)
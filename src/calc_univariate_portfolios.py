@@ -5,6 +5,25 @@ from pathlib import Path
 import config
 from load_CRSP_Compustat_v2 import *
 from load_CRSP_stock_v2 import *
+from panel_index import PanelIndex
+from portfolio_aggregation import portfolio_table
+from sparse_portfolios import sparse_portfolio_stats
+from portfolio_holdings import expand_holdings
+from characteristics import PRIOR_RETURN_WINDOWS, add_dividend_yield, add_prior_returns
+from turnover import portfolio_turnover, transition_matrix
+from segment_kernels import (
+    broadcast_segments,
+    group_offsets,
+    offsets_from_sorted_keys,
+    segment_cumprod,
+    segment_prod,
+    segment_shift,
+)
+from month_index import add_month_index_columns, month_index, month_index_to_date, june_formation_month, year_of
+from cross_section import transform_characteristics
+from breakpoints import DECILE_PERCENTILES, QUINTILE_PERCENTILES, TERCILE_PERCENTILES
+from portfolio_sorts import SortDimension, batch_sort_codes
+from rebalancing import MONTHLY, QUARTERLY, accounting_in_force, formation_dates, hold_formations, rebalanced_portfolios
 
 OUTPUT_DIR = Path(config.OUTPUT_DIR)
 DATA_DIR = Path(config.DATA_DIR)
@@ -41,12 +60,12 @@ def calculate_market_equity(crsp):
     to the CRSP permno that has the largest ME.
     """
     crsp['me'] = crsp['mthprc'] * crsp['shrout']
-    agg_me = crsp.groupby(['jdate', 'permco'])['me'].sum().reset_index()
-    max_me = crsp.groupby(['jdate', 'permco'])['me'].max().reset_index()
-    crsp = crsp.merge(max_me, how='inner', on=['jdate', 'permco', 'me'])
+    agg_me = crsp.groupby(['mdate', 'permco'])['me'].sum().reset_index()
+    max_me = crsp.groupby(['mdate', 'permco'])['me'].max().reset_index()
+    crsp = crsp.merge(max_me, how='inner', on=['mdate', 'permco', 'me'])
     crsp = crsp.drop('me', axis=1)
-    crsp = crsp.merge(agg_me, how='inner', on=['jdate', 'permco'])
-    crsp = crsp.sort_values(by=['permno', 'jdate']).drop_duplicates()
+    crsp = crsp.merge(agg_me, how='inner', on=['mdate', 'permco'])
+    crsp = crsp.sort_values(by=['permno', 'mdate']).drop_duplicates()
     return crsp
 
 
@@ -58,8 +77,8 @@ def use_dec_market_equity(crsp2):
     the portfolio.'
 
     """
-    crsp2["year"] = crsp2["jdate"].dt.year
-    crsp2["month"] = crsp2["jdate"].dt.month
+    # integer month index, calendar and July-to-June year/month
+    crsp2 = add_month_index_columns(crsp2, "jdate")
     decme = crsp2[crsp2["month"] == 12].copy()
     decme["year"] = decme["year"] - 1 #Shift ME to align with December of t-1
     decme = decme[["permno", "mthcaldt", "jdate", "me", "year"]].rename(
@@ -67,23 +86,22 @@ def use_dec_market_equity(crsp2):
     )
 
     ### July to June dates
-    crsp2["ffdate"] = crsp2["jdate"] + MonthEnd(-6)
-    crsp2["ffyear"] = crsp2["ffdate"].dt.year
-    crsp2["ffmonth"] = crsp2["ffdate"].dt.month
     crsp2["1+retx"] = 1 + crsp2["mthretx"]
     crsp2 = crsp2.sort_values(by=["permno", "mthcaldt"])
+    panel = PanelIndex.from_frame(crsp2, "permno", "mdate")
 
     # cumret by stock
-    crsp2["cumretx"] = crsp2.groupby(["permno", "ffyear"])["1+retx"].cumprod()
+    ffyear_offsets = offsets_from_sorted_keys(crsp2["permno"].values, crsp2["ffyear"].values)
+    crsp2["cumretx"] = segment_cumprod(crsp2["1+retx"].values, ffyear_offsets)
 
     # lag cumret
-    crsp2["L_cumretx"] = crsp2.groupby(["permno"])["cumretx"].shift(1)
+    crsp2["L_cumretx"] = segment_shift(crsp2["cumretx"].values, panel.id_offsets)
 
     # lag market cap
-    crsp2["L_me"] = crsp2.groupby(["permno"])["me"].shift(1)
+    crsp2["L_me"] = segment_shift(crsp2["me"].values, panel.id_offsets)
 
     # if first permno then use me/(1+retx) to replace the missing value
-    crsp2["count"] = crsp2.groupby(["permno"]).cumcount()
+    crsp2["count"] = panel.cumcount()
     crsp2["L_me"] = np.where(
         crsp2["count"] == 0, crsp2["me"] / crsp2["1+retx"], crsp2["L_me"]
     )
@@ -111,6 +129,7 @@ def use_dec_market_equity(crsp2):
             "permno",
             "mthcaldt",
             "jdate",
+            "mdate",
             "sharetype",
             "securitytype",
             "securitysubtype",
@@ -136,12 +155,16 @@ def merge_CRSP_and_Compustat(crsp_jun, comp, ccm):
     ccm["linkenddt"] = ccm["linkenddt"].fillna(pd.to_datetime("today"))
 
     ccm1 = pd.merge(comp, ccm, how="left", on=["gvkey"])
-    ccm1["yearend"] = ccm1["datadate"] + YearEnd(0)
-    ccm1["jdate"] = ccm1["yearend"] + MonthEnd(6)
+    # June of the year after the fiscal year end, as an integer month index
+    ccm1["mdate"] = june_formation_month(month_index(ccm1["datadate"]))
 
-    ccm2 = ccm1[(ccm1["jdate"] >= ccm1["linkdt"]) & (ccm1["jdate"] <= ccm1["linkenddt"])]
+    # link must be active at the end of the formation month
+    linked = ccm1.dropna(subset=["linkdt"])
+    link_start = month_index(linked["linkdt"])
+    link_end = month_index(linked["linkenddt"] + pd.Timedelta(days=1))
+    ccm2 = linked[(linked["mdate"] >= link_start) & (linked["mdate"] < link_end)]
 
-    ccm_jun = pd.merge(crsp_jun, ccm2, how="inner", on=["permno", "jdate"])
+    ccm_jun = pd.merge(crsp_jun, ccm2, how="inner", on=["permno", "mdate"])
     ccm_jun["ep"] = ccm_jun["ni"] * 1000 / ccm_jun["dec_me"]
     # Add calculations for cf and cfp
     ccm_jun['cf'] = ccm_jun['ebit'] + ccm_jun['dp'].fillna(0) + ccm_jun['txditc'].fillna(0)
@@ -158,165 +181,253 @@ crsp[['permco', 'permno']] = crsp[['permco', 'permno']].astype(int)
 crsp['jdate'] = crsp['mthcaldt'] + MonthEnd(0)
 crsp['mthretx'] = pd.to_numeric(crsp['mthretx'], errors='coerce')
 crsp['mthret'] = pd.to_numeric(crsp['mthret'], errors='coerce')
-crsp['year'] = crsp['mthcaldt'].dt.year
+crsp['mdate'] = month_index(crsp['mthcaldt'])
+crsp['year'] = crsp['mdate'] // 12
 
-annual_ret_ex_div = crsp.groupby(['permno', 'year'])['mthretx'].apply(lambda x: (1 + x).prod() - 1).reset_index(name='annual_ret_ex_div')
-annual_ret_inc_div = crsp.groupby(['permno', 'year'])['mthret'].apply(lambda x: (1 + x).prod() - 1).reset_index(name='annual_ret_inc_div')
+# compound monthly returns within each permno-year
+order, offsets = group_offsets(crsp['permno'].values, crsp['year'].values)
+crsp['annual_ret_ex_div'] = broadcast_segments(segment_prod(1 + crsp['mthretx'].values[order], offsets) - 1, offsets, order)
+crsp['annual_ret_inc_div'] = broadcast_segments(segment_prod(1 + crsp['mthret'].values[order], offsets) - 1, offsets, order)
 
-crsp = pd.merge(crsp, annual_ret_ex_div, on=['permno', 'year'], how='left')
-crsp = pd.merge(crsp, annual_ret_inc_div, on=['permno', 'year'], how='left')
 
+if config.PORTFOLIO_BACKEND == "polars":
+    import polars_backend
 
-crsp = subset_CRSP_to_common_stock_and_exchanges(crsp)
-crsp2 = calculate_market_equity(crsp)
-crsp3, crsp_jun = use_dec_market_equity(crsp2)
-ccm_jun, ccm1 = merge_CRSP_and_Compustat(crsp_jun, comp, ccm)
-
-
-def categorize_metric_exclusive(row, metric, bottom_30_bp, top_30_bp, quintiles_bp, deciles_bp):
-    """
-    Determine categories for a given metric value within a row.
-    This is a placeholder function. Replace its internals based on actual categorization logic.
-    """
-    value = row[metric]
-    categories = []
-
-    if value < 0:
-        categories.append('<=0')
-    elif value <= bottom_30_bp:
-        categories.append('Lo 30')
-    elif value <= top_30_bp:
-        categories.append('Med 40')
-    else:
-        categories.append('Hi 30')
-
-    quintiles = np.searchsorted(quintiles_bp, value, side='right')
-    categories.append(f'Qnt {quintiles+1}')
-
-    deciles = np.searchsorted(deciles_bp, value, side='right')
-    categories.append(f'Dec {deciles+1}')
+    # the four stages are planned as one lazy query and collected together
+    crsp = polars_backend.subset_CRSP_to_common_stock_and_exchanges(crsp)
+    crsp2 = polars_backend.calculate_market_equity(crsp)
+    crsp3, crsp_jun = polars_backend.use_dec_market_equity(crsp2, flavor="ciz")
+    ccm_jun, ccm1 = polars_backend.merge_CRSP_and_Compustat(crsp_jun, comp, ccm)
+    crsp3, crsp_jun, ccm_jun, ccm1 = polars_backend.collect_to_pandas(
+        crsp3, crsp_jun, ccm_jun, ccm1
+    )
+else:
+    crsp = subset_CRSP_to_common_stock_and_exchanges(crsp)
+    crsp2 = calculate_market_equity(crsp)
+    crsp3, crsp_jun = use_dec_market_equity(crsp2)
+    ccm_jun, ccm1 = merge_CRSP_and_Compustat(crsp_jun, comp, ccm)
+
+# D/P (`dy`; `dp` is Compustat depreciation): dividends from July t-1 to
+# June t over ME of June t; stocks that paid no dividends are in no D/P portfolio
+crsp3 = add_dividend_yield(crsp3, ret_col='mthret', retx_col='mthretx')
+ccm_jun = pd.merge(ccm_jun, crsp3[['permno', 'mdate', 'dy']], how='left', on=['permno', 'mdate'])
+ccm_jun['dy'] = ccm_jun['dy'].where(ccm_jun['dy'] > 0)
+
+
+# (suffix, percentiles, labels, side) of the sorts reported for every metric;
+# values on a 30/70 breakpoint go to the lower portfolio, on a quintile or
+# decile breakpoint to the upper one
+METRIC_SORTS = [
+    ('30_40_30', TERCILE_PERCENTILES, ['Lo 30', 'Med 40', 'Hi 30'], 'left'),
+    ('quintile', QUINTILE_PERCENTILES, [f'Qnt {i}' for i in range(1, 6)], 'right'),
+    ('decile', DECILE_PERCENTILES, [f'Dec {i}' for i in range(1, 11)], 'right'),
+]
+NEGATIVE_LABEL = 'Negative Values'
+
+
+def metric_dimensions(metric, category_name):
+    """The sorts of `METRIC_SORTS` on the non-negative values of `metric`."""
+    return [
+        SortDimension(metric, percentiles, labels, side=side, nonnegative=True,
+                      name=f'{category_name}_{suffix}')
+        for suffix, percentiles, labels, side in METRIC_SORTS
+    ]
 
-    return categories
 
-def categorize_stocks_by_metric(dataframe, metric, category_name):
+def categorize_stocks_by_metrics(dataframe, metrics, universe=config.BREAKPOINT_UNIVERSE, date_col='year'):
     """
-    Categorize stocks by a specified metric and directly append the categories to the dataframe.
+    Categorize stocks by several metrics and directly append the categories to the dataframe.
+
+    `metrics` maps each metric to its category name (e.g. {'ep': 'ep_categories'}).
+    Breakpoints are the percentiles of the non-negative values of the stocks
+    in `universe` ("nyse" or "all") at every formation date `date_col`. All
+    metrics are sorted in one batch over the same cross-sections, each metric once per date
+    (see `portfolio_sorts.batch_sort_codes`). Adds one categorical column
+    per sort (`{category_name}_30_40_30`, `_quintile`, `_decile`; negative
+    values are 'Negative Values' in the 30/40/30 column) and the combined
+    label `category_name` (e.g. 'Lo 30, Qnt 1, Dec 2').
     """
-    # Calculate breakpoints for the NYSE stocks each year to define categories
-    for year, group in dataframe.groupby('year'):
-        non_negative = group[group[metric] >= 0]
-        negative = group[group[metric] < 0]
-
-        sorted_values = non_negative[metric].sort_values()
-
-        bottom_30_bp = sorted_values.quantile(q=0.3)
-        top_30_bp = sorted_values.quantile(q=0.7)
-        quintiles_bp = sorted_values.quantile(q=np.arange(0.2, 1.01, 0.2))
-        deciles_bp = sorted_values.quantile(q=np.arange(0.1, 1.01, 0.1))
-
-        # Assign categories based on calculated breakpoints
-        dataframe.loc[non_negative.index, category_name] = non_negative.apply(
-            lambda row: categorize_metric_exclusive(row, metric, bottom_30_bp, top_30_bp, quintiles_bp.values, deciles_bp.values), axis=1)
-        dataframe.loc[negative.index, category_name] = [['Negative Values']] * len(negative)
-
+    dimensions = [d for metric, name in metrics.items() for d in metric_dimensions(metric, name)]
+    codes = batch_sort_codes(dataframe, dimensions, date_col=date_col, universe=universe)
+
+    for metric, category_name in metrics.items():
+        negative = (dataframe[metric] < 0).to_numpy()
+        columns = []
+        for dimension in metric_dimensions(metric, category_name):
+            column = dimension.name
+            labels = dimension.labels
+            if column.endswith('_30_40_30'):
+                dimension_codes = np.where(negative, len(labels), codes[column])
+                labels = [*labels, NEGATIVE_LABEL]
+            else:
+                dimension_codes = codes[column].to_numpy()
+            dataframe[column] = pd.Categorical.from_codes(dimension_codes, categories=labels)
+            columns.append(column)
+        dataframe[category_name] = combine_categories(dataframe, columns)
     return dataframe
 
 
-categorize_stocks_by_metric(ccm_jun, 'ep', 'ep_categories')
-categorize_stocks_by_metric(ccm_jun, 'cfp', 'cfp_categories')
+def categorize_stocks_by_metric(dataframe, metric, category_name, universe=config.BREAKPOINT_UNIVERSE):
+    """Categorize stocks by one metric (see `categorize_stocks_by_metrics`)."""
+    return categorize_stocks_by_metrics(dataframe, {metric: category_name}, universe=universe)
 
-def update_portfolio_assignments(df, category_field, portfolio_prefix):
-    """
-    Update the dataframe with portfolio assignments based on the categories.
-
-    Args:
-    - df: DataFrame to be updated.
-    - category_field: Field name containing the categories.
-    - portfolio_prefix: Prefix for the portfolio names.
-    """
-    # Explode the DataFrame to work with one category per row
-    df_exploded = df.explode(category_field)
-
-    # Initialize portfolio columns to NaN
-    unique_categories = df_exploded[category_field].dropna().unique()
-    for category in unique_categories:
-        portfolio_name = f"{portfolio_prefix}_{category}"
-        df[portfolio_name] = np.nan
-
-    for index, row in df_exploded.dropna(subset=[category_field]).iterrows():
-        category = row[category_field]
-        portfolio_name = f"{portfolio_prefix}_{category}"
-        df.at[index, portfolio_name] = row['permno']
-
-    return df
-
-
-ccm_jun = update_portfolio_assignments(ccm_jun, 'ep_categories', 'ep')
-ccm_jun = update_portfolio_assignments(ccm_jun, 'cfp_categories', 'cfp')
-
-def calculate_portfolio_returns(df, portfolio_prefix):
-    portfolio_returns = {}
-    for column in df.columns:
-        if column.startswith(portfolio_prefix):
-            if column in df and pd.api.types.is_numeric_dtype(df[column]):
-                # Calculate weighted average return for each group
-                weighted_avg = df.groupby('jdate').apply(
-                    lambda x: np.average(x['mthret'].fillna(0), weights=x[column].fillna(0))
-                    if not x[column].isnull().all() else np.nan
-                )
-                portfolio_returns[column] = weighted_avg
-            else:
-                print(f"Skipping {column} due to non-numeric or missing data")
-    
-    return pd.DataFrame(portfolio_returns)
 
+def combine_categories(df, columns):
+    """Join the labels of several categorical columns (skipping missing ones) into one categorical."""
+    codes = np.stack([df[c].cat.codes.to_numpy().astype(np.int64) + 1 for c in columns])
+    dims = [len(df[c].cat.categories) + 1 for c in columns]
+    labelled = codes.any(axis=0)
+    keys = np.full(len(df), -1, dtype=np.int64)
+    keys[labelled], uniques = pd.factorize(np.ravel_multi_index(codes[:, labelled], dims), sort=True)
+    categories = [
+        ', '.join(df[c].cat.categories[code - 1] for c, code in zip(columns, parts) if code > 0)
+        for parts in zip(*np.unravel_index(uniques, dims))
+    ]
+    return pd.Categorical.from_codes(keys, categories=categories)
 
-portfolio_returns_ep = calculate_portfolio_returns(ccm_jun, 'ep')
-portfolio_returns_cfp = calculate_portfolio_returns(ccm_jun, 'cfp')
 
-def calculate_portfolio_monthly_returns(df, metric_categories):
-    # Calculate value-weighted returns
-    df['weight'] = df['me'] / df.groupby(['jdate', metric_categories])['me'].transform('sum')
-    df['weighted_ret'] = df['mthret'] * df['weight']
-    value_weighted = df.groupby(['jdate', metric_categories])['weighted_ret'].sum().reset_index(name='value_weighted_ret')
+categorize_stocks_by_metrics(ccm_jun, {'ep': 'ep_categories', 'cfp': 'cfp_categories', 'dy': 'dy_categories'})
+# The VW averages use the transformed metrics (`config.CHARACTERISTIC_TRANSFORM`).
+# They are transformed after the sorts, whose 'Negative Values' bucket needs the
+# sign of the raw values.
+transform_characteristics(ccm_jun, ['ep', 'cfp', 'dy'], date_col='year')
 
-    # Calculate equal-weighted returns
-    df['equal_weight'] = 1 / df.groupby(['jdate', metric_categories])['permno'].transform('count')
-    df['equal_weighted_ret'] = df['mthret'] * df['equal_weight']
-    equal_weighted = df.groupby(['jdate', metric_categories])['equal_weighted_ret'].sum().reset_index(name='equal_weighted_ret')
+def calculate_portfolio_monthly_returns(df, metric_categories, weight_col='me', table=None):
+    # VW and EW returns of every (month, portfolio) in one reduction, or from
+    # a table of `calculate_portfolio_characteristics`
+    if table is None:
+        table = portfolio_table(df, ['jdate', metric_categories], ret_col='mthret', weight_col=weight_col)
+    keys = table[['jdate', metric_categories]]
+    value_weighted = keys.assign(value_weighted_ret=table['vwret'])
+    equal_weighted = keys.assign(equal_weighted_ret=table['ewret'])
 
     return value_weighted, equal_weighted
 
 def calculate_portfolio_annual_returns(df, metric_categories):
-    df['annual_ret'] = df.groupby(['permno', 'year'])['mthret'].transform(lambda x: (1 + x).prod() - 1)
-    # Value-weighted
-    df['annual_weight'] = df['me'] / df.groupby(['year', metric_categories])['me'].transform('sum')
-    df['annual_weighted_ret'] = df['annual_ret'] * df['annual_weight']
-    value_weighted_annual = df.groupby(['year', metric_categories])['annual_weighted_ret'].sum().reset_index(name='value_weighted_annual_ret')
-
-    # Equal-weighted
-    equal_weighted_annual = df.groupby(['year', metric_categories])['annual_ret'].mean().reset_index(name='equal_weighted_annual_ret')
+    order, offsets = group_offsets(df['permno'].values, df['year'].values)
+    annual_ret = segment_prod(1 + df['mthret'].values[order], offsets) - 1
+    df['annual_ret'] = broadcast_segments(annual_ret, offsets, order)
+    # value- and equal-weighted in one reduction
+    table = portfolio_table(df, ['year', metric_categories], ret_col='annual_ret', weight_col='me')
+    keys = table[['year', metric_categories]]
+    value_weighted_annual = keys.assign(value_weighted_annual_ret=table['vwret'])
+    equal_weighted_annual = keys.assign(equal_weighted_annual_ret=table['ewret'])
 
     return value_weighted_annual, equal_weighted_annual
 
 
-ccm_jun['ep_categories'] = ccm_jun['ep_categories'].apply(lambda x: ', '.join(x) if isinstance(x, list) else x)
-ccm_jun['cfp_categories'] = ccm_jun['cfp_categories'].apply(lambda x: ', '.join(x) if isinstance(x, list) else x)
+def calculate_portfolio_characteristics(df, category_metrics, weight_col='weight'):
+    """
+    VW and EW returns, firm counts, average size and VW average of the
+    sorting metric of every (month, portfolio), for all the categorizations
+    at once.
+
+    The memberships of every categorization in `category_metrics` (category
+    field -> sorting metric, e.g. {'ep_categories': 'ep'}) form one sparse
+    membership matrix over the holdings, and all portfolios of all months
+    are one set of sparse products (see `sparse_portfolios.py`), weighted
+    like the returns.
+
+    Returns:
+    - dict: category field -> DataFrame with `jdate`, the category field,
+      `vwret`, `ewret`, `n_firms`, `avg_size`, `vw_<metric>` and `n_rows`,
+      one row per (month, portfolio) with members.
+    """
+    fields = list(category_metrics)
+    membership = np.column_stack([df[field].cat.codes.to_numpy() for field in fields])
+    labels = {field: list(df[field].cat.categories) for field in fields}
+    dates, _, stats = sparse_portfolio_stats(
+        df['jdate'], membership, labels, df['mthret'].to_numpy(), df[weight_col].to_numpy(),
+        size=df['me'].to_numpy(), vw={metric: df[metric].to_numpy() for metric in category_metrics.values()},
+    )
 
+    tables = {}
+    start = 0
+    for field, metric in category_metrics.items():
+        columns = slice(start, start + len(labels[field]))
+        start = columns.stop
+        held = stats['n_rows'][:, columns] > 0
+        date_codes, codes = np.nonzero(held)
+        table = pd.DataFrame(
+            data={'jdate': dates[date_codes], field: pd.Categorical.from_codes(codes, categories=labels[field])}
+        )
+        for name in ['vwret', 'ewret', 'n_firms', 'avg_size', f'vw_{metric}', 'n_rows']:
+            table[name] = stats[name][:, columns][held]
+        tables[field] = table
+    return tables
+
+def calculate_firm_size_and_count(characteristics, metric_categories):
+    average_firm_size = characteristics[['jdate', metric_categories, 'avg_size']].rename(columns={'avg_size': 'average_me'})
+    number_of_firms = characteristics[['jdate', metric_categories, 'n_rows']].rename(columns={'n_rows': 'num_firms'})
+    return average_firm_size, number_of_firms
 
-value_weighted_ep, equal_weighted_ep = calculate_portfolio_monthly_returns(ccm_jun, 'ep_categories')
-value_weighted_cfp, equal_weighted_cfp = calculate_portfolio_monthly_returns(ccm_jun, 'cfp_categories')
+# Portfolios formed in June of year t are held from July t to June t+1,
+# weighted by June ME drifted with the cumulative return (`wt`); the sorting
+# metrics of the formation and the ME of every month are carried along for
+# the characteristics
+ccm_jun['formation_year'] = year_of(ccm_jun['mdate'])
+holdings = expand_holdings(ccm_jun, crsp3, ['ep_categories', 'cfp_categories', 'dy_categories', 'ep', 'cfp', 'dy'],
+                           year_col='formation_year', date_col='jdate', ret_col='mthret', weight_col='wt',
+                           value_cols=('me',))
+
+characteristics = calculate_portfolio_characteristics(
+    holdings, {'ep_categories': 'ep', 'cfp_categories': 'cfp', 'dy_categories': 'dy'}
+)
+characteristics_ep = characteristics['ep_categories']
+characteristics_cfp = characteristics['cfp_categories']
+characteristics_dy = characteristics['dy_categories']
+
+if config.PORTFOLIO_BACKEND == "polars":
+    (
+        value_weighted_ep, equal_weighted_ep, value_weighted_cfp, equal_weighted_cfp, value_weighted_dy, equal_weighted_dy
+    ) = polars_backend.collect_to_pandas(
+        *polars_backend.calculate_portfolio_monthly_returns(holdings, 'ep_categories', weight_col='weight'),
+        *polars_backend.calculate_portfolio_monthly_returns(holdings, 'cfp_categories', weight_col='weight'),
+        *polars_backend.calculate_portfolio_monthly_returns(holdings, 'dy_categories', weight_col='weight'),
+    )
+else:
+    value_weighted_ep, equal_weighted_ep = calculate_portfolio_monthly_returns(holdings, 'ep_categories', table=characteristics_ep)
+    value_weighted_cfp, equal_weighted_cfp = calculate_portfolio_monthly_returns(holdings, 'cfp_categories', table=characteristics_cfp)
+    value_weighted_dy, equal_weighted_dy = calculate_portfolio_monthly_returns(holdings, 'dy_categories', table=characteristics_dy)
 
 value_weighted_annual_ep, equal_weighted_annual_ep = calculate_portfolio_annual_returns(ccm_jun, 'ep_categories')
 value_weighted_annual_cfp, equal_weighted_annual_cfp = calculate_portfolio_annual_returns(ccm_jun, 'cfp_categories')
+value_weighted_annual_dy, equal_weighted_annual_dy = calculate_portfolio_annual_returns(ccm_jun, 'dy_categories')
 
-def calculate_firm_size_and_count(df, metric_categories):
-    average_firm_size = df.groupby(['year', metric_categories])['me'].mean().reset_index(name='average_me')
-    number_of_firms = df.groupby(['year', metric_categories]).size().reset_index(name='num_firms').rename(columns={0: 'count'})
-    return average_firm_size, number_of_firms
+average_size_ep, firm_count_ep = calculate_firm_size_and_count(characteristics_ep, 'ep_categories')
+average_size_cfp, firm_count_cfp = calculate_firm_size_and_count(characteristics_cfp, 'cfp_categories')
+average_size_dy, firm_count_dy = calculate_firm_size_and_count(characteristics_dy, 'dy_categories')
+vw_ep = characteristics_ep[['jdate', 'ep_categories', 'vw_ep']]
+vw_cfp = characteristics_cfp[['jdate', 'cfp_categories', 'vw_cfp']]
+vw_dy = characteristics_dy[['jdate', 'dy_categories', 'vw_dy']]
 
-average_size_ep, firm_count_ep = calculate_firm_size_and_count(ccm_jun, 'ep_categories')
-average_size_cfp, firm_count_cfp = calculate_firm_size_and_count(ccm_jun, 'cfp_categories')
+def calculate_turnover(df, category_field):
+    """
+    Turnover of every portfolio of every sort of `category_field` from one
+    June formation to the next (see `turnover.portfolio_turnover`).
+
+    Returns:
+    - (pd.DataFrame, pd.DataFrame, pd.DataFrame): one-way and ME-weighted
+      turnover with one row per formation year and one column per portfolio
+      of the 30/40/30, quintile and decile sorts, and the transition
+      frequencies between the deciles.
+    """
+    formations = df.drop_duplicates(['permno', 'formation_year'], keep='last')
+    turnover, weight_turnover = [], []
+    for suffix, *_ in METRIC_SORTS:
+        column = f'{category_field}_{suffix}'
+        table = portfolio_turnover(formations, column, period_col='formation_year', weight_col='me')
+        labels = list(formations[column].cat.categories)
+        turnover.append(table.pivot(index='period', columns='portfolio', values='turnover').reindex(columns=labels))
+        weight_turnover.append(
+            table.pivot(index='period', columns='portfolio', values='weight_turnover').reindex(columns=labels)
+        )
+    transitions = transition_matrix(formations, f'{category_field}_decile', period_col='formation_year')
+    return pd.concat(turnover, axis=1), pd.concat(weight_turnover, axis=1), transitions
+
+turnover_ep, vw_turnover_ep, transitions_ep = calculate_turnover(ccm_jun, 'ep_categories')
+turnover_cfp, vw_turnover_cfp, transitions_cfp = calculate_turnover(ccm_jun, 'cfp_categories')
+turnover_dy, vw_turnover_dy, transitions_dy = calculate_turnover(ccm_jun, 'dy_categories')
 
 
 with pd.ExcelWriter(DATA_DIR / 'manual'/ 'portfolio_metrics.xlsx') as writer:
@@ -324,13 +435,131 @@ with pd.ExcelWriter(DATA_DIR / 'manual'/ 'portfolio_metrics.xlsx') as writer:
     equal_weighted_ep.to_excel(writer, sheet_name='Equal Weighted Monthly EP')
     value_weighted_cfp.to_excel(writer, sheet_name='Value Weighted Monthly CFP')
     equal_weighted_cfp.to_excel(writer, sheet_name='Equal Weighted Monthly CFP')
+    value_weighted_dy.to_excel(writer, sheet_name='Value Weighted Monthly DP')
+    equal_weighted_dy.to_excel(writer, sheet_name='Equal Weighted Monthly DP')
     
     value_weighted_annual_ep.to_excel(writer, sheet_name='Value Weighted Annual EP')
     equal_weighted_annual_ep.to_excel(writer, sheet_name='Equal Weighted Annual EP')
     value_weighted_annual_cfp.to_excel(writer, sheet_name='Value Weighted Annual CFP')
     equal_weighted_annual_cfp.to_excel(writer, sheet_name='Equal Weighted Annual CFP')
+    value_weighted_annual_dy.to_excel(writer, sheet_name='Value Weighted Annual DP')
+    equal_weighted_annual_dy.to_excel(writer, sheet_name='Equal Weighted Annual DP')
     
     average_size_ep.to_excel(writer, sheet_name='Average Size EP')
     firm_count_ep.to_excel(writer, sheet_name='Firm Count EP')
     average_size_cfp.to_excel(writer, sheet_name='Average Size CFP')
-    firm_count_cfp.to_excel(writer, sheet_name='Firm Count CFP')
\ No newline at end of file
+    firm_count_cfp.to_excel(writer, sheet_name='Firm Count CFP')
+    average_size_dy.to_excel(writer, sheet_name='Average Size DP')
+    firm_count_dy.to_excel(writer, sheet_name='Firm Count DP')
+    vw_ep.to_excel(writer, sheet_name='VW Avg EP')
+    vw_cfp.to_excel(writer, sheet_name='VW Avg CFP')
+    vw_dy.to_excel(writer, sheet_name='VW Avg DP')
+
+    turnover_ep.to_excel(writer, sheet_name='Turnover EP')
+    vw_turnover_ep.to_excel(writer, sheet_name='VW Turnover EP')
+    transitions_ep.to_excel(writer, sheet_name='Transitions EP')
+    turnover_cfp.to_excel(writer, sheet_name='Turnover CFP')
+    vw_turnover_cfp.to_excel(writer, sheet_name='VW Turnover CFP')
+    transitions_cfp.to_excel(writer, sheet_name='Transitions CFP')
+    turnover_dy.to_excel(writer, sheet_name='Turnover DP')
+    vw_turnover_dy.to_excel(writer, sheet_name='VW Turnover DP')
+    transitions_dy.to_excel(writer, sheet_name='Transitions DP')
+
+# Quarterly and monthly rebalanced sorts, written next to the annual ones
+# (`portfolio_metrics_quarterly.xlsx`, `portfolio_metrics_monthly.xlsx`)
+REBALANCE_SCHEDULES = [QUARTERLY, MONTHLY]
+REBALANCED_METRICS = {'ep': 'ep_categories', 'cfp': 'cfp_categories', 'dy': 'dy_categories'}
+METRIC_SHEET_NAMES = {'ep': 'EP', 'cfp': 'CFP', 'dy': 'DP'}
+
+
+def rebalancing_characteristics(crsp3, ccm_jun):
+    """
+    E/P, CF/P and D/P of every stock-month for the rebalanced sorts.
+
+    E/P and CF/P are the accounting data of the June formation in force at
+    the end of the month (see `rebalancing.accounting_in_force`) over the ME
+    of that month, as `merge_CRSP_and_Compustat` computes them over December
+    ME; D/P is the trailing dividend yield of the month. Only stocks in the
+    June sort of the formation year are sorted.
+    """
+    chars = crsp3[['permno', 'mdate', 'primaryexch', 'me']].copy()
+    accounting = accounting_in_force(ccm_jun, crsp3, ['ni', 'cf', 'formation_year'])
+    me = chars['me'].where(chars['me'] > 0)
+    in_force = accounting['formation_year'].notna()
+    chars['ep'] = accounting['ni'] * 1000 / me
+    chars['cfp'] = accounting['cf'] / me
+    chars['dy'] = crsp3['dy'].where(in_force & (crsp3['dy'] > 0))
+    return chars
+
+
+def rebalanced_metric_portfolios(chars, crsp3, schedules=REBALANCE_SCHEDULES):
+    """
+    Monthly holdings of the E/P, CF/P and D/P sorts re-formed on `schedules`.
+
+    The stocks are categorized at every formation date exactly as in June
+    (`categorize_stocks_by_metrics`, with the same sorts and the 'Negative
+    Values' bucket), each metric independently, and held until the next
+    formation weighted by last month's ME (see `rebalancing.hold_formations`).
+    The metrics are then transformed within every formation date, as in June.
+
+    Returns:
+    - dict: schedule name -> holdings with `jdate`, the category columns and
+      the sorting metrics of the formation, and the `me` of the month.
+    """
+    formed = chars[formation_dates(chars['mdate'], schedules)].copy()
+    categorize_stocks_by_metrics(formed, REBALANCED_METRICS, date_col='mdate')
+    transform_characteristics(formed, list(REBALANCED_METRICS), date_col='mdate')
+    portfolio_cols = [
+        column for category_name in REBALANCED_METRICS.values()
+        for column in [category_name, *(f'{category_name}_{suffix}' for suffix, *_ in METRIC_SORTS)]
+    ]
+    holdings = hold_formations(formed, crsp3, [*portfolio_cols, *REBALANCED_METRICS], schedules,
+                               ret_col='mthret', value_cols=('me',))
+    for held in holdings.values():
+        held['jdate'] = month_index_to_date(held['mdate'])
+    return holdings
+
+
+rebalancing_chars = rebalancing_characteristics(crsp3, ccm_jun)
+for name, held in rebalanced_metric_portfolios(rebalancing_chars, crsp3).items():
+    # the sheets of the annual sorts that do not compound June-to-June returns
+    tables = calculate_portfolio_characteristics(held, {category: metric for metric, category in REBALANCED_METRICS.items()})
+    with pd.ExcelWriter(DATA_DIR / 'manual' / f'portfolio_metrics_{name}.xlsx') as writer:
+        for metric, category_name in REBALANCED_METRICS.items():
+            table = tables[category_name]
+            value_weighted, equal_weighted = calculate_portfolio_monthly_returns(held, category_name, table=table)
+            average_size, firm_count = calculate_firm_size_and_count(table, category_name)
+            sheet = METRIC_SHEET_NAMES[metric]
+            value_weighted.to_excel(writer, sheet_name=f'Value Weighted Monthly {sheet}')
+            equal_weighted.to_excel(writer, sheet_name=f'Equal Weighted Monthly {sheet}')
+            average_size.to_excel(writer, sheet_name=f'Average Size {sheet}')
+            firm_count.to_excel(writer, sheet_name=f'Firm Count {sheet}')
+            table[['jdate', category_name, f'vw_{metric}']].to_excel(writer, sheet_name=f'VW Avg {sheet}')
+
+# Prior-return (momentum and reversal) deciles, re-formed at the end of every
+# month and held the next month (`prior_return_portfolios.xlsx`)
+PRIOR_RETURN_SHEET_NAMES = {'mom_2_12': 'Prior 2-12', 'rev_1_1': 'Prior 1-1', 'rev_13_60': 'Prior 13-60'}
+
+
+def calculate_prior_return_portfolios(crsp3, name):
+    """
+    VW and EW monthly returns of the deciles of the prior return `name` (a
+    column of `characteristics.add_prior_returns`), one row per `jdate` and
+    one column per decile, weighted by the ME at the end of the formation month.
+    """
+    dimension = SortDimension(name, DECILE_PERCENTILES, [f'Dec {i}' for i in range(1, 11)], side='right')
+    holdings = rebalanced_portfolios(crsp3, crsp3, [dimension], [MONTHLY], ret_col='mthret')[MONTHLY.name]
+    holdings['jdate'] = month_index_to_date(holdings['mdate'])
+    table = portfolio_table(holdings, ['jdate', name], ret_col='mthret', weight_col='weight')
+    return (
+        table.pivot(index='jdate', columns=name, values='vwret'),
+        table.pivot(index='jdate', columns=name, values='ewret'),
+    )
+
+
+add_prior_returns(crsp3, ret_col='mthret')
+with pd.ExcelWriter(DATA_DIR / 'manual' / 'prior_return_portfolios.xlsx') as writer:
+    for name in PRIOR_RETURN_WINDOWS:
+        value_weighted, equal_weighted = calculate_prior_return_portfolios(crsp3, name)
+        value_weighted.to_excel(writer, sheet_name=f'Value Weighted {PRIOR_RETURN_SHEET_NAMES[name]}')
+        equal_weighted.to_excel(writer, sheet_name=f'Equal Weighted {PRIOR_RETURN_SHEET_NAMES[name]}')
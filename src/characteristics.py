@@ -0,0 +1,179 @@
+"""
+Stock characteristics from the CRSP monthly panel.
+
+Characteristics over trailing windows (e.g. the dividends of the last 12
+months) are sums over the months of a window, computed for all rows at
+once instead of with a groupby rolling apply: the panel is sorted by
+(stock, month), values are cumulated within every stock
+(`segment_kernels.segment_cumsum`), and the sum over a window is the
+difference of the cumulative sums at its two ends. The ends are found by a
+binary search on integer (stock, month index) keys, so windows are measured
+in calendar months: a month missing from a stock's history is simply not
+in any window, and never shifts a window by one row.
+
+Prior (momentum and reversal) returns are compounded the same way, as sums
+of log gross returns over the window. The window of a formation month f
+covers the months f - skip - window + 1 to f - skip, so the characteristics
+of month f can be sorted with a monthly `rebalancing` schedule, whose
+portfolios formed at the end of f are held in f + 1:
+
+>>> add_prior_returns(crsp3)
+>>> dims = [SortDimension("mom_2_12", DECILE_PERCENTILES)]
+>>> holdings = rebalanced_portfolios(crsp3, crsp3, dims, [MONTHLY])
+
+Functions:
+- trailing_sums(values, ids, months, window, skip=0): Sums and counts over trailing windows.
+- monthly_dividends(ret, retx, lagged_me): Dividends paid in every month.
+- add_dividend_yield(df, ...): Trailing 12-month dividends and dividend yield (D/P).
+- prior_returns(ret, ids, months, window, skip=0, ...): Compounded returns over trailing windows.
+- add_prior_returns(df, windows=PRIOR_RETURN_WINDOWS, ...): Momentum and reversal characteristics.
+"""
+import numpy as np
+
+from segment_kernels import offsets_from_sorted_keys, segment_cumsum
+
+# name -> (window, skip, min_months) of the Fama-French prior-return sorts, for
+# portfolios formed at the end of month f and held in f + 1:
+# - mom_2_12: momentum, returns of months t-12 to t-2 of the holding month t
+# - rev_1_1: short-term reversal, the return of month t-1
+# - rev_13_60: long-term reversal, months t-60 to t-13, at least 36 of them
+PRIOR_RETURN_WINDOWS = {
+    "mom_2_12": (11, 1, 11),
+    "rev_1_1": (1, 0, 1),
+    "rev_13_60": (48, 12, 36),
+}
+
+
+def trailing_sums(values, ids, months, window, skip=0):
+    """
+    Sum and number of non-missing `values` of the same id over a trailing
+    window of calendar months.
+
+    The window of a row of month m covers the months m - skip - window + 1
+    to m - skip; with skip=0 it ends with (and includes) the row itself.
+
+    Parameters:
+    values (array-like): Values to sum; missing values are skipped.
+    ids (array-like): Stock id of every row.
+    months (array-like): Integer month index of every row (see `month_index.py`);
+        (id, month) pairs are unique.
+    window (int): Number of months in the window.
+    skip (int): Number of most recent months left out of the window.
+
+    Returns:
+    (np.ndarray, np.ndarray): The sums (missing where the window has no
+    value) and the number of values in every window, in the order of the rows.
+    """
+    values = np.asarray(values, dtype=float)
+    ids = np.asarray(ids)
+    months = np.asarray(months, dtype=np.int64)
+    n = len(values)
+    sums, counts = np.full(n, np.nan), np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return sums, counts
+
+    order = np.lexsort((months, ids))
+    offsets = offsets_from_sorted_keys(ids[order])
+    present = ~np.isnan(values[order])
+    filled = np.where(present, values[order], 0.0)
+    cum_values = segment_cumsum(filled, offsets)
+    cum_counts = segment_cumsum(present, offsets)
+
+    # keys of consecutive stocks are further apart than any window reaches
+    sorted_months = months[order]
+    span = int(sorted_months.max() - sorted_months.min()) + window + skip + 1
+    stock = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    keys = stock * span + (sorted_months - sorted_months.min())
+
+    last = np.searchsorted(keys, keys - skip, side="right") - 1
+    first = np.searchsorted(keys, keys - skip - window + 1, side="left")
+    nonempty = last >= first
+    last, first = last[nonempty], first[nonempty]
+    # cumulative sums up to the row before the window (within the stock)
+    window_sums = cum_values[last] - (cum_values[first] - filled[first])
+    window_counts = cum_counts[last] - (cum_counts[first] - present[first])
+
+    sorted_sums = np.full(n, np.nan)
+    sorted_counts = np.zeros(n, dtype=np.int64)
+    sorted_sums[nonempty] = np.where(window_counts > 0, window_sums, np.nan)
+    sorted_counts[nonempty] = window_counts
+    sums[order], counts[order] = sorted_sums, sorted_counts
+    return sums, counts
+
+
+def monthly_dividends(ret, retx, lagged_me):
+    """
+    Dividends paid in every month: the return with dividends minus the return
+    without dividends, times the ME at the end of the previous month (the
+    dividend per share times the shares outstanding).
+    """
+    return (np.asarray(ret, dtype=float) - np.asarray(retx, dtype=float)) * np.asarray(lagged_me, dtype=float)
+
+
+def add_dividend_yield(
+    df,
+    id_col="permno",
+    month_col="mdate",
+    ret_col="ret",
+    retx_col="retx",
+    lagged_me_col="L_me",
+    me_col="me",
+    window=12,
+    min_months=None,
+):
+    """
+    Trailing dividends and dividend yield of every stock-month.
+
+    The dividend yield of month m is the total dividends paid over the
+    `window` months ending with m divided by the ME at the end of m, as the
+    Fama-French D/P (dividends from July of t-1 to June of t over ME in June
+    of t). For the CIZ format use `ret_col="mthret"` and `retx_col="mthretx"`.
+    The yield is named `dy`, as `dp` is Compustat depreciation.
+
+    Adds the columns `div` (dividends of the month), `div12` (trailing
+    dividends) and `dy` (missing unless the window has at least `min_months`
+    months of returns, all by default, and ME is positive) to `df` in place
+    and returns it.
+    """
+    min_months = window if min_months is None else min_months
+    df["div"] = monthly_dividends(df[ret_col], df[retx_col], df[lagged_me_col])
+    div12, n_months = trailing_sums(df["div"], df[id_col], df[month_col], window)
+    me = df[me_col].to_numpy(dtype=float)
+    df["div12"] = div12
+    df["dy"] = np.where((n_months >= min_months) & (me > 0), div12 / np.where(me > 0, me, np.nan), np.nan)
+    return df
+
+
+def prior_returns(ret, ids, months, window, skip=0, min_months=None):
+    """
+    Compounded return of every stock over a trailing window of calendar
+    months (see `trailing_sums` for the window), from the sum of log gross
+    returns.
+
+    Missing returns and months missing from the panel are skipped; the
+    result is missing unless the window has at least `min_months` returns
+    (all `window` months by default). A window with a return of -100% (or
+    less) has a compounded return of -100%; the log of such a return is not
+    finite, so those months are counted in a separate sum and add nothing to
+    the log sums of the other windows.
+    """
+    min_months = window if min_months is None else min_months
+    ret = np.asarray(ret, dtype=float)
+    wiped_out = ret <= -1
+    log_gross = np.log1p(np.where(wiped_out, 0.0, ret))
+    sums, counts = trailing_sums(log_gross, ids, months, window, skip=skip)
+    n_wiped_out, _ = trailing_sums(wiped_out.astype(float), ids, months, window, skip=skip)
+    compounded = np.where(n_wiped_out > 0, -1.0, np.expm1(sums))
+    return np.where(counts >= max(min_months, 1), compounded, np.nan)
+
+
+def add_prior_returns(df, windows=PRIOR_RETURN_WINDOWS, id_col="permno", month_col="mdate", ret_col="ret"):
+    """
+    Add one prior-return column per entry of `windows` (name -> (window,
+    skip, min_months), as `PRIOR_RETURN_WINDOWS`) to `df` in place and
+    return it. For the CIZ format use `ret_col="mthret"`.
+    """
+    ret, ids, months = df[ret_col].to_numpy(dtype=float), df[id_col].to_numpy(), df[month_col].to_numpy()
+    for name, (window, skip, min_months) in windows.items():
+        df[name] = prior_returns(ret, ids, months, window, skip=skip, min_months=min_months)
+    return df
@@ -33,6 +33,21 @@ END_DATE = '2024-02-28'
 START_DATE = config("START_DATE", default="1951-07-01")
 END_DATE = config("END_DATE", default="2023-12-31")
 
+## Engine used for the portfolio construction stages: "pandas" or "polars"
+PORTFOLIO_BACKEND = config("PORTFOLIO_BACKEND", default="pandas")
+
+## Stocks the sort breakpoints are computed from: "nyse" (as Fama-French) or "all"
+BREAKPOINT_UNIVERSE = config("BREAKPOINT_UNIVERSE", default="nyse")
+
+## Transform of the sorting characteristics within every formation date, before
+## the sorts and the VW averages: "none", "winsorize", "rank" or "zscore"
+## (z-scores of the winsorized values); see `cross_section.py`
+CHARACTERISTIC_TRANSFORM = config("CHARACTERISTIC_TRANSFORM", default="none")
+## Lower and upper winsorizing percentiles
+WINSORIZE_LIMITS = config(
+    "WINSORIZE_LIMITS", default="0.01,0.99", cast=lambda v: tuple(float(x) for x in v.split(","))
+)
+
 if __name__ == "__main__":
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     ## If they don't exist, create the data and output directories
@@ -40,4 +55,6 @@ if __name__ == "__main__":
     (DATA_DIR / 'pulled' / 'v2').mkdir(parents=True, exist_ok=True)
     (DATA_DIR / 'famafrench').mkdir(parents=True, exist_ok=True)
     (DATA_DIR / 'manual').mkdir(parents=True, exist_ok=True)
+    (DATA_DIR / 'derived').mkdir(parents=True, exist_ok=True)
+    (DATA_DIR / 'derived' / 'breakpoints').mkdir(parents=True, exist_ok=True)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
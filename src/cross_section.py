@@ -0,0 +1,138 @@
+"""
+Cross-sectional transforms of characteristics per formation date.
+
+Characteristics such as E/P, CF/P, BE/ME, OP and INV have extreme values
+that dominate value-weighted averages. The transforms here are computed per
+date (e.g. per formation year), for many characteristics in one call,
+without a groupby apply:
+
+- winsorize: clip every value at the `limits` percentiles of its date
+  (quantiles as `pd.Series.quantile`).
+- rank: percentile rank in (0, 1] within the date, ties sharing their
+  average rank (as `groupby(...).rank(pct=True)`).
+- zscore: (value - mean) / standard deviation within the date, of the
+  winsorized values when winsorizing.
+
+The dates are factorized once. Every characteristic is sorted once by
+(date, value); the winsorizing limits (`breakpoints.sorted_quantiles`), the
+ranks (runs of equal values) and the per-date moments (`np.bincount`) are all
+read off that one sort.
+
+The portfolio scripts apply `config.CHARACTERISTIC_TRANSFORM` to their
+sorting characteristics with `transform_characteristics` ("none" by default).
+
+Functions:
+- cross_sectional_transforms(df, columns, ...): Winsorized values, ranks and z-scores.
+- winsorize(df, columns, ...): Winsorized characteristics only.
+- transform_characteristics(df, columns, ...): Replace characteristics by one transform.
+"""
+import numpy as np
+import pandas as pd
+
+import config
+from breakpoints import sorted_quantiles
+from segment_kernels import offsets_from_sorted_keys
+
+TRANSFORMS = ("winsorize", "rank", "zscore")
+# column suffix of every transform
+SUFFIXES = {"winsorize": "_w", "rank": "_rank", "zscore": "_z"}
+
+
+def _transform_sorted(v, c, counts, limits, transforms, ddof):
+    """Transforms of values sorted by (date code, value); returns name -> sorted results."""
+    out = {}
+    if "rank" in transforms:
+        # ties are runs of equal (date, value); every row of a run gets its average position
+        runs = offsets_from_sorted_keys(c, v)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        average_position = np.repeat((runs[:-1] + runs[1:] - 1) / 2, np.diff(runs))
+        out["rank"] = (average_position - starts[c] + 1) / counts[c]
+
+    if limits is not None:
+        bounds = sorted_quantiles(v, counts, limits)
+        v = np.clip(v, bounds[c, 0], bounds[c, 1])
+    if "winsorize" in transforms:
+        out["winsorize"] = v
+
+    if "zscore" in transforms:
+        n = counts.astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(c, weights=v, minlength=len(counts)) / n
+            deviation = v - mean[c]
+            variance = np.bincount(c, weights=deviation**2, minlength=len(counts)) / (n - ddof)
+            std = np.sqrt(np.where(n > ddof, variance, np.nan))
+            out["zscore"] = deviation / np.where(std > 0, std, np.nan)[c]
+    return out
+
+
+def cross_sectional_transforms(
+    df, columns, date_col="year", limits=(0.01, 0.99), transforms=TRANSFORMS, ddof=1
+):
+    """
+    Winsorize, rank and standardize characteristics within every date.
+
+    Parameters:
+    df (pd.DataFrame): Panel with `date_col` and the characteristic columns.
+    columns (iterable of str): Characteristics to transform.
+    date_col (str): Formation date column the transforms are computed within.
+    limits (tuple of float or None): Lower and upper winsorizing percentiles,
+        e.g. (0.01, 0.99); None to leave the values as they are.
+    transforms (iterable of str): Any of "winsorize", "rank" and "zscore".
+    ddof (int): Delta degrees of freedom of the standard deviation.
+
+    Returns:
+    pd.DataFrame: Index of `df`, one column per characteristic and transform
+    (`{column}_w`, `{column}_rank`, `{column}_z`); missing where the value or
+    the date is missing. Ranks use the raw values, which order the same as
+    the winsorized ones apart from the ties created at the limits.
+    """
+    transforms = [t for t in TRANSFORMS if t in transforms]
+    date_codes = pd.factorize(df[date_col], sort=True)[0]
+    n_dates = int(date_codes.max()) + 1 if len(date_codes) else 0
+
+    out = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=float)
+        rows = np.flatnonzero(~np.isnan(values) & (date_codes >= 0))
+        order = rows[np.lexsort((values[rows], date_codes[rows]))]
+        v, c = values[order], date_codes[order]
+        counts = np.bincount(c, minlength=n_dates)
+
+        results = _transform_sorted(v, c, counts, limits, transforms, ddof)
+        for transform in transforms:
+            result = np.full(len(df), np.nan)
+            result[order] = results[transform]
+            out[f"{column}{SUFFIXES[transform]}"] = result
+    return pd.DataFrame(data=out, index=df.index)
+
+
+def winsorize(df, columns, date_col="year", limits=(0.01, 0.99)):
+    """Characteristics clipped at the `limits` percentiles of their date, under their own names."""
+    columns = list(columns)
+    winsorized = cross_sectional_transforms(df, columns, date_col, limits=limits, transforms=("winsorize",))
+    return winsorized.set_axis(columns, axis=1)
+
+
+def transform_characteristics(df, columns, date_col="year", transform=None, limits=None):
+    """
+    Replace the characteristics `columns` of `df` in place by one transform
+    within every date, and return `df`.
+
+    `transform` is "none", "winsorize", "rank" or "zscore" and `limits` the
+    winsorizing percentiles (`config.CHARACTERISTIC_TRANSFORM` and
+    `config.WINSORIZE_LIMITS` by default). Z-scores are of the winsorized
+    values; ranks ignore `limits`.
+    """
+    transform = config.CHARACTERISTIC_TRANSFORM if transform is None else transform
+    limits = config.WINSORIZE_LIMITS if limits is None else limits
+    if transform == "none":
+        return df
+    if transform not in TRANSFORMS:
+        raise ValueError(f"transform must be 'none' or one of {TRANSFORMS}, not {transform!r}")
+    columns = list(columns)
+    transformed = cross_sectional_transforms(
+        df, columns, date_col, limits=None if transform == "rank" else limits, transforms=(transform,)
+    )
+    for column in columns:
+        df[column] = transformed[f"{column}{SUFFIXES[transform]}"].to_numpy()
+    return df
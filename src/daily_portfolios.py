@@ -0,0 +1,126 @@
+"""
+Daily industry portfolios, streamed one year of daily data at a time.
+
+The monthly pipeline (`calc_industry_portfolios`) provides, for every
+permno-month, the industry assignment (a SIC code) and the VW weight: ME at
+the end of the previous month. Daily portfolios hold these assignments and
+let the weights drift within the month with the stock's daily price change:
+the weight of a stock on day d of month m is
+
+    ME(end of m-1) * prod over earlier days of m of (1 + retx)
+
+as in the Ken French daily industry files. Daily returns are read one
+calendar year at a time (see `load_CRSP_stock.load_CRSP_daily_file`), joined
+to that year's monthly inputs and reduced with
+`portfolio_aggregation.industry_portfolios`, so memory is bounded by one year
+of daily data.
+
+Functions:
+- june_formation_sic(monthly): SIC as of the most recent June, held from July to June.
+- daily_weights(daily, monthly): Daily panel with drifted VW weights.
+- stream_daily_industry_portfolios(monthly, years): One frame of daily portfolios per year.
+- daily_industry_portfolios(monthly, years): All years in one frame.
+"""
+import numpy as np
+import pandas as pd
+
+from month_index import ff_year, month_index, month_of, year_of
+from portfolio_aggregation import industry_portfolios
+from segment_kernels import offsets_from_sorted_keys, segment_cumprod, segment_shift
+
+
+def june_formation_sic(monthly, sic_col="sic", id_col="permno", mdate_col="mdate"):
+    """
+    SIC code assigned at the end of June of year t, for every permno-month
+    from July t to June t+1. Months before a stock's first June are missing.
+
+    Returns a Series aligned with `monthly`.
+    """
+    june = monthly.loc[month_of(monthly[mdate_col].to_numpy()) == 6]
+    june_sic = pd.Series(
+        june[sic_col].to_numpy(),
+        index=pd.MultiIndex.from_arrays([june[id_col], year_of(june[mdate_col].to_numpy())]),
+    )
+    june_sic = june_sic[~june_sic.index.duplicated(keep="last")]
+    keys = pd.MultiIndex.from_arrays([monthly[id_col], ff_year(monthly[mdate_col].to_numpy())])
+    return pd.Series(june_sic.reindex(keys).to_numpy(), index=monthly.index, name=sic_col)
+
+
+def daily_weights(
+    daily, monthly, weight_col="L_me", sic_col="sic", id_col="permno", retx_col="retx"
+):
+    """
+    Join daily returns to the monthly SIC and base weight of the same
+    permno-month and drift the weights within the month.
+
+    Parameters:
+    daily (pd.DataFrame): Daily rows with `id_col`, `date`, `ret` and `retx_col`.
+    monthly (pd.DataFrame): Monthly rows with `id_col`, `mdate`, `sic_col` and `weight_col`.
+
+    Returns:
+    pd.DataFrame: The daily rows with a matching month, sorted by permno and
+    date, with `sic_col`, `mdate` and the drifted weight `wt`.
+    """
+    daily = daily.assign(mdate=month_index(daily["date"]))
+    panel = daily.merge(
+        monthly[[id_col, "mdate", sic_col, weight_col]], how="inner", on=[id_col, "mdate"]
+    ).sort_values([id_col, "date"], kind="stable")
+
+    # cumulative price change before each day, restarting every month
+    offsets = offsets_from_sorted_keys(panel[id_col].to_numpy(), panel["mdate"].to_numpy())
+    growth = segment_cumprod(1 + panel[retx_col].fillna(0).to_numpy(), offsets)
+    drift = segment_shift(growth, offsets)
+    drift = np.where(np.isnan(drift), 1.0, drift)
+
+    panel["wt"] = panel[weight_col].to_numpy() * drift
+    return panel.reset_index(drop=True)
+
+
+def stream_daily_industry_portfolios(
+    monthly,
+    years,
+    load_daily=None,
+    schemes=(5, 49),
+    weight_col="L_me",
+    sic_col="sic",
+    id_col="permno",
+    ret_col="ret",
+    retx_col="retx",
+):
+    """
+    Daily VW returns, EW returns and firm counts of the industry portfolios
+    of every scheme, yielded one calendar year at a time.
+
+    Parameters:
+    monthly (pd.DataFrame): Monthly assignments and base weights (see `daily_weights`).
+        Rows with a missing SIC code are not in any portfolio.
+    years (iterable of int): Calendar years to compute.
+    load_daily (callable, optional): year -> daily DataFrame. Defaults to
+        `load_CRSP_stock.load_CRSP_daily_file`.
+
+    Yields:
+    pd.DataFrame: `industry_portfolios` output for the days of one year.
+    """
+    if load_daily is None:
+        from load_CRSP_stock import load_CRSP_daily_file as load_daily
+
+    monthly = monthly.loc[monthly[sic_col].notna(), [id_col, "mdate", sic_col, weight_col]]
+    month_year = year_of(monthly["mdate"].to_numpy())
+    for year in years:
+        panel = daily_weights(
+            load_daily(year),
+            monthly[month_year == year],
+            weight_col=weight_col,
+            sic_col=sic_col,
+            id_col=id_col,
+            retx_col=retx_col,
+        )
+        yield industry_portfolios(
+            panel, schemes, date_col="date", sic_col=sic_col, ret_col=ret_col, weight_col="wt"
+        )
+
+
+def daily_industry_portfolios(monthly, years, **kwargs):
+    """All years of `stream_daily_industry_portfolios` in one frame, sorted by scheme and date."""
+    ports = pd.concat(list(stream_daily_industry_portfolios(monthly, years, **kwargs)))
+    return ports.sort_values(["scheme", "date"], kind="stable").reset_index(drop=True)
@@ -0,0 +1,471 @@
+"""
+Compiled SIC-code-to-industry classifiers.
+
+Assigning Fama-French industries row by row (`siccd.apply(assign_industry49)`)
+walks Python lists of SIC ranges for every row of the panel. SIC codes are
+four-digit integers, so a classification scheme can be compiled once into a
+10,000-entry lookup array (one industry code per possible SIC code) and the
+whole `siccd` column mapped with a single vectorized take.
+
+Ranges are applied in definition order and the first match wins, as in the
+row-by-row functions.
+
+Every Fama-French scheme (5, 10, 12, 17, 30, 38, 48 and 49 industries) is
+defined by one of Ken French's `Siccodes{n}.txt` files, and every scheme,
+including 5 and 49, is read through the same path: `parse_siccodes` reads
+that format and `load_classifier(n)` compiles a scheme, caching the lookup
+array under `DATA_DIR / "derived"`. Definition files are looked up in
+`assets/siccodes` (vendored, so builds work offline) and then in
+`DATA_DIR / "famafrench" / "siccodes"`, where `download_siccodes(n)` saves the
+files from the Ken French Data Library. Running this module as a script
+vendors the files of every scheme (`vendor_siccodes`).
+
+`INDUSTRY5_PORTFOLIOS` and `INDUSTRY49_PORTFOLIOS` keep the 5- and
+49-industry ranges as Python dicts, to check the definition files against.
+Until the Ken French files are vendored, `assets/siccodes` holds 5- and
+49-industry files generated from these dicts by `format_siccodes` (marked by
+their header); `unofficial_siccodes()` lists the schemes still missing an
+official file.
+
+Classes:
+- IndustryClassifier: A compiled classification scheme.
+
+Functions:
+- classify_industry5(siccd): Fama-French 5-industry categorical column.
+- classify_industry49(siccd): Fama-French 49-industry categorical column.
+- classify_industry(siccd, n): Categorical column for any Fama-French scheme.
+- get_classifier(n): Classifier for a Fama-French scheme, from its definition file.
+- load_classifier(n): Compiled (and cached) classifier for a Fama-French scheme.
+- parse_siccodes(text): Industry ranges from a `Siccodes{n}.txt` file.
+- format_siccodes(portfolios): The inverse of `parse_siccodes`.
+- download_siccodes(n): Fetch a definition file from the Ken French Data Library.
+- vendor_siccodes(schemes): Download the definition files into `assets/siccodes`.
+- unofficial_siccodes(schemes): Schemes without an official vendored definition file.
+- resolve_sic(panel, comp): Compustat historical SIC (`sich`) with CRSP `siccd` fallback.
+"""
+import hashlib
+import io
+import re
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import config
+from month_index import month_index
+
+
+N_SIC_CODES = 10_000
+UNASSIGNED = -1
+
+FAMA_FRENCH_SCHEMES = (5, 10, 12, 17, 30, 38, 48, 49)
+SICCODES_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/Siccodes{n}.zip"
+VENDORED_SICCODES_DIR = config.BASE_DIR / "assets" / "siccodes"
+# first line of the definition files written from the built-in dicts
+GENERATED_SICCODES_MARKER = "format_siccodes"
+PULLED_SICCODES_DIR = Path(config.DATA_DIR) / "famafrench" / "siccodes"
+CACHE_DIR = Path(config.DATA_DIR) / "derived"
+
+# Months after the fiscal year end before Compustat data are used, as in the
+# June formation of the sorts (fiscal year t-1 data from June of year t)
+COMPUSTAT_LAG_MONTHS = 6
+
+# Label for missing or non-numeric SIC codes, where a scheme differs from "Other"
+INVALID_LABELS = {49: "Invalid SIC Code"}
+
+# SIC code ranges (inclusive) for each of the 5 industries
+INDUSTRY5_PORTFOLIOS = {
+    'Cnsmr': [(100, 999), (2000, 2399), (2700, 2749), (2770, 2799), (3100, 3199),
+              (3940, 3989), (2500, 2519), (2590, 2599), (3630, 3659), (3710, 3711),
+              (3714, 3714), (3716, 3716), (3750, 3751), (3792, 3792), (3900, 3939),
+              (3990, 3999), (5000, 5999), (7200, 7299), (7600, 7699)],
+    'Manuf': [(2520, 2589), (2600, 2699), (2750, 2769), (2800, 2829), (2840, 2899),
+              (3000, 3099), (3200, 3569), (3580, 3621), (3623, 3629), (3700, 3709),
+              (3712, 3713), (3715, 3715), (3717, 3749), (3752, 3791), (3793, 3799),
+              (3860, 3899), (1200, 1399), (2900, 2999), (4900, 4949)],
+    'HiTec': [(3570, 3579), (3622, 3622), (3660, 3692), (3694, 3699), (3810, 3839),
+              (7370, 7379), (7391, 7391), (8730, 8734), (4800, 4899)],
+    'Hlth': [(2830, 2839), (3693, 3693), (3840, 3859), (8000, 8099)],
+}
+
+# SIC code ranges (inclusive) for each of the 49 industries
+INDUSTRY49_PORTFOLIOS = {
+    'Agric': [(100, 199), (200, 299), (700, 799), (910, 919), (2048, 2048)],
+    'Food': [(2000, 2009), (2010, 2019), (2020, 2029), (2030, 2039), (2040, 2046), (2050, 2059), (2060, 2063), (2070, 2079), (2090, 2092), (2095, 2095), (2098, 2099)],
+    'Soda': [(2064, 2068), (2086, 2086), (2087, 2087), (2096, 2096), (2097, 2097)],
+    'Beer': [(2080, 2080), (2082, 2082), (2083, 2083), (2084, 2084), (2085, 2085)],
+    'Smoke': [(2100, 2199)],
+    'Toys': [(920, 999), (3650, 3651), (3732, 3732), (3930, 3931), (3940, 3949)],
+    'Fun': [(7800, 7829), (7830, 7833), (7840, 7841), (7900, 7900), (7910, 7911), (7920, 7929), (7930, 7933), (7940, 7949), (7980, 7980), (7990, 7999)],
+    'Books': [(2700, 2709), (2710, 2719), (2720, 2729), (2730, 2739), (2740, 2749), (2770, 2771), (2780, 2789), (2790, 2799)],
+    'Hshld': [(2047, 2047), (2391, 2392), (2510, 2519), (2590, 2599), (2840, 2844), (3160, 3161), (3170, 3172), (3190, 3199), (3229, 3229), (3260, 3269), (3230, 3231), (3630, 3639), (3750, 3751), (3800, 3800), (3860, 3861), (3870, 3873), (3910, 3915), (3960, 3962), (3991, 3991), (3995, 3995)],
+    'Clths': [(2300, 2390), (3020, 3021), (3100, 3111), (3130, 3131), (3140, 3149), (3150, 3151), (3963, 3965)],
+    'Hlth': [(8000, 8099)],
+    'MedEq': [(3693, 3693), (3840, 3849), (3850, 3851)],
+    'Drugs': [(2830, 2836)],
+    'Chems': [(2800, 2829), (2850, 2859), (2860, 2869), (2870, 2879), (2890, 2899)],
+    'Rubbr': [(3031, 3031), (3041, 3041), (3050, 3053), (3060, 3069), (3070, 3079), (3080, 3089), (3090, 3099)],
+    'Txtls': [(2200, 2269), (2270, 2279), (2280, 2284), (2290, 2295), (2297, 2297), (2298, 2298), (2299, 2299), (2393, 2395), (2397, 2399)],
+    'BldMt': [(800, 899), (2400, 2439), (2450, 2459), (2490, 2499), (2660, 2661), (2950, 2952), (3200, 3200), (3210, 3211), (3240, 3241), (3250, 3259), (3261, 3261), (3264, 3264), (3270, 3275), (3280, 3281), (3290, 3293), (3295, 3299), (3420, 3429), (3430, 3433), (3440, 3441), (3442, 3442), (3446, 3446), (3448, 3448), (3449, 3449), (3450, 3451), (3452, 3452), (3490, 3499), (3996, 3996)],
+    'Cnstr': [(1500, 1511), (1520, 1529), (1530, 1539), (1540, 1549), (1600, 1699), (1700, 1799)],
+    'Steel': [(3300, 3300), (3310, 3317), (3320, 3325), (3330, 3339), (3340, 3341), (3350, 3357), (3360, 3369), (3370, 3379), (3390, 3399)],
+    'FabPr': [(3400, 3400), (3443, 3444), (3460, 3469), (3470, 3479)],
+    'Mach': [(3510, 3519), (3520, 3529), (3530, 3536), (3538, 3538), (3540, 3549), (3550, 3559), (3560, 3569), (3580, 3589), (3590, 3599)],
+    'ElcEq': [(3600, 3600), (3610, 3613), (3620, 3629), (3640, 3649), (3660, 3660), (3690, 3692), (3699, 3699)],
+    'Autos': [(2296, 2296), (2396, 2396), (3010, 3011), (3537, 3537), (3647, 3647), (3694, 3694), (3700, 3700), (3710, 3716), (3792, 3792), (3790, 3791), (3799, 3799)],
+    'Aero': [(3720, 3729)],
+    'Ships': [(3730, 3731), (3740, 3743)],
+    'Guns': [(3760, 3769), (3795, 3795), (3480, 3489)],
+    'Gold': [(1040, 1049)],
+    'Mines': [(1000, 1009), (1010, 1019), (1020, 1029), (1030, 1039), (1050, 1059), (1060, 1069), (1070, 1079), (1080, 1089), (1090, 1099), (1100, 1119), (1400, 1499)],
+    'Coal': [(1200, 1299)],
+    'Oil': [(1300, 1300), (1310, 1319), (1320, 1329), (1330, 1339), (1370, 1379), (1380, 1389), (2900, 2912), (2990, 2999)],
+    'Util': [(4900, 4900), (4910, 4911), (4920, 4925), (4930, 4939), (4940, 4942)],
+    'Telcm': [(4800, 4800), (4810, 4813), (4820, 4822), (4830, 4839), (4840, 4841), (4880, 4889), (4890, 4899)],
+    'PerSv': [(7020, 7021), (7030, 7033), (7200, 7200), (7210, 7219), (7220, 7221), (7230, 7231), (7240, 7241), (7250, 7251), (7260, 7269), (7270, 7299), (7395, 7395), (7500, 7500), (7520, 7529), (7530, 7539), (7540, 7549), (7600, 7600), (7620, 7629), (7630, 7631), (7640, 7641), (7690, 7699), (8100, 8199), (8200, 8299), (8300, 8399), (8400, 8499), (8600, 8699), (8800, 8899), (7510, 7515)],
+    'BusSv': [(2750, 2759), (3993, 3993), (7218, 7218), (7300, 7300), (7310, 7319), (7320, 7329), (7330, 7339), (7340, 7349), (7350, 7359), (7360, 7369), (7374, 7374), (7376, 7376), (7377, 7377), (7378, 7378), (7379, 7379), (7380, 7389), (7391, 7391), (7392, 7392), (7393, 7393), (7394, 7394), (7396, 7396), (7397, 7397), (7399, 7399), (7519, 7519), (8700, 8700), (8710, 8713), (8720, 8721), (8730, 8734), (8740, 8748), (8900, 8910), (8911, 8911), (8920, 8999), (4220, 4229)],
+    'Hardw': [(3570, 3579), (3680, 3689), (3695, 3695)],
+    'Softw': [(7370, 7372), (7375, 7375), (7373, 7373)],
+    'Chips': [(3622, 3622), (3661, 3669), (3670, 3679), (3810, 3810), (3812, 3812)],
+    'LabEq': [(3811, 3811), (3820, 3829), (3830, 3839)],
+    'Paper': [(2520, 2549), (2600, 2639), (2670, 2699), (2760, 2761), (3950, 3955)],
+    'Boxes': [(2440, 2449), (2640, 2659), (3220, 3221), (3410, 3412)],
+    'Trans': [(4000, 4013), (4040, 4049), (4100, 4100), (4110, 4119), (4120, 4121), (4130, 4131), (4140, 4142), (4150, 4151), (4170, 4173), (4190, 4199), (4200, 4200), (4210, 4219), (4230, 4231), (4240, 4249), (4400, 4499), (4500, 4599), (4600, 4699), (4700, 4700), (4710, 4712), (4720, 4729), (4730, 4739), (4740, 4749), (4780, 4780), (4782, 4782), (4783, 4783), (4784, 4784), (4785, 4785), (4789, 4789)],
+    'Whlsl': [(5000, 5000), (5010, 5015), (5020, 5023), (5030, 5039), (5040, 5049), (5050, 5059), (5060, 5065), (5070, 5088), (5090, 5099), (5100, 5100), (5110, 5113), (5120, 5122), (5130, 5139), (5140, 5149), (5150, 5159), (5160, 5169), (5170, 5172), (5180, 5182), (5190, 5199)],
+    'Rtail': [(5200, 5200), (5210, 5219), (5220, 5229), (5230, 5231), (5250, 5251), (5260, 5261), (5270, 5271), (5300, 5300), (5310, 5311), (5320, 5320), (5330, 5331), (5334, 5334), (5340, 5349), (5390, 5399), (5400, 5400), (5410, 5412), (5420, 5429), (5430, 5439), (5440, 5449), (5450, 5459), (5460, 5469), (5490, 5499), (5500, 5500), (5510, 5599), (5600, 5699), (5700, 5700), (5710, 5719), (5720, 5722), (5730, 5736), (5750, 5799), (5900, 5900), (5910, 5912), (5920, 5929), (5930, 5932), (5940, 5949), (5950, 5959), (5960, 5969), (5970, 5979), (5980, 5989), (5990, 5999)],
+    'Meals': [(5800, 5819), (5820, 5829), (5890, 5899), (7000, 7000), (7010, 7019), (7040, 7049), (7213, 7213)],
+    'Banks': [(6000, 6000), (6010, 6019), (6020, 6029), (6030, 6036), (6040, 6059), (6060, 6062), (6080, 6082), (6090, 6099)],
+    'Insur': [(6300, 6300), (6310, 6319), (6320, 6329), (6330, 6331), (6350, 6351), (6360, 6361), (6370, 6379), (6390, 6399), (6400, 6411)],
+    'RlEst': [(6500, 6500), (6510, 6519), (6520, 6529), (6530, 6532), (6540, 6541), (6550, 6553), (6590, 6599), (6610, 6611)],
+    'Fin': [(6200, 6299), (6700, 6700), (6710, 6719), (6720, 6726), (6730, 6733), (6740, 6779), (6790, 6799)],
+    'Other': [(4950, 4959), (4960, 4961), (4970, 4971), (4990, 4991)]
+}
+
+class IndustryClassifier:
+    """
+    A classification scheme compiled into a SIC-code lookup array.
+
+    Parameters:
+    portfolios (dict): Industry name -> list of inclusive (start, end) SIC ranges.
+    other (str): Label for valid SIC codes that match no range.
+    invalid (str): Label for SIC codes that are missing or not numeric.
+
+    Attributes:
+    labels (list): Category labels; industry codes index into this list.
+    lookup (np.ndarray): Industry code for each SIC code 0-9999.
+    """
+
+    def __init__(self, portfolios, other="Other", invalid="Other"):
+        labels = list(portfolios)
+        for label in (other, invalid):
+            if label not in labels:
+                labels.append(label)
+
+        lookup = np.full(N_SIC_CODES, UNASSIGNED, dtype=np.int16)
+        for code, ranges in enumerate(portfolios.values()):
+            for start, end in ranges:
+                block = lookup[start:end + 1]
+                block[block == UNASSIGNED] = code  # first match wins
+        lookup[lookup == UNASSIGNED] = labels.index(other)
+        self._set_lookup(lookup, labels, other, invalid)
+
+    def _set_lookup(self, lookup, labels, other, invalid):
+        self.lookup = lookup
+        self.labels = labels
+        self.other = other
+        self.invalid = invalid
+        self.other_code = labels.index(other)
+        self.invalid_code = labels.index(invalid)
+
+    @classmethod
+    def from_lookup(cls, lookup, labels, other="Other", invalid="Other"):
+        """Rebuild a classifier from a compiled lookup array."""
+        classifier = cls.__new__(cls)
+        classifier._set_lookup(
+            np.asarray(lookup, dtype=np.int16), list(labels), other, invalid
+        )
+        return classifier
+
+    def save(self, path):
+        """Save the compiled lookup array and labels to an `.npz` file."""
+        np.savez(
+            path,
+            lookup=self.lookup,
+            labels=np.array(self.labels),
+            other=self.other,
+            invalid=self.invalid,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a classifier saved with `save`."""
+        with np.load(path) as data:
+            return cls.from_lookup(
+                data["lookup"],
+                data["labels"].tolist(),
+                str(data["other"]),
+                str(data["invalid"]),
+            )
+
+    def codes(self, siccd):
+        """Industry codes (indices into `labels`) for an array of SIC codes."""
+        sic = pd.to_numeric(pd.Series(np.asarray(siccd).ravel()), errors="coerce").to_numpy(
+            dtype=float
+        )
+        valid = np.isfinite(sic)
+        sic = np.trunc(np.where(valid, sic, -1))
+        in_range = valid & (sic >= 0) & (sic < N_SIC_CODES)
+
+        codes = np.full(len(sic), self.other_code, dtype=np.int16)
+        codes[in_range] = self.lookup[sic[in_range].astype(np.int64)]
+        codes[~valid] = self.invalid_code
+        return codes
+
+    def classify(self, siccd):
+        """
+        Map a column of SIC codes to a categorical column of industry labels.
+
+        A Series input keeps its index.
+        """
+        values = pd.Categorical.from_codes(self.codes(siccd), categories=self.labels)
+        index = siccd.index if isinstance(siccd, pd.Series) else None
+        return pd.Series(values, index=index)
+
+    def classify_one(self, sic_code):
+        """Industry label for a single SIC code."""
+        return self.labels[self.codes([sic_code])[0]]
+
+
+INDUSTRY5 = IndustryClassifier(INDUSTRY5_PORTFOLIOS, other="Other", invalid="Other")
+INDUSTRY49 = IndustryClassifier(
+    INDUSTRY49_PORTFOLIOS, other="Other", invalid="Invalid SIC Code"
+)
+
+
+def classify_industry5(siccd):
+    """Fama-French 5-industry categorical column for a column of SIC codes."""
+    return classify_industry(siccd, 5)
+
+
+def classify_industry49(siccd):
+    """Fama-French 49-industry categorical column for a column of SIC codes."""
+    return classify_industry(siccd, 49)
+
+
+def resolve_sic(
+    panel, comp, date_col="date", gvkey_col="gvkey", sic_col="siccd", lag_months=COMPUSTAT_LAG_MONTHS
+):
+    """
+    SIC code for every row of a permno-month panel, preferring Compustat
+    historical SIC (`sich`) and falling back to CRSP `siccd`.
+
+    Each row is matched to the latest Compustat fiscal year of its linked
+    gvkey whose `datadate` is at least `lag_months` months before the row's
+    date. Rows with no gvkey, no earlier fiscal year, or a missing `sich` in
+    that fiscal year keep `siccd`.
+
+    The as-of join is a single `searchsorted` of the panel's (gvkey, month)
+    keys into the sorted Compustat keys, so the panel itself is never sorted.
+
+    Parameters:
+    panel (pd.DataFrame): Panel with `date_col`, `gvkey_col` and `sic_col`.
+    comp (pd.DataFrame): Compustat annual data with `gvkey`, `datadate` and `sich`.
+    lag_months (int): Months after `datadate` before `sich` is used; by
+        default the reporting lag of the other Compustat data.
+
+    Returns:
+    pd.Series: SIC codes (float, NaN if unknown), aligned with `panel`.
+    """
+    sic = pd.to_numeric(panel[sic_col], errors="coerce").to_numpy(dtype=float, copy=True)
+
+    has_gvkey = panel[gvkey_col].notna().to_numpy()
+    right = comp.loc[comp["gvkey"].notna() & comp["datadate"].notna(), ["gvkey", "datadate", "sich"]]
+    right = right.sort_values("datadate", kind="stable")
+
+    # integer gvkey codes shared by both sides, combined with the month index
+    # into one sortable int64 key
+    codes, _ = pd.factorize(
+        np.concatenate([panel[gvkey_col].to_numpy()[has_gvkey], right["gvkey"].to_numpy()])
+    )
+    n_left = int(has_gvkey.sum())
+    stride = np.int64(1 << 24)
+    left_key = codes[:n_left] * stride + month_index(panel[date_col])[has_gvkey]
+    right_key = codes[n_left:] * stride + month_index(right["datadate"]) + lag_months
+
+    # latest fiscal year per (gvkey, month), then sort the keys
+    order = np.argsort(right_key, kind="stable")
+    right_key = right_key[order]
+    right_sich = pd.to_numeric(right["sich"], errors="coerce").to_numpy(dtype=float)[order]
+    last = np.append(right_key[1:] != right_key[:-1], True)
+    right_key, right_sich = right_key[last], right_sich[last]
+
+    pos = np.searchsorted(right_key, left_key, side="right") - 1
+    found = pos >= 0
+    found[found] = right_key[pos[found]] // stride == left_key[found] // stride
+    sich = np.full(n_left, np.nan)
+    sich[found] = right_sich[pos[found]]
+
+    use = ~np.isnan(sich)
+    sic[np.flatnonzero(has_gvkey)[use]] = sich[use]
+    return pd.Series(sic, index=panel.index, name="sic")
+
+
+########################################################################################
+## Ken French Siccodes files
+########################################################################################
+
+_HEADER = re.compile(r"^\s*(\d{1,2})\s+(\S+)")
+_RANGE = re.compile(r"^\s*(\d{4})-(\d{4})")
+
+
+def parse_siccodes(text):
+    """
+    Parse a Ken French `Siccodes{n}.txt` definition file.
+
+    Industry lines start with the industry number and short name
+    (` 1 Agric  Agriculture`); the lines that follow list its SIC ranges
+    (`          0100-0199 Agricultural production - crops`). Blank lines and
+    lines starting with `#` are ignored.
+
+    Parameters:
+    text (str or Path): The file contents, or a path to the file.
+
+    Returns:
+    dict: Industry short name -> list of inclusive (start, end) SIC ranges,
+    in file order.
+    """
+    if isinstance(text, Path):
+        text = text.read_text(encoding="latin-1")
+    portfolios = {}
+    current = None
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        match = _RANGE.match(line)
+        if match:
+            if current is None:
+                raise ValueError(f"SIC range before any industry: {line!r}")
+            portfolios[current].append((int(match.group(1)), int(match.group(2))))
+            continue
+        match = _HEADER.match(line)
+        if not match:
+            raise ValueError(f"Cannot parse Siccodes line: {line!r}")
+        current = match.group(2)
+        portfolios.setdefault(current, [])
+    return portfolios
+
+
+def format_siccodes(portfolios, header=None):
+    """Write industry ranges in the `Siccodes{n}.txt` layout read by `parse_siccodes`."""
+    lines = [f"# {line}" for line in (header or "").splitlines()]
+    for number, (name, ranges) in enumerate(portfolios.items(), start=1):
+        lines.append(f"{number:>2} {name:<6} {name}")
+        lines.extend(f"          {start:04d}-{end:04d}" for start, end in ranges)
+    return "\n".join(lines) + "\n"
+
+
+def siccodes_path(n):
+    """Path of the definition file for the `n`-industry scheme."""
+    for directory in (VENDORED_SICCODES_DIR, PULLED_SICCODES_DIR):
+        path = Path(directory) / f"Siccodes{n}.txt"
+        if path.exists():
+            return path
+    raise FileNotFoundError(
+        f"Siccodes{n}.txt not found in {VENDORED_SICCODES_DIR} or "
+        f"{PULLED_SICCODES_DIR}. Run `python src/industry_classification.py` "
+        f"to vendor the definition files of every scheme."
+    )
+
+
+def download_siccodes(n, dest_dir=PULLED_SICCODES_DIR):
+    """Download and extract `Siccodes{n}.txt` from the Ken French Data Library."""
+    import requests
+
+    response = requests.get(SICCODES_URL.format(n=n), timeout=60)
+    response.raise_for_status()
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
+        name = next(f for f in zip_ref.namelist() if f.lower().endswith(".txt"))
+        text = zip_ref.read(name).decode("latin-1")
+    path = dest_dir / f"Siccodes{n}.txt"
+    path.write_text(text, encoding="latin-1")
+    return path
+
+
+def vendor_siccodes(schemes=FAMA_FRENCH_SCHEMES):
+    """
+    Download the definition files of `schemes` into `assets/siccodes`, so
+    that every scheme can be loaded without network access. Returns the paths.
+    """
+    return [download_siccodes(n, dest_dir=VENDORED_SICCODES_DIR) for n in schemes]
+
+
+def unofficial_siccodes(schemes=FAMA_FRENCH_SCHEMES):
+    """
+    Schemes whose vendored definition file is missing, or was generated by
+    `format_siccodes` instead of taken from the Ken French Data Library.
+    """
+    unofficial = []
+    for n in schemes:
+        path = Path(VENDORED_SICCODES_DIR) / f"Siccodes{n}.txt"
+        if not path.exists() or GENERATED_SICCODES_MARKER in path.read_text(encoding="latin-1")[:200]:
+            unofficial.append(n)
+    return unofficial
+
+
+_CLASSIFIERS = {}
+_SCHEMES = {}
+
+
+def load_classifier(n, cache_dir=CACHE_DIR):
+    """
+    Compiled classifier for the Fama-French `n`-industry scheme.
+
+    The lookup array is cached in `cache_dir`, keyed by a hash of the
+    definition file so that an edited file is recompiled. Pass
+    `cache_dir=None` to skip the disk cache.
+    """
+    text = siccodes_path(n).read_text(encoding="latin-1")
+    digest = hashlib.sha1(text.encode("latin-1")).hexdigest()[:12]
+    key = (n, digest)
+    cache_path = None if cache_dir is None else Path(cache_dir) / f"siccodes{n}_{digest}.npz"
+    classifier = _CLASSIFIERS.get(key)
+    if classifier is None and cache_path is not None and cache_path.exists():
+        classifier = IndustryClassifier.load(cache_path)
+    if classifier is None:
+        classifier = IndustryClassifier(
+            parse_siccodes(text), other="Other", invalid=INVALID_LABELS.get(n, "Other")
+        )
+    if cache_path is not None and not cache_path.exists():
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        classifier.save(cache_path)
+    _CLASSIFIERS[key] = classifier
+    return classifier
+
+
+def get_classifier(n):
+    """
+    Classifier for the Fama-French `n`-industry scheme, compiled from its
+    `Siccodes{n}.txt` file by `load_classifier(n)` for every scheme.
+    """
+    if n not in FAMA_FRENCH_SCHEMES:
+        raise ValueError(f"n must be one of {FAMA_FRENCH_SCHEMES}, not {n!r}")
+    # loaded once per process: row-wise callers (`classify_one`) do not re-read the file
+    if n not in _SCHEMES:
+        _SCHEMES[n] = load_classifier(n)
+    return _SCHEMES[n]
+
+
+def classify_industry(siccd, n):
+    """Fama-French `n`-industry categorical column for a column of SIC codes."""
+    return get_classifier(n).classify(siccd)
+
+
+if __name__ == "__main__":
+    for path in vendor_siccodes():
+        print(f"Vendored {path}")
+    missing = unofficial_siccodes()
+    if missing:
+        print(f"No official Siccodes file for the schemes {missing}")
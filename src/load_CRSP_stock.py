@@ -140,6 +140,31 @@ def pull_CRSP_index_files(
     return df
 
 
+def pull_CRSP_daily_file(year, wrds_username=WRDS_USERNAME):
+    """
+    Pulls one calendar year of daily CRSP stock returns.
+
+    Daily data is pulled and stored one year at a time so that neither the
+    pull nor the daily portfolio engine (see `daily_portfolios.py`) has to
+    hold more than a year of daily data in memory. The share code filter
+    matches `pull_CRSP_monthly_file`.
+    """
+    query = f"""
+        SELECT dsf.permno, dsf.date, dsf.ret, dsf.retx, dsf.prc, dsf.shrout
+        FROM crsp.dsf AS dsf
+        LEFT JOIN crsp.dsenames AS dsenames
+        ON dsf.permno = dsenames.permno AND
+        dsenames.namedt <= dsf.date AND
+        dsf.date <= dsenames.nameendt
+        WHERE dsf.date BETWEEN '{year}-01-01' AND '{year}-12-31'
+            AND dsenames.shrcd IN (10, 11)
+    """
+    with wrds.Connection(wrds_username=wrds_username) as db:
+        df = db.raw_sql(query, date_cols=["date"])
+    df["shrout"] = df["shrout"] * 1000
+    return df
+
+
 def load_CRSP_monthly_file(data_dir=DATA_DIR):
     path = Path(data_dir) / "pulled" / "CRSP_MSF_INDEX_INPUTS.parquet"
     df = pd.read_parquet(path)
@@ -152,6 +177,12 @@ def load_CRSP_index_files(data_dir=DATA_DIR):
     return df
 
 
+def load_CRSP_daily_file(year, data_dir=DATA_DIR):
+    path = Path(data_dir) / "pulled" / "CRSP_DSF" / f"{year}.parquet"
+    df = pd.read_parquet(path)
+    return df
+
+
 def _demo():
     df_msf = load_CRSP_monthly_file(data_dir=DATA_DIR)
     df_msix = load_CRSP_index_files(data_dir=DATA_DIR)
@@ -166,3 +197,10 @@ if __name__ == "__main__":
     df_msix = pull_CRSP_index_files(start_date=START_DATE, end_date=END_DATE)
     path = Path(DATA_DIR) / "pulled" / f"CRSP_MSIX.parquet"
     df_msix.to_parquet(path)
+
+    # Daily stock file, one parquet file per year
+    daily_dir = Path(DATA_DIR) / "pulled" / "CRSP_DSF"
+    daily_dir.mkdir(parents=True, exist_ok=True)
+    for year in range(int(START_DATE[:4]), int(END_DATE[:4]) + 1):
+        df_dsf = pull_CRSP_daily_file(year)
+        df_dsf.to_parquet(daily_dir / f"{year}.parquet")
@@ -0,0 +1,121 @@
+"""
+Integer month index used for all date arithmetic in the portfolio pipeline.
+
+Every CRSP/Compustat observation is mapped once to a single integer,
+
+    month index = 12 * year + (month - 1),
+
+so that month lags, the July-to-June Fama-French year and the June
+formation date of an annual report become plain integer arithmetic instead
+of `MonthEnd`/`YearEnd` offsets and `.dt` accessors. The month index fits
+comfortably in an int32 and is used as the join key between CRSP and
+Compustat. Datetime columns are only rebuilt (with `month_index_to_date`)
+when results are written out.
+
+Functions:
+- month_index(dates): Integer month index of a datetime-like column.
+- month_index_to_date(mi): Month-end timestamps for an integer month index.
+- month_index_to_yyyymm(mi): `yyyymm` integers, the format used in Ken French's files.
+- year_of(mi), month_of(mi): Calendar year and month (1-12) of a month index.
+- ff_year(mi), ff_month(mi): Fama-French July-to-June year and month (July = 1).
+- june_formation_month(mi): Month index of the first June after the year end of `mi`.
+- add_month_index_columns(df, date_col): Adds `mdate`, `year`, `month`, `ffyear` and `ffmonth`.
+"""
+import numpy as np
+import pandas as pd
+
+
+MONTH_INDEX_DTYPE = np.int32
+
+
+def month_index(dates):
+    """
+    Integer month index (12 * year + month - 1) of a datetime-like array.
+
+    Parameters:
+    dates (Series or array-like): Dates to convert. Missing dates are not allowed.
+
+    Returns:
+    ndarray: int32 month index, one entry per date.
+    """
+    dates = pd.DatetimeIndex(dates)
+    if dates.hasnans:
+        raise ValueError("month_index requires non-missing dates")
+    months = dates.values.astype("datetime64[M]").astype(np.int64)
+    # datetime64[M] counts months since 1970-01
+    return (months + 12 * 1970).astype(MONTH_INDEX_DTYPE)
+
+
+def month_index_to_date(mi):
+    """
+    Month-end timestamps for an integer month index.
+
+    This is the same date that `date + MonthEnd(0)` produces, i.e. the `jdate`
+    convention used throughout the project.
+    """
+    mi = np.asarray(mi, dtype=np.int64)
+    first_of_next = (mi + 1 - 12 * 1970).astype("datetime64[M]").astype("datetime64[ns]")
+    return pd.DatetimeIndex(first_of_next - np.timedelta64(1, "D"))
+
+
+def month_index_to_yyyymm(mi):
+    """Convert a month index to `yyyymm` integers."""
+    mi = np.asarray(mi, dtype=np.int64)
+    return (mi // 12) * 100 + (mi % 12) + 1
+
+
+def year_of(mi):
+    """Calendar year of a month index."""
+    return np.asarray(mi) // 12
+
+
+def month_of(mi):
+    """Calendar month (1-12) of a month index."""
+    return np.asarray(mi) % 12 + 1
+
+
+def ff_year(mi):
+    """
+    Fama-French year of a month index.
+
+    Returns from July of year t to June of year t+1 belong to ffyear t. This is
+    the integer version of `(date + MonthEnd(-6)).dt.year`.
+    """
+    return (np.asarray(mi) - 6) // 12
+
+
+def ff_month(mi):
+    """
+    Month within the Fama-French year (July = 1, ..., June = 12).
+
+    This is the integer version of `(date + MonthEnd(-6)).dt.month`.
+    """
+    return (np.asarray(mi) - 6) % 12 + 1
+
+
+def june_formation_month(mi):
+    """
+    Month index of June of the year after the calendar year of `mi`.
+
+    Accounting data for a fiscal year ending in calendar year t-1 is used for
+    portfolios formed at the end of June of year t. This is the integer
+    version of `datadate + YearEnd(0) + MonthEnd(6)`.
+    """
+    return (year_of(mi) + 1) * 12 + 5
+
+
+def add_month_index_columns(df, date_col="date"):
+    """
+    Compute the integer month index once per row and derive the calendar and
+    Fama-French year/month columns from it.
+
+    Adds the columns `mdate` (int32 month index), `year`, `month`, `ffyear`
+    and `ffmonth` to `df` in place and returns it.
+    """
+    mi = month_index(df[date_col])
+    df["mdate"] = mi
+    df["year"] = year_of(mi)
+    df["month"] = month_of(mi)
+    df["ffyear"] = ff_year(mi)
+    df["ffmonth"] = ff_month(mi)
+    return df
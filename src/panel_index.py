@@ -0,0 +1,214 @@
+"""
+Offset index over a (permno, month)-sorted stock panel.
+
+Most of the per-stock work in the pipeline (`groupby('permno').shift`,
+`cumcount`, compounding returns within a stock) regroups the same sorted
+panel over and over, hashing the `permno` keys on every call. `PanelIndex`
+is built once over a panel sorted by (permno, mdate) and stores, in
+compressed sparse row (CSR) form,
+
+- the start/end row offsets of every permno segment, and
+- a stable ordering of the rows by month together with the start/end
+  offsets of every month segment within that ordering.
+
+Grouped operations and lookups then work directly on these offsets. The
+index only depends on the two key columns, so it can be saved next to the
+panel with `save` and reloaded with `PanelIndex.load`.
+
+Example:
+>>> crsp = crsp.sort_values(["permno", "mdate"])
+>>> idx = PanelIndex.from_frame(crsp, id_col="permno", time_col="mdate")
+>>> crsp["L_me"] = idx.shift(crsp["me"].values)
+>>> crsp.iloc[idx.rows_for_id(10001)]
+"""
+from pathlib import Path
+
+import numpy as np
+
+
+class PanelIndex:
+    """
+    CSR-style index of a panel sorted by (id, time).
+
+    Attributes:
+    ids (ndarray): Sorted unique ids (e.g. permnos).
+    id_offsets (ndarray): Row offsets of the id segments; rows of `ids[k]`
+        are `id_offsets[k]:id_offsets[k+1]`.
+    times (ndarray): Sorted unique time keys (e.g. integer month index).
+    time_order (ndarray): Row numbers of the panel ordered (stably) by time.
+    time_offsets (ndarray): Offsets into `time_order`; rows of `times[k]` are
+        `time_order[time_offsets[k]:time_offsets[k+1]]`.
+    row_time (ndarray): Time key of every row, in panel order.
+    """
+
+    def __init__(self, ids, id_offsets, times, time_order, time_offsets, row_time):
+        self.ids = np.asarray(ids)
+        self.id_offsets = np.asarray(id_offsets, dtype=np.int64)
+        self.times = np.asarray(times)
+        self.time_order = np.asarray(time_order, dtype=np.int64)
+        self.time_offsets = np.asarray(time_offsets, dtype=np.int64)
+        self.row_time = np.asarray(row_time)
+
+    @classmethod
+    def from_arrays(cls, row_id, row_time):
+        """
+        Build the index from the id and time keys of a sorted panel.
+
+        Raises ValueError if the rows are not sorted by (id, time).
+        """
+        row_id = np.asarray(row_id)
+        row_time = np.asarray(row_time)
+        n = len(row_id)
+
+        new_id = np.ones(n, dtype=bool)
+        new_id[1:] = row_id[1:] != row_id[:-1]
+        if n > 1:
+            id_decreases = row_id[1:] < row_id[:-1]
+            time_decreases = (~new_id[1:]) & (row_time[1:] < row_time[:-1])
+            if id_decreases.any() or time_decreases.any():
+                raise ValueError("panel must be sorted by (id, time) before indexing")
+
+        starts = np.flatnonzero(new_id)
+        ids = row_id[starts]
+        id_offsets = np.append(starts, n)
+
+        time_order = np.argsort(row_time, kind="stable")
+        sorted_time = row_time[time_order]
+        new_time = np.ones(n, dtype=bool)
+        new_time[1:] = sorted_time[1:] != sorted_time[:-1]
+        time_starts = np.flatnonzero(new_time)
+        times = sorted_time[time_starts]
+        time_offsets = np.append(time_starts, n)
+
+        return cls(ids, id_offsets, times, time_order, time_offsets, row_time)
+
+    @classmethod
+    def from_frame(cls, df, id_col="permno", time_col="mdate"):
+        """Build the index from a DataFrame sorted by (`id_col`, `time_col`)."""
+        return cls.from_arrays(df[id_col].values, df[time_col].values)
+
+    def __len__(self):
+        return int(self.id_offsets[-1])
+
+    def __repr__(self):
+        return (
+            f"PanelIndex(rows={len(self)}, ids={self.n_ids}, times={self.n_times})"
+        )
+
+    @property
+    def n_ids(self):
+        return len(self.ids)
+
+    @property
+    def n_times(self):
+        return len(self.times)
+
+    @property
+    def id_starts(self):
+        return self.id_offsets[:-1]
+
+    @property
+    def id_ends(self):
+        return self.id_offsets[1:]
+
+    @property
+    def id_sizes(self):
+        return np.diff(self.id_offsets)
+
+    def segment_ids(self):
+        """Position (0, ..., n_ids-1) of the id segment of every row."""
+        return np.repeat(np.arange(self.n_ids), self.id_sizes)
+
+    def segment_starts(self):
+        """Start offset of the id segment of every row."""
+        return np.repeat(self.id_starts, self.id_sizes)
+
+    def cumcount(self):
+        """Position of every row within its id segment, like `groupby(id).cumcount()`."""
+        return np.arange(len(self)) - self.segment_starts()
+
+    def is_first(self):
+        """Boolean mask of the first row of every id segment."""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.id_starts] = True
+        return mask
+
+    def shift(self, values, periods=1, fill_value=np.nan):
+        """
+        Shift `values` by `periods` rows within each id segment, like
+        `groupby(id).shift(periods)`. Positions without a lag are set to
+        `fill_value`.
+        """
+        values = np.asarray(values)
+        n = len(self)
+        if values.dtype.kind in "iub":
+            values = values.astype(np.float64)
+        out = np.full(n, fill_value, dtype=values.dtype)
+        if periods == 0:
+            out[:] = values
+            return out
+        pos = self.cumcount()
+        if periods > 0:
+            valid = pos >= periods
+            src = np.flatnonzero(valid) - periods
+        else:
+            remaining = np.repeat(self.id_sizes, self.id_sizes) - pos - 1
+            valid = remaining >= -periods
+            src = np.flatnonzero(valid) - periods
+        out[valid] = values[src]
+        return out
+
+    def id_position(self, id_value):
+        """Position of `id_value` in `ids`, or -1 if the id is not in the panel."""
+        k = np.searchsorted(self.ids, id_value)
+        if k < self.n_ids and self.ids[k] == id_value:
+            return int(k)
+        return -1
+
+    def rows_for_id(self, id_value):
+        """Row slice of the panel belonging to `id_value` (empty if absent)."""
+        k = self.id_position(id_value)
+        if k < 0:
+            return slice(0, 0)
+        return slice(int(self.id_offsets[k]), int(self.id_offsets[k + 1]))
+
+    def rows_for_time(self, time_value):
+        """Row numbers of the panel observed at `time_value`, in (id) order."""
+        k = np.searchsorted(self.times, time_value)
+        if k >= self.n_times or self.times[k] != time_value:
+            return np.array([], dtype=np.int64)
+        return self.time_order[self.time_offsets[k]:self.time_offsets[k + 1]]
+
+    def time_codes(self):
+        """Position (0, ..., n_times-1) of the time key of every row."""
+        codes = np.empty(len(self), dtype=np.int64)
+        codes[self.time_order] = np.repeat(
+            np.arange(self.n_times), np.diff(self.time_offsets)
+        )
+        return codes
+
+    def save(self, path):
+        """Save the index to a compressed `.npz` file."""
+        path = Path(path)
+        np.savez_compressed(
+            path,
+            ids=self.ids,
+            id_offsets=self.id_offsets,
+            times=self.times,
+            time_order=self.time_order,
+            time_offsets=self.time_offsets,
+            row_time=self.row_time,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with `save`."""
+        with np.load(Path(path)) as data:
+            return cls(
+                data["ids"],
+                data["id_offsets"],
+                data["times"],
+                data["time_order"],
+                data["time_offsets"],
+                data["row_time"],
+            )
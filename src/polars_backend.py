@@ -0,0 +1,317 @@
+"""
+Polars implementation of the core portfolio construction stages.
+
+The pandas pipeline in `calc_univariate_portfolios`, `calc_industry_portfolios`
+and `calc_op_inv_portfolios` is single threaded. This module reimplements the
+expensive stages with the Polars lazy API so that the whole chain is planned
+and optimized as one query and executed on all cores:
+
+- subset_CRSP_to_common_stock_and_exchanges(crsp)
+- calculate_market_equity(crsp, date_col, price_col)
+- use_dec_market_equity(crsp2, flavor)
+- merge_CRSP_and_Compustat(crsp_jun, comp, ccm)
+- create_industry_portfolios(ccm4, n) and create_portfolios(...) for VW/EW returns and counts
+
+Every stage accepts a pandas DataFrame or a Polars (Lazy)Frame and returns a
+`polars.LazyFrame`, so stages can be chained without materializing
+intermediate results. `collect_to_pandas` collects one or more lazy frames
+together and returns pandas DataFrames with the same columns, in the same
+order, as the pandas implementation.
+
+The backend is selected with `PORTFOLIO_BACKEND` in `.env` (see `config.py`);
+Polars is only imported when it is selected.
+"""
+import pandas as pd
+import polars as pl
+
+
+CRSP_JUN_COLUMNS_CIZ = [
+    "permno",
+    "mthcaldt",
+    "jdate",
+    "mdate",
+    "sharetype",
+    "securitytype",
+    "securitysubtype",
+    "usincflg",
+    "issuertype",
+    "primaryexch",
+    "conditionaltype",
+    "tradingstatusflg",
+    "mthret",
+    "me",
+    "wt",
+    "cumretx",
+    "mebase",
+    "L_me",
+    "dec_me",
+]
+
+
+def _lazy(df):
+    """Return `df` as a Polars LazyFrame."""
+    if isinstance(df, pl.LazyFrame):
+        return df
+    if isinstance(df, pl.DataFrame):
+        return df.lazy()
+    return pl.from_pandas(df.reset_index(drop=True)).lazy()
+
+
+def _month_index(col):
+    """Polars expression for the integer month index (see `month_index.py`)."""
+    return (
+        pl.col(col).dt.year().cast(pl.Int32) * 12
+        + pl.col(col).dt.month().cast(pl.Int32)
+        - 1
+    )
+
+
+def collect_to_pandas(*frames):
+    """
+    Collect lazy frames in a single optimized pass and convert them to pandas.
+
+    Returns a single DataFrame if one frame is given, otherwise a list.
+    """
+    collected = pl.collect_all([_lazy(f) for f in frames])
+    out = [df.to_pandas() for df in collected]
+    return out[0] if len(out) == 1 else out
+
+
+def subset_CRSP_to_common_stock_and_exchanges(crsp):
+    """Subset to common stock universe and
+    stocks traded on NYSE, AMEX and NASDAQ.
+    """
+    return _lazy(crsp).filter(
+        (pl.col("sharetype") == "NS")
+        & (pl.col("securitytype") == "EQTY")
+        & (pl.col("securitysubtype") == "COM")
+        & (pl.col("usincflg") == "Y")
+        & pl.col("issuertype").is_in(["ACOR", "CORP"])
+        & pl.col("primaryexch").is_in(["N", "A", "Q"])
+        & (pl.col("tradingstatusflg") == "A")
+        & (pl.col("conditionaltype") == "RW")
+    )
+
+
+def calculate_market_equity(crsp, date_col="mdate", price_col="mthprc"):
+    """
+    Aggregate ME across the permnos of a permco on a given date and assign it
+    to the permno with the largest ME.
+
+    With `price_col=None` the existing `me` column is used (old SIZ format),
+    otherwise `me` is computed as `price_col * shrout` (CIZ format).
+    """
+    lf = _lazy(crsp)
+    if price_col is not None:
+        lf = lf.with_columns((pl.col(price_col) * pl.col("shrout")).alias("me"))
+    keys = [date_col, "permco"]
+    return (
+        lf.with_columns(
+            pl.col("me").sum().over(keys).alias("_sum_me"),
+            pl.col("me").max().over(keys).alias("_max_me"),
+        )
+        .filter(pl.col("me") == pl.col("_max_me"))
+        .drop(["me", "_max_me"])
+        .rename({"_sum_me": "me"})
+        .sort(["permno", date_col])
+        .unique(keep="first", maintain_order=True)
+    )
+
+
+def use_dec_market_equity(crsp2, flavor="ciz"):
+    """
+    Polars version of `use_dec_market_equity`.
+
+    `flavor="ciz"` follows `calc_univariate_portfolios` (dates in `jdate`,
+    returns in `mthretx`); `flavor="siz"` follows `calc_industry_portfolios`
+    and `calc_op_inv_portfolios` (dates in `date`, returns in `retx`).
+
+    Returns the lazy frames (crsp3, crsp_jun).
+    """
+    if flavor == "ciz":
+        date_col, retx_col, sort_col, dec_shift = "jdate", "mthretx", "mthcaldt", -1
+    elif flavor == "siz":
+        date_col, retx_col, sort_col, dec_shift = "date", "retx", "mdate", 1
+    else:
+        raise ValueError(f"unknown flavor {flavor!r}")
+
+    lf = _lazy(crsp2).with_columns(_month_index(date_col).alias("mdate"))
+    lf = lf.with_columns(
+        (pl.col("mdate") // 12).alias("year"),
+        (pl.col("mdate") % 12 + 1).alias("month"),
+        ((pl.col("mdate") - 6) // 12).alias("ffyear"),
+        ((pl.col("mdate") - 6) % 12 + 1).alias("ffmonth"),
+    )
+
+    decme = lf.filter(pl.col("month") == 12).select(
+        "permno",
+        (pl.col("year") + dec_shift).alias("year"),
+        pl.col("me").alias("dec_me"),
+    )
+
+    lf = (
+        lf.with_columns((1 + pl.col(retx_col)).alias("1+retx"))
+        .sort(["permno", sort_col])
+        .with_columns(
+            pl.col("1+retx").cumprod().over(["permno", "ffyear"]).alias("cumretx")
+        )
+        .with_columns(
+            pl.col("cumretx").shift(1).over("permno").alias("L_cumretx"),
+            pl.col("me").shift(1).over("permno").alias("L_me"),
+            pl.col("permno").cumcount().over("permno").cast(pl.Int64).alias("count"),
+        )
+        .with_columns(
+            pl.when(pl.col("count") == 0)
+            .then(pl.col("me") / pl.col("1+retx"))
+            .otherwise(pl.col("L_me"))
+            .alias("L_me")
+        )
+    )
+
+    mebase = lf.filter(pl.col("ffmonth") == 1).select(
+        "permno", "ffyear", pl.col("L_me").alias("mebase")
+    )
+    crsp3 = lf.join(mebase, on=["permno", "ffyear"], how="left").with_columns(
+        pl.when(pl.col("ffmonth") == 1)
+        .then(pl.col("L_me"))
+        .otherwise(pl.col("mebase") * pl.col("L_cumretx"))
+        .alias("wt")
+    )
+
+    crsp_jun = crsp3.filter(pl.col("month") == 6).join(
+        decme, on=["permno", "year"], how="inner"
+    )
+    if flavor == "ciz":
+        crsp_jun = crsp_jun.select(CRSP_JUN_COLUMNS_CIZ).sort(["permno", "jdate"])
+    else:
+        crsp_jun = crsp_jun.sort(["permno", "month"])
+    crsp_jun = crsp_jun.unique(keep="first", maintain_order=True)
+    return crsp3, crsp_jun
+
+
+def merge_CRSP_and_Compustat(crsp_jun, comp, ccm):
+    """
+    Link the June CRSP panel to the Compustat fiscal year ending in the
+    previous calendar year and compute E/P and CF/P.
+
+    Returns the lazy frames (ccm_jun, ccm1).
+    """
+    ccm = _lazy(ccm).with_columns(
+        pl.col("linkenddt").fill_null(pd.to_datetime("today"))
+    )
+
+    ccm1 = _lazy(comp).join(ccm, on="gvkey", how="left").with_columns(
+        ((pl.col("datadate").dt.year().cast(pl.Int32) + 1) * 12 + 5).alias("mdate")
+    )
+    link_start = _month_index("linkdt")
+    link_end = (
+        (pl.col("linkenddt") + pl.duration(days=1)).dt.year().cast(pl.Int32) * 12
+        + (pl.col("linkenddt") + pl.duration(days=1)).dt.month().cast(pl.Int32)
+        - 1
+    )
+    ccm2 = ccm1.filter(
+        pl.col("linkdt").is_not_null()
+        & (pl.col("mdate") >= link_start)
+        & (pl.col("mdate") < link_end)
+    )
+
+    ccm_jun = (
+        _lazy(crsp_jun)
+        .join(ccm2, on=["permno", "mdate"], how="inner")
+        .with_columns((pl.col("ni") * 1000 / pl.col("dec_me")).alias("ep"))
+        .with_columns(
+            (
+                pl.col("ebit")
+                + pl.col("dp").fill_null(0)
+                + pl.col("txditc").fill_null(0)
+            ).alias("cf")
+        )
+        .with_columns((pl.col("cf") / pl.col("dec_me")).alias("cfp"))
+    )
+    return ccm_jun, ccm1
+
+
+def _return_aggs(ret_col, weight_col):
+    """
+    VW return, EW return and firm count expressions, with the missing values
+    of `portfolio_aggregation.stats_from_sums`: the VW numerator and
+    denominator skip rows without a return or weight; the EW return averages
+    the rows with a return; both are missing when the cell has no return (and
+    the VW return when its weights sum to 0).
+    """
+    n_ret = pl.col(ret_col).is_not_null().sum()
+    sum_w = pl.col(weight_col).filter(pl.col(ret_col).is_not_null()).sum()
+    vwret = (
+        pl.when((n_ret > 0) & (sum_w != 0))
+        .then((pl.col(ret_col) * pl.col(weight_col)).sum() / sum_w)
+        .otherwise(None)
+    )
+    ewret = pl.when(n_ret > 0).then(pl.col(ret_col).sum() / n_ret).otherwise(None)
+    return vwret, ewret, n_ret.cast(pl.Int64)
+
+
+def create_portfolios(df, date_col, port_cols, ret_col, me_col):
+    """
+    Value-weighted returns, equal-weighted returns and firm counts by
+    (`date_col`, `port_cols`) in one grouped pass.
+
+    VW returns weight `ret_col` by `me_col` normalized within each portfolio;
+    EW returns weight every stock with a return equally (see `_return_aggs`).
+    Rows with a missing portfolio are dropped, like a pandas groupby.
+    """
+    keys = [date_col, *port_cols]
+    vwret, ewret, n_firms = _return_aggs(ret_col, me_col)
+    return (
+        _lazy(df)
+        .drop_nulls(port_cols)
+        .group_by(keys)
+        .agg(
+            vwret.alias("value_weighted_ret"),
+            ewret.alias("equal_weighted_ret"),
+            n_firms.alias("n_firms"),
+        )
+        .sort(keys)
+    )
+
+
+def create_industry_portfolios(ccm4, n, size_col=None):
+    """Polars version of `calc_industry_portfolios.create_industry_portfolios`.
+
+    Returns the lazy frames (vwret, vwret_n) with the same layout as the
+    pandas implementation. With `size_col`, `vwret` also has the average
+    firm size `avg_size`, as in `portfolio_aggregation.scheme_frames`.
+    """
+    keys = ["date", f"industry{n}"]
+    vwret, _, n_firms = _return_aggs("ret", "wt")
+    aggs = [vwret.alias("vwret"), n_firms.alias("ret_count")]
+    if size_col is not None:
+        aggs.append(pl.col(size_col).mean().alias("avg_size"))
+    grouped = _lazy(ccm4).drop_nulls(keys).group_by(keys).agg(*aggs).sort(keys)
+    vwret = grouped.select(*keys, "vwret", *(["avg_size"] if size_col is not None else []))
+    vwret_n = grouped.select(*keys, pl.col("ret_count").alias("ret"))
+    return vwret, vwret_n
+
+
+def calculate_portfolio_monthly_returns(df, metric_categories, weight_col="me"):
+    """Polars version of `calc_univariate_portfolios.calculate_portfolio_monthly_returns`.
+
+    Returns the lazy frames (value_weighted, equal_weighted).
+    """
+    ports = create_portfolios(df, "jdate", [metric_categories], "mthret", weight_col)
+    value_weighted = ports.select("jdate", metric_categories, "value_weighted_ret")
+    equal_weighted = ports.select("jdate", metric_categories, "equal_weighted_ret")
+    return value_weighted, equal_weighted
+
+
+def create_op_inv_portfolios(ccm4, weight_col="me"):
+    """Polars version of `calc_op_inv_portfolios.create_op_inv_portfolios`.
+
+    The grouped reduction runs in Polars; the wide (date x OP x INV) tables
+    are returned as pandas DataFrames, as in the pandas implementation.
+    """
+    keys = ["opport", "invport"]
+    ports = collect_to_pandas(create_portfolios(ccm4, "date", keys, "retx", weight_col))
+    vwret_m = ports[["date", *keys, "value_weighted_ret"]].pivot(index="date", columns=keys)
+    ewret_m = ports[["date", *keys, "equal_weighted_ret"]].pivot(index="date", columns=keys)
+    num_firms = ports.pivot(index="date", columns=keys, values="n_firms")
+    return vwret_m, ewret_m, num_firms
@@ -0,0 +1,298 @@
+"""
+Single-pass portfolio aggregation over integer group codes.
+
+Portfolio returns are grouped sums: the VW return of a (date, portfolio) cell
+is sum(ret * w) / sum(w), the EW return is sum(ret) / count. Instead of a
+pandas groupby per table, every row is given one integer key per table
+(date code times number of portfolios, plus the portfolio code), the per-row
+products are computed once, and all cells are reduced with `np.bincount`.
+
+Several classifications of the same rows (for example the 5-, 10-, ..., 49-
+industry schemes) are reduced together by stacking their keys with a
+per-scheme offset, so the whole set of tables comes out of one reduction.
+
+Portfolio characteristics, as in the companion sheets of the Ken French
+portfolio files, come out of the same reduction as the returns:
+- `avg_size`: average firm size (mean of `size`).
+- `vw_<name>`: value-weighted averages (e.g. BE/ME, OP, INV), using the same
+  weights as the VW returns.
+- ratios of sums (e.g. "Sum of BE / Sum of ME").
+
+Missing values follow `calc_industry_portfolios.wavg` on the rows with a
+return, as Ken French's VW returns: both the numerator and the denominator
+skip rows where the return or the weight is missing, so a stock without a
+return does not pull its portfolio toward zero. Cells with zero total weight,
+or with no non-missing return, have a missing VW return.
+Characteristics only use rows where the characteristic (and, for VW
+averages, the weight; for ratios, both terms) is present.
+
+Functions:
+- row_terms(ret, weight, ...): Per-row terms of every statistic, stacked for one reduction.
+- group_stats(keys, n_keys, ret, weight, ...): Statistics for integer keys.
+- portfolio_table(df, by, ...): Statistics by the columns `by` (any portfolio family).
+- membership_portfolios(dates, membership, labels, ...): Portfolios of several sorts
+  given as a membership matrix of integer portfolio codes.
+- industry_portfolios(panel, schemes, ...): Industry portfolios for several schemes at once.
+- scheme_frames(ports, n): One scheme of `industry_portfolios` in the
+  `create_industry_portfolios` layout.
+"""
+import numpy as np
+import pandas as pd
+
+from industry_classification import get_classifier
+
+
+def _as_float(values):
+    return np.asarray(values, dtype=float)
+
+
+def _zero_nan(values):
+    return np.where(np.isnan(values), 0.0, values)
+
+
+def row_terms(ret, weight, size=None, vw=None, ratios=None):
+    """
+    Per-row terms of the portfolio sums, computed once and reused for every
+    grouping, with missing values as 0.
+
+    Parameters:
+    ret, weight (array-like): Returns and VW weights.
+    size (array-like, optional): Firm size for `avg_size`.
+    vw (dict, optional): name -> values for value-weighted averages `vw_<name>`.
+    ratios (dict, optional): name -> (numerator, denominator) for ratios of sums.
+
+    Returns:
+    (np.ndarray, list): The stacked terms, and (name, numerator row,
+    denominator row) for every characteristic.
+    """
+    ret, weight = _as_float(ret), _as_float(weight)
+    has_ret = ~np.isnan(ret)
+    # the VW denominator only sums the weights of rows with a return
+    terms = [_zero_nan(ret * weight), np.where(has_ret, _zero_nan(weight), 0.0), _zero_nan(ret), has_ret.astype(float)]
+    outputs = []
+
+    def add(name, numerator, denominator):
+        outputs.append((name, len(terms), len(terms) + 1))
+        terms.extend([numerator, denominator])
+
+    if size is not None:
+        size = _as_float(size)
+        add("avg_size", _zero_nan(size), (~np.isnan(size)).astype(float))
+    for name, values in (vw or {}).items():
+        values = _as_float(values)
+        ok = ~(np.isnan(values) | np.isnan(weight))
+        add(f"vw_{name}", np.where(ok, values * weight, 0.0), np.where(ok, weight, 0.0))
+    for name, (numerator, denominator) in (ratios or {}).items():
+        numerator, denominator = _as_float(numerator), _as_float(denominator)
+        ok = ~(np.isnan(numerator) | np.isnan(denominator))
+        add(name, np.where(ok, numerator, 0.0), np.where(ok, denominator, 0.0))
+    return np.stack(terms), outputs
+
+
+def reduce_terms(keys, n_keys, terms):
+    """Sum every row of `terms` into `n_keys` cells and count rows per cell."""
+    sums = np.stack([np.bincount(keys, weights=t, minlength=n_keys) for t in terms])
+    n_rows = np.bincount(keys, minlength=n_keys)
+    return sums, n_rows
+
+
+def stats_from_sums(sums, outputs=()):
+    """Statistics from the sums of `row_terms`, as a dict of arrays."""
+    sum_wr, sum_w, sum_r, n_ret = sums[:4]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stats = {
+            "vwret": np.where((sum_w != 0) & (n_ret > 0), sum_wr / sum_w, np.nan),
+            "ewret": np.where(n_ret > 0, sum_r / n_ret, np.nan),
+            "n_firms": n_ret.astype(np.int64),
+        }
+        for name, num, den in outputs:
+            stats[name] = np.where(sums[den] != 0, sums[num] / sums[den], np.nan)
+    return stats
+
+
+def group_stats(keys, n_keys, ret, weight, size=None, vw=None, ratios=None):
+    """
+    Value-weighted returns, equal-weighted returns, firm counts and
+    characteristics for rows grouped by integer `keys` in [0, n_keys).
+
+    Returns a DataFrame indexed by key with columns `vwret`, `ewret`,
+    `n_firms` (rows with a return), the characteristics requested (see
+    `row_terms`) and `n_rows` (all rows).
+    """
+    terms, outputs = row_terms(ret, weight, size, vw, ratios)
+    sums, n_rows = reduce_terms(keys, n_keys, terms)
+    stats = stats_from_sums(sums, outputs)
+    stats["n_rows"] = n_rows
+    return pd.DataFrame(data=stats)
+
+
+def _characteristic_inputs(df, size_col, vw_cols, ratio_cols):
+    size = None if size_col is None else df[size_col].to_numpy()
+    vw = {col: df[col].to_numpy() for col in vw_cols}
+    ratios = {
+        name: (df[num].to_numpy(), df[den].to_numpy())
+        for name, (num, den) in (ratio_cols or {}).items()
+    }
+    return size, vw, ratios
+
+
+def portfolio_table(
+    df, by, ret_col="ret", weight_col="wt", size_col=None, vw_cols=(), ratio_cols=None
+):
+    """
+    Returns, counts and characteristics of the portfolios defined by the
+    columns `by` (e.g. ["date", "opport", "invport"]) in one reduction.
+
+    Parameters:
+    df (pd.DataFrame): Panel with the `by` columns and the value columns.
+    size_col (str, optional): Column averaged into `avg_size`.
+    vw_cols (iterable of str): Columns value-weighted by `weight_col` into `vw_<col>`.
+    ratio_cols (dict, optional): Output name -> (numerator column, denominator column).
+
+    Returns:
+    pd.DataFrame: The `by` columns followed by the statistics (see
+    `group_stats`), one row per cell present in `df`, sorted by `by`. Rows
+    with a missing `by` value are dropped.
+    """
+    by = list(by)
+    codes, uniques = zip(*[pd.factorize(df[col], sort=True) for col in by])
+    keep = np.logical_and.reduce([c >= 0 for c in codes])
+    dims = tuple(len(u) for u in uniques)
+    keys = np.ravel_multi_index([c[keep] for c in codes], dims) if keep.any() else np.zeros(0, int)
+    n_keys = int(np.prod(dims))
+
+    sub = df[keep] if not keep.all() else df
+    size, vw, ratios = _characteristic_inputs(sub, size_col, vw_cols, ratio_cols)
+    stats = group_stats(
+        keys, n_keys, sub[ret_col].to_numpy(), sub[weight_col].to_numpy(), size, vw, ratios
+    )
+    cells = np.flatnonzero(stats["n_rows"].to_numpy())
+    positions = np.unravel_index(cells, dims)
+    out = pd.DataFrame(data={col: u[pos] for col, u, pos in zip(by, uniques, positions)})
+    return pd.concat([out, stats.iloc[cells].reset_index(drop=True)], axis=1)
+
+
+def membership_portfolios(
+    dates, membership, labels, ret, weight, size=None, vw=None, ratios=None
+):
+    """
+    Returns, counts and characteristics of the portfolios of several sorts
+    of the same rows, given as a compact membership matrix, in one reduction.
+
+    Parameters:
+    dates (array-like): Date of every row.
+    membership (np.ndarray): (rows, sorts) integer portfolio codes; -1 where
+        the row is in no portfolio of that sort.
+    labels (dict): Sort name -> portfolio labels (code i is labels[i]), in
+        the order of the membership columns.
+    ret, weight, size, vw, ratios: As in `row_terms`.
+
+    Returns:
+    pd.DataFrame: Columns `sort`, `date`, `portfolio`, `vwret`, `ewret`,
+    `n_firms` and the characteristics, one row per (sort, date, portfolio)
+    cell with members, sorted by sort, date and portfolio code.
+    """
+    membership = np.asarray(membership)
+    if membership.ndim == 1:
+        membership = membership[:, None]
+    names = list(labels)
+    sizes = np.array([len(labels[name]) for name in names])
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    n_groups = int(offsets[-1])
+
+    date_codes, uniques = pd.factorize(dates, sort=True)
+    n_dates = len(uniques)
+    terms, outputs = row_terms(ret, weight, size, vw, ratios)
+
+    valid = (membership >= 0) & (date_codes >= 0)[:, None]
+    if valid.all():
+        # every row is in a portfolio of every sort: the terms are simply repeated
+        keys = (date_codes.astype(np.int64)[:, None] * n_groups + offsets[:-1] + membership).T.ravel()
+        terms = np.tile(terms, len(names))
+    else:
+        rows = [np.flatnonzero(valid[:, j]) for j in range(len(names))]
+        keys = np.concatenate(
+            [
+                date_codes[r].astype(np.int64) * n_groups + offsets[j] + membership[r, j]
+                for j, r in enumerate(rows)
+            ]
+        )
+        terms = terms[:, np.concatenate(rows)]
+    sums, n_rows = reduce_terms(keys, n_dates * n_groups, terms)
+    stats = stats_from_sums(sums, outputs)
+
+    cells = np.flatnonzero(n_rows)
+    date_code, group = np.divmod(cells, n_groups)
+    sort_pos = np.searchsorted(offsets, group, side="right") - 1
+    all_labels = np.concatenate([np.array(labels[name], dtype=object) for name in names])
+    return pd.DataFrame(
+        data={
+            "sort": np.array(names, dtype=object)[sort_pos],
+            "date": uniques[date_code],
+            "portfolio": all_labels[group],
+            **{name: values[cells] for name, values in stats.items()},
+            "_order": sort_pos * n_dates * n_groups + date_code * n_groups + group,
+        }
+    ).sort_values("_order").drop(columns="_order").reset_index(drop=True)
+
+
+def industry_portfolios(
+    panel,
+    schemes=(5, 49),
+    date_col="date",
+    sic_col="sic",
+    ret_col="ret",
+    weight_col="wt",
+    size_col=None,
+    vw_cols=(),
+    ratio_cols=None,
+):
+    """
+    Value-weighted returns, equal-weighted returns and firm counts of the
+    industry portfolios of every scheme in `schemes`, in one reduction.
+
+    Parameters:
+    panel (pd.DataFrame): Panel with `date_col`, `sic_col`, `ret_col` and `weight_col`.
+    schemes (iterable of int): Fama-French schemes (5, 10, 12, 17, 30, 38, 48, 49).
+    size_col, vw_cols, ratio_cols: Characteristics, as in `portfolio_table`.
+
+    Returns:
+    pd.DataFrame: Columns `scheme`, `date`, `industry`, `vwret`, `ewret`,
+    `n_firms` and the characteristics, one row per (scheme, date, industry)
+    cell present in the panel, sorted by scheme, date and industry number.
+    """
+    schemes = list(schemes)
+    classifiers = [get_classifier(n) for n in schemes]
+    sic = panel[sic_col].to_numpy()
+    membership = np.column_stack([c.codes(sic) for c in classifiers])
+
+    size, vw, ratios = _characteristic_inputs(panel, size_col, vw_cols, ratio_cols)
+    ports = membership_portfolios(
+        panel[date_col],
+        membership,
+        {n: c.labels for n, c in zip(schemes, classifiers)},
+        panel[ret_col].to_numpy(),
+        panel[weight_col].to_numpy(),
+        size,
+        vw,
+        ratios,
+    )
+    ports["sort"] = ports["sort"].astype(np.int64)
+    return ports.rename(columns={"sort": "scheme", "portfolio": "industry"})
+
+
+def scheme_frames(ports, n):
+    """
+    Split one scheme out of `industry_portfolios` into the (vwret, vwret_n)
+    frames returned by `calc_industry_portfolios.create_industry_portfolios`.
+    Characteristic columns (e.g. `avg_size`) are kept in `vwret`.
+    """
+    col = f"industry{n}"
+    df = ports[ports["scheme"] == n].rename(columns={"industry": col})
+    df[col] = pd.Categorical(df[col], categories=get_classifier(n).labels)
+    characteristics = [
+        c for c in df.columns if c not in ("scheme", "date", col, "vwret", "ewret", "n_firms")
+    ]
+    vwret = df[["date", col, "vwret", *characteristics]].reset_index(drop=True)
+    vwret_n = df[["date", col, "n_firms"]].rename(columns={"n_firms": "ret"}).reset_index(drop=True)
+    return vwret, vwret_n
@@ -0,0 +1,140 @@
+"""
+Monthly holdings of annually rebalanced portfolios.
+
+Fama-French portfolios are formed at the end of June of year t and held
+from July of year t to June of year t+1, i.e. for the months whose
+Fama-French year (`month_index.ff_year`) is t. The June assignments are
+carried to the holding months by joining on the integer key (id, ffyear)
+once for the whole panel, instead of a merge per month.
+
+The result is one row per stock and holding month with the portfolio
+columns, the return and the weight, ready for
+`portfolio_aggregation.portfolio_table` or `membership_portfolios`.
+
+The key does not have to be the Fama-French year: any integer holding
+period works, e.g. the month index of the formation date for the
+rebalancing schedules of `rebalancing.py`. An `AssignmentIndex` is built
+once and can expand the same assignments for several schedules.
+
+Classes:
+- AssignmentIndex: Integer (id, period) lookup of the assignments.
+
+Functions:
+- expand_holdings(assignments, monthly, portfolio_cols, ...): Monthly holdings table.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _year_keys(ids, years, id_index, year_min, n_years):
+    """int64 keys id_code * n_years + (year - year_min); -1 where the id or year is unknown."""
+    id_codes = id_index.get_indexer(ids)
+    years = np.asarray(years, dtype=float)
+    known = (id_codes >= 0) & ~np.isnan(years)
+    offsets = np.where(known, years, year_min) - year_min
+    known &= (offsets >= 0) & (offsets < n_years)
+    return np.where(known, id_codes.astype(np.int64) * n_years + offsets.astype(np.int64), -1)
+
+
+class AssignmentIndex:
+    """
+    Integer (id, period) lookup of portfolio assignments.
+
+    Attributes:
+    assignments (pd.DataFrame): The assignments.
+    id_col, period_col (str): Columns of the stock id and the holding period.
+    """
+
+    def __init__(self, assignments, id_col="permno", period_col="year"):
+        self.assignments = assignments
+        self.id_col = id_col
+        self.period_col = period_col
+        self.ids = pd.Index(pd.unique(assignments[id_col].dropna()))
+        periods = assignments[period_col].to_numpy(dtype=float)
+        if len(self.ids) == 0 or np.isnan(periods).all():
+            self.period_min, self.n_periods = 0, 1
+        else:
+            self.period_min = int(np.nanmin(periods))
+            self.n_periods = int(np.nanmax(periods)) - self.period_min + 1
+
+        keys = self._keys(assignments[id_col], periods)
+        rows = np.flatnonzero(keys >= 0)
+        key_index = pd.Index(keys[rows])
+        # the last assignment of an (id, period) wins
+        last = ~key_index.duplicated(keep="last")
+        self.key_index, self.rows = key_index[last], rows[last]
+
+    def _keys(self, ids, periods):
+        return _year_keys(ids, periods, self.ids, self.period_min, self.n_periods)
+
+    def lookup(self, ids, periods):
+        """
+        Match (id, period) pairs to the assignments.
+
+        Returns:
+        tuple: (matched, rows), the positions of the matched pairs and the
+        positions of their assignments in `assignments`.
+        """
+        keys = self._keys(ids, periods)
+        position = self.key_index.get_indexer(keys)
+        matched = np.flatnonzero((keys >= 0) & (position >= 0))
+        return matched, self.rows[position[matched]]
+
+    def expand(self, monthly, portfolio_cols, periods=None, period_col="ffyear",
+               date_col="date", ret_col="ret", weight_col="wt", value_cols=()):
+        """
+        Monthly holdings of the assignments; see `expand_holdings`. The holding
+        period of each monthly row is `periods` if given, else `monthly[period_col]`.
+        """
+        if periods is None:
+            periods = monthly[period_col]
+        held, rows = self.lookup(monthly[self.id_col], periods)
+
+        holdings = monthly[[self.id_col, date_col]].iloc[held].reset_index(drop=True)
+        portfolios = self.assignments[list(portfolio_cols)].iloc[rows].reset_index(drop=True)
+        holdings = pd.concat([holdings, portfolios], axis=1)
+        holdings["weight"] = monthly[weight_col].to_numpy()[held]
+        for col in [ret_col, *value_cols]:
+            holdings[col] = monthly[col].to_numpy()[held]
+        return holdings
+
+
+def expand_holdings(
+    assignments,
+    monthly,
+    portfolio_cols,
+    id_col="permno",
+    year_col="year",
+    ffyear_col="ffyear",
+    date_col="date",
+    ret_col="ret",
+    weight_col="wt",
+    value_cols=(),
+):
+    """
+    Carry the portfolio assignments of every formation year to the months
+    the portfolios are held.
+
+    Parameters:
+    assignments (pd.DataFrame): One row per (`id_col`, `year_col`) with the
+        portfolio columns, where `year_col` is the Fama-French year the
+        portfolio is held (the June formation year). If an (id, year)
+        appears more than once, the last row is used.
+    monthly (pd.DataFrame): Monthly panel with `id_col`, `ffyear_col`,
+        `date_col`, `ret_col` and `weight_col` (e.g. the June ME drifted by
+        the cumulative return, `wt`).
+    portfolio_cols (list of str): Assignment columns to carry (e.g.
+        ["opport", "invport"]); categorical columns stay categorical.
+    value_cols (iterable of str): Further monthly columns to keep (e.g. the
+        return without dividends).
+
+    Returns:
+    pd.DataFrame: `id_col`, `date_col`, the portfolio columns, `weight`,
+    `ret_col` and `value_cols`, one row per monthly row whose stock was assigned in its
+    Fama-French year, in the order of `monthly`.
+    """
+    index = AssignmentIndex(assignments, id_col=id_col, period_col=year_col)
+    return index.expand(
+        monthly, portfolio_cols, period_col=ffyear_col, date_col=date_col,
+        ret_col=ret_col, weight_col=weight_col, value_cols=value_cols,
+    )
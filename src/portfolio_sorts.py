@@ -0,0 +1,279 @@
+"""
+N-dimensional portfolio sorts.
+
+A portfolio sort is a list of dimensions, each a characteristic with its
+percentile breakpoints (e.g. ME at the NYSE median and E/P at the 30th and
+70th NYSE percentiles for the 2x3 ME x E/P portfolios, or OP and INV
+quintiles for the 5x5 OP x INV portfolios). Every stock gets one integer
+code per dimension, computed for all formation dates at once from cached
+breakpoints (see `breakpoints.py`), and a combined portfolio code.
+
+Two modes are supported:
+- independent: the breakpoints of every dimension are computed over all
+  stocks of the formation date (Fama-French 2x3 and 5x5 sorts).
+- dependent (conditional): the breakpoints of a dimension are computed
+  within each portfolio of the previous dimensions, e.g. E/P terciles
+  within each size group.
+
+Layouts such as 2x3, 5x5 or 2x4x4 only differ in the list of dimensions:
+>>> dims = [
+...     SortDimension("me", [0.5], labels=["SMALL", "BIG"]),
+...     SortDimension("beme", [0.25, 0.5, 0.75]),
+...     SortDimension("op", [0.25, 0.5, 0.75]),
+... ]
+>>> df["port"] = sort_portfolios(df, dims, date_col="year")
+
+Classes:
+- SortDimension: One dimension of a sort.
+
+Functions:
+- sort_codes(df, dimensions, ...): Portfolio code of every row in every dimension.
+- portfolio_codes(codes, dimensions): Combined portfolio code of every row.
+- portfolio_labels(dimensions): Labels of the combined portfolio codes.
+- sort_portfolios(df, dimensions, ...): Combined portfolio labels as a categorical column.
+- batch_sort_codes(df, dimensions, ...): Many one-dimensional sorts of the same
+  formation dates at once, as one integer matrix.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import config
+from breakpoints import (
+    CACHE_DIR,
+    breakpoint_table,
+    bucket_codes,
+    grouped_quantiles,
+    interior_breakpoints,
+    universe_mask,
+)
+
+INDEPENDENT = "independent"
+DEPENDENT = "dependent"
+SORT_MODES = (INDEPENDENT, DEPENDENT)
+
+# columns `universe_mask` reads to find NYSE stocks
+_EXCHANGE_COLUMNS = ("primaryexch", "exchcd")
+
+
+class SortDimension:
+    """
+    One dimension of a portfolio sort.
+
+    Attributes:
+    variable (str): Column sorted on.
+    percentiles (tuple of float): Interior breakpoints, e.g. (0.5,) or (0.3, 0.7).
+    labels (list of str): One label per portfolio; defaults to the variable
+        name followed by the portfolio number.
+    side (str): "right" puts values equal to a breakpoint in the upper
+        portfolio, "left" in the lower one.
+    merge_ties (bool): Merge portfolios whose breakpoints tie instead of
+        leaving them empty, as `pd.cut` on quantiles after `drop_duplicates()`.
+    nonnegative (bool): Only sort non-negative values; negative values are in
+        no portfolio and do not enter the breakpoints (as for E/P or C/P).
+    name (str): Name of the sort in `batch_sort_codes`; defaults to `variable`.
+    """
+
+    def __init__(
+        self,
+        variable,
+        percentiles,
+        labels=None,
+        side="right",
+        merge_ties=False,
+        nonnegative=False,
+        name=None,
+    ):
+        self.variable = variable
+        self.name = name or variable
+        self.percentiles = tuple(float(p) for p in percentiles)
+        if labels is None:
+            labels = [f"{variable}{i}" for i in range(1, len(self.percentiles) + 2)]
+        if len(labels) != len(self.percentiles) + 1:
+            raise ValueError("labels must have one entry more than percentiles")
+        self.labels = list(labels)
+        self.side = side
+        self.merge_ties = merge_ties
+        self.nonnegative = nonnegative
+
+    @property
+    def n_portfolios(self):
+        return len(self.labels)
+
+    @property
+    def breakpoint_name(self):
+        """Name of the sorted values in the breakpoint cache."""
+        return f"{self.variable}_nonnegative" if self.nonnegative else self.variable
+
+    def sort_values(self, df):
+        """Values of the sorted column, missing where the row is not sorted."""
+        values = df[self.variable].astype(float)
+        if self.nonnegative:
+            values = values.where(values >= 0)
+        return values.to_numpy()
+
+    def __repr__(self):
+        return f"SortDimension({self.variable!r}, {list(self.percentiles)})"
+
+
+def _codes_from_breakpoints(dimension, values, groups, breakpoints):
+    if dimension.merge_ties:
+        return bucket_codes(values, groups, interior_breakpoints(breakpoints), side=dimension.side)
+    return bucket_codes(values, groups, breakpoints, side=dimension.side)
+
+
+def _breakpoint_percentiles(dimension):
+    # tied breakpoints can only be merged relative to the lowest and highest value
+    if dimension.merge_ties:
+        return (0.0, *dimension.percentiles, 1.0)
+    return dimension.percentiles
+
+
+def sort_codes(
+    df,
+    dimensions,
+    date_col="year",
+    mode=INDEPENDENT,
+    universe=config.BREAKPOINT_UNIVERSE,
+    cache_dir=CACHE_DIR,
+):
+    """
+    Portfolio of every row of `df` in every dimension of a sort.
+
+    Parameters:
+    df (pd.DataFrame): One row per stock and formation date.
+    dimensions (list of SortDimension): The dimensions, in sort order.
+    date_col (str): Formation date column; breakpoints are computed per date.
+    mode (str): "independent" or "dependent" (see the module docstring).
+    universe (str): Stocks the breakpoints are computed from ("nyse" or "all").
+    cache_dir (Path or None): Breakpoint cache of the independent breakpoints.
+
+    Returns:
+    np.ndarray: int16 codes of shape (rows, dimensions), 0-based; -1 where the
+    row is not sorted in that dimension (missing value or date, or, in
+    dependent mode, not sorted in a previous dimension).
+    """
+    if mode not in SORT_MODES:
+        raise ValueError(f"mode must be one of {SORT_MODES}, not {mode!r}")
+    exchange_columns = [c for c in _EXCHANGE_COLUMNS if c in df]
+    in_universe = universe_mask(df, universe)
+    date_codes = pd.factorize(df[date_col], sort=True)[0].astype(np.int64)
+
+    codes = np.full((len(df), len(dimensions)), -1, dtype=np.int16)
+    cells = date_codes
+    for j, dimension in enumerate(dimensions):
+        values = dimension.sort_values(df)
+        percentiles = _breakpoint_percentiles(dimension)
+        if mode == INDEPENDENT or j == 0:
+            frame = df[[date_col, *exchange_columns]].assign(**{dimension.breakpoint_name: values})
+            bp = breakpoint_table(
+                frame, dimension.breakpoint_name, percentiles, date_col=date_col,
+                universe=universe, cache_dir=cache_dir,
+            )
+            codes[:, j] = _codes_from_breakpoints(dimension, values, df[date_col], bp)
+        else:
+            # breakpoints within each portfolio of the previous dimensions
+            previous = dimensions[j - 1]
+            cells = np.where(
+                (cells >= 0) & (codes[:, j - 1] >= 0),
+                cells * previous.n_portfolios + codes[:, j - 1],
+                -1,
+            )
+            reference = np.where(in_universe & (cells >= 0), values, np.nan)
+            bp = grouped_quantiles(reference, cells, percentiles)
+            codes[:, j] = _codes_from_breakpoints(dimension, values, cells, bp)
+        if mode == DEPENDENT and j > 0:
+            codes[codes[:, j - 1] < 0, j] = -1
+    return codes
+
+
+def portfolio_codes(codes, dimensions):
+    """
+    Combined portfolio code of every row (row-major over the dimensions,
+    as `portfolio_labels`); -1 where the row is not sorted in every dimension.
+    """
+    codes = np.asarray(codes)
+    dims = [d.n_portfolios for d in dimensions]
+    sorted_rows = (codes >= 0).all(axis=1)
+    combined = np.full(len(codes), -1, dtype=np.int64)
+    if sorted_rows.any():
+        combined[sorted_rows] = np.ravel_multi_index(codes[sorted_rows].T.astype(np.int64), dims)
+    return combined
+
+
+def portfolio_labels(dimensions, sep=" "):
+    """Labels of the combined portfolio codes, e.g. "SMALL LoBM"."""
+    return [sep.join(parts) for parts in itertools.product(*[d.labels for d in dimensions])]
+
+
+def sort_portfolios(df, dimensions, date_col="year", mode=INDEPENDENT, sep=" ", **kwargs):
+    """
+    Combined portfolio of every row as a categorical column with the labels
+    of `portfolio_labels`. Keyword arguments are passed to `sort_codes`.
+    """
+    codes = sort_codes(df, dimensions, date_col=date_col, mode=mode, **kwargs)
+    return pd.Series(
+        pd.Categorical.from_codes(
+            portfolio_codes(codes, dimensions), categories=portfolio_labels(dimensions, sep)
+        ),
+        index=df.index,
+    )
+
+
+def _row_bucket_codes(values, date_codes, table, side):
+    """
+    Bucket codes by comparing every value with the breakpoints of its date,
+    for all dates at once; +inf breakpoints (padding) are never passed.
+    """
+    valid = (date_codes >= 0) & ~np.isnan(values)
+    bp = table[np.where(valid, date_codes, 0)]
+    valid &= ~np.isnan(bp).any(axis=1)
+    if side == "right":
+        passed = bp <= values[:, None]
+    else:
+        passed = bp < values[:, None]
+    return np.where(valid, passed.sum(axis=1), -1).astype(np.int16)
+
+
+def batch_sort_codes(
+    df, dimensions, date_col="year", universe=config.BREAKPOINT_UNIVERSE, cache_dir=CACHE_DIR
+):
+    """
+    Independent one-dimensional sorts of many characteristics (and several
+    breakpoint sets per characteristic) on the same formation dates.
+
+    The dates are factorized and the universe is selected once. Every
+    characteristic is sorted once per formation date, for the union of the
+    percentiles of all its sorts (one `breakpoint_table` entry), and the
+    codes of all its sorts are read off those breakpoints with one
+    vectorized comparison per sort.
+
+    Returns:
+    pd.DataFrame: One int16 column per dimension (named `dimension.name`),
+    0-based portfolio codes, -1 where the row is not sorted.
+    """
+    exchange_columns = [c for c in _EXCHANGE_COLUMNS if c in df]
+    date_codes, dates = pd.factorize(df[date_col], sort=True)
+    codes = {}
+
+    by_values = {}
+    for dimension in dimensions:
+        by_values.setdefault((dimension.variable, dimension.nonnegative), []).append(dimension)
+    for group in by_values.values():
+        values = group[0].sort_values(df)
+        percentiles = sorted({round(p, 10) for d in group for p in _breakpoint_percentiles(d)})
+        name = group[0].breakpoint_name
+        frame = df[[date_col, *exchange_columns]].assign(**{name: values})
+        bp = breakpoint_table(
+            frame, name, percentiles, date_col=date_col, universe=universe, cache_dir=cache_dir
+        ).reindex(dates)
+        for dimension in group:
+            columns = [round(p, 10) for p in _breakpoint_percentiles(dimension)]
+            table = bp[columns]
+            if dimension.merge_ties:
+                table = interior_breakpoints(table)
+            codes[dimension.name] = _row_bucket_codes(
+                values, date_codes, table.to_numpy(dtype=float), dimension.side
+            )
+    return pd.DataFrame(data={d.name: codes[d.name] for d in dimensions}, index=df.index)
@@ -0,0 +1,260 @@
+"""
+Rebalancing schedules for portfolio formation.
+
+A schedule says when portfolios are re-formed and, for every month, which
+formation the stocks are held under. Formation dates and holding months are
+integer month indexes (see `month_index.py`):
+
+- annual: formed at the end of June of year t and held from July t to June
+  t+1, the Fama-French convention (the formation month is June of `ffyear`).
+- quarterly: formed at the end of March, June, September and December and
+  held for the next three months.
+- monthly: formed at the end of every month and held the next month.
+- custom: formed on given dates and held until the next one.
+
+Portfolios formed on the same date are the same whatever the schedule, so
+`rebalanced_portfolios` sorts the stocks once on the union of the formation
+dates of all schedules (with the breakpoints of `breakpoint_table`, computed
+and cached once per date) and builds one `AssignmentIndex`. Each schedule
+then only maps the months of the monthly panel to their formation date:
+
+>>> holdings = rebalanced_portfolios(chars, crsp3, dims, [ANNUAL, QUARTERLY, MONTHLY])
+>>> holdings["quarterly"]  # monthly holdings of the quarterly rebalanced sort
+
+Portfolios assigned some other way on the formation dates (e.g. with an
+extra bucket for negative values) are held with `hold_formations`.
+
+Sorts on annual accounting data use, at every formation date, the data of
+the June formation in force at that date (`accounting_in_force`), so the
+quarterly and monthly sorts only differ from the annual one by the ME and
+the universe of the formation month.
+
+Classes:
+- RebalanceSchedule: Formation dates and holding periods of a schedule.
+
+Functions:
+- schedule(name): The schedule called `name` ("annual", "quarterly" or "monthly").
+- accounting_in_force(annual, monthly, value_cols, ...): Annual data in force at every month end.
+- formation_dates(mi, schedules): Whether each month is a formation date of any schedule.
+- hold_formations(assignments, monthly, portfolio_cols, schedules, ...):
+  Monthly holdings of portfolios formed by any sort on the formation dates.
+- rebalanced_portfolios(characteristics, monthly, dimensions, schedules, ...):
+  Monthly holdings of a sort for every schedule.
+"""
+import numpy as np
+import pandas as pd
+
+import config
+from breakpoints import CACHE_DIR
+from month_index import ff_year, month_index, month_of
+from portfolio_holdings import AssignmentIndex
+from portfolio_sorts import INDEPENDENT, portfolio_codes, portfolio_labels, sort_codes
+
+
+class RebalanceSchedule:
+    """
+    Formation dates of a portfolio sort and the months each formation is held.
+
+    A schedule is either calendar based, with the formation `months` (1-12)
+    of every year, or custom, with explicit `formation_dates` (datetimes or
+    month indexes). Portfolios are held from the month after their formation
+    until the month of the next formation, and for at most `max_holding`
+    months if given.
+
+    Attributes:
+    name (str): Name of the schedule, used as the key of its results.
+    months (tuple of int): Calendar formation months, or None.
+    formation_dates (np.ndarray): Sorted formation month indexes, or None.
+    max_holding (int): Maximum number of months a formation is held, or None.
+    """
+
+    def __init__(self, name, months=None, formation_dates=None, max_holding=None):
+        if (months is None) == (formation_dates is None):
+            raise ValueError("give either the formation months or the formation dates")
+        self.name = name
+        self.max_holding = max_holding
+        self.months = None
+        self.formation_dates = None
+        if months is not None:
+            self.months = tuple(sorted({int(m) for m in months}))
+            if not self.months or self.months[0] < 1 or self.months[-1] > 12:
+                raise ValueError("formation months must be between 1 and 12")
+            # months from each calendar month back to the last formation month before it
+            is_formation = np.isin(np.arange(1, 13), self.months)
+            self._lags = np.array(
+                [next(k for k in range(1, 13) if is_formation[(m - k) % 12]) for m in range(12)]
+            )
+        else:
+            dates = pd.Series(formation_dates)
+            if pd.api.types.is_datetime64_any_dtype(dates):
+                dates = month_index(dates)
+            self.formation_dates = np.unique(np.asarray(dates, dtype=np.int64))
+
+    def is_formation(self, mi):
+        """Whether each month index is a formation date."""
+        mi = np.asarray(mi)
+        if self.months is not None:
+            return np.isin(month_of(mi), self.months)
+        return np.isin(mi, self.formation_dates)
+
+    def formation_month(self, mi):
+        """
+        Formation date (month index) of the portfolios held in each month
+        index; -1 if no portfolio is held in that month.
+        """
+        mi = np.asarray(mi, dtype=np.int64)
+        if self.months is not None:
+            formation = mi - self._lags[mi % 12]
+        else:
+            position = np.searchsorted(self.formation_dates, mi, side="left") - 1
+            formation = np.where(position >= 0, self.formation_dates[np.maximum(position, 0)], -1)
+        if self.max_holding is not None:
+            formation = np.where(mi - formation > self.max_holding, -1, formation)
+        return formation
+
+    def __repr__(self):
+        if self.months is not None:
+            return f"RebalanceSchedule({self.name!r}, months={list(self.months)})"
+        return f"RebalanceSchedule({self.name!r}, {self.formation_dates.size} formation dates)"
+
+
+ANNUAL = RebalanceSchedule("annual", months=(6,))
+QUARTERLY = RebalanceSchedule("quarterly", months=(3, 6, 9, 12))
+MONTHLY = RebalanceSchedule("monthly", months=range(1, 13))
+SCHEDULES = {s.name: s for s in (ANNUAL, QUARTERLY, MONTHLY)}
+
+
+def schedule(name):
+    """The schedule called `name`; schedules pass through unchanged."""
+    if isinstance(name, RebalanceSchedule):
+        return name
+    try:
+        return SCHEDULES[name]
+    except KeyError:
+        raise ValueError(f"schedule must be one of {tuple(SCHEDULES)}, not {name!r}") from None
+
+
+def accounting_in_force(annual, monthly, value_cols, id_col="permno", year_col="formation_year", date_col="mdate"):
+    """
+    Annual accounting data in force at the end of every month.
+
+    The data of the June formation of year t are used from the end of June t
+    to the end of May t+1, so a portfolio formed at the end of month m uses
+    the data of formation year `ff_year(m + 1)`, as the annual sort does.
+
+    Parameters:
+    annual (pd.DataFrame): One row per (`id_col`, `year_col`) with `value_cols`.
+    monthly (pd.DataFrame): Panel with `id_col` and the integer month index `date_col`.
+
+    Returns:
+    pd.DataFrame: `value_cols` aligned with the index of `monthly`; missing
+    where no data are in force.
+    """
+    index = AssignmentIndex(annual, id_col=id_col, period_col=year_col)
+    matched, rows = index.lookup(monthly[id_col], ff_year(monthly[date_col].to_numpy() + 1))
+    values = pd.DataFrame(index=monthly.index)
+    for col in value_cols:
+        column = np.full(len(monthly), np.nan)
+        column[matched] = annual[col].to_numpy(dtype=float)[rows]
+        values[col] = column
+    return values
+
+
+def formation_dates(mi, schedules):
+    """Whether each month index is a formation date of any of `schedules`."""
+    mi = np.asarray(mi)
+    formation = np.zeros(mi.shape, dtype=bool)
+    for s in schedules:
+        formation |= schedule(s).is_formation(mi)
+    return formation
+
+
+def hold_formations(
+    assignments,
+    monthly,
+    portfolio_cols,
+    schedules=(ANNUAL,),
+    id_col="permno",
+    date_col="mdate",
+    ret_col="ret",
+    weight_col="L_me",
+    value_cols=(),
+):
+    """
+    Monthly holdings of portfolios already formed on the formation dates of
+    several schedules.
+
+    Parameters:
+    assignments (pd.DataFrame): One row per (`id_col`, formation month index
+        `date_col`) with the `portfolio_cols`, e.g. the formation rows of
+        `formation_dates` with the portfolios of any sort.
+    monthly (pd.DataFrame): Monthly panel with `id_col`, `date_col`,
+        `ret_col`, `weight_col` and the `value_cols` carried to the holdings.
+
+    Returns:
+    dict: Schedule name -> DataFrame with `id_col`, `date_col`, the
+    `portfolio_cols` of the formation each month is held under, `weight`,
+    `ret_col` and the `value_cols` of the month.
+    """
+    index = AssignmentIndex(assignments, id_col=id_col, period_col=date_col)
+    held_months = monthly[date_col].to_numpy()
+    return {
+        s.name: index.expand(
+            monthly, portfolio_cols, periods=s.formation_month(held_months),
+            date_col=date_col, ret_col=ret_col, weight_col=weight_col, value_cols=value_cols,
+        )
+        for s in map(schedule, schedules)
+    }
+
+
+def rebalanced_portfolios(
+    characteristics,
+    monthly,
+    dimensions,
+    schedules=(ANNUAL,),
+    id_col="permno",
+    date_col="mdate",
+    ret_col="ret",
+    weight_col="L_me",
+    mode=INDEPENDENT,
+    universe=config.BREAKPOINT_UNIVERSE,
+    cache_dir=CACHE_DIR,
+):
+    """
+    Monthly holdings of a portfolio sort rebalanced on several schedules.
+
+    Parameters:
+    characteristics (pd.DataFrame): Sorting variables observed at the end of
+        each month, one row per (`id_col`, `date_col`) with the columns of
+        `dimensions` and the exchange column of the breakpoint universe.
+        Only the rows of formation dates are used.
+    monthly (pd.DataFrame): Monthly panel with `id_col`, `date_col`,
+        `ret_col` and `weight_col`. The default weight, last month's ME, is
+        the buy-and-hold weight of every schedule.
+    dimensions (list of SortDimension): The sort (see `portfolio_sorts.py`).
+    schedules (list of RebalanceSchedule or str): Schedules to form.
+    date_col (str): Integer month index column of both panels.
+
+    Returns:
+    dict: Schedule name -> DataFrame with `id_col`, `date_col`, one
+    categorical column per dimension (named `dimension.name`), the combined
+    `portfolio`, `weight` and `ret_col`; only rows held in a portfolio in
+    every dimension.
+    """
+    schedules = [schedule(s) for s in schedules]
+    formed = characteristics[formation_dates(characteristics[date_col], schedules)]
+
+    # one sort per formation date, shared by every schedule forming on that date
+    codes = sort_codes(formed, dimensions, date_col=date_col, mode=mode, universe=universe, cache_dir=cache_dir)
+    combined = portfolio_codes(codes, dimensions)
+    sorted_rows = combined >= 0
+    assignments = pd.DataFrame(data={id_col: formed[id_col].to_numpy(), date_col: formed[date_col].to_numpy()})
+    portfolio_cols = []
+    for j, dimension in enumerate(dimensions):
+        assignments[dimension.name] = pd.Categorical.from_codes(codes[:, j], categories=dimension.labels)
+        portfolio_cols.append(dimension.name)
+    assignments["portfolio"] = pd.Categorical.from_codes(combined, categories=portfolio_labels(dimensions))
+    return hold_formations(
+        assignments[sorted_rows], monthly, [*portfolio_cols, "portfolio"], schedules,
+        id_col=id_col, date_col=date_col, ret_col=ret_col, weight_col=weight_col,
+    )
@@ -0,0 +1,287 @@
+"""
+Segmented (grouped) kernels over sorted arrays.
+
+The hot paths of the pipeline (`groupby(["permno", "ffyear"])["1+retx"].cumprod()`,
+`groupby("permno").shift(1)` and per-stock compounding with
+`transform(lambda x: (1 + x).prod() - 1)`) are grouped operations on a panel
+that is, or can cheaply be, sorted by the group keys. The kernels here work
+directly on such sorted arrays, described by an offset vector: the rows of
+segment `k` are `offsets[k]:offsets[k+1]` (see `panel_index.PanelIndex`).
+
+If Numba is installed the kernels are JIT-compiled loops. Otherwise every
+function falls back to the equivalent pandas groupby on the segment ids, so
+results are the same either way. Missing values follow pandas conventions:
+they are skipped by cumprod, sum, prod and first/last.
+
+Functions:
+- offsets_from_sorted_keys(*keys): Offsets of the runs of equal keys in sorted arrays.
+- group_offsets(*keys): Stable sort order and offsets for unsorted keys.
+- broadcast_segments(seg_values, offsets, order=None): Per-segment results back to rows.
+- segment_cumprod, segment_cumsum, segment_shift: Row-aligned results.
+- segment_sum, segment_prod, segment_weighted_mean, segment_first, segment_last:
+  One result per segment.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+
+    NUMBA_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on the environment
+    numba = None
+    NUMBA_AVAILABLE = False
+
+
+def _njit(func):
+    """Compile `func` with Numba when available, otherwise leave it unused."""
+    if NUMBA_AVAILABLE:
+        return numba.njit(cache=True)(func)
+    return func
+
+
+########################################################################################
+## Offsets
+########################################################################################
+
+def offsets_from_sorted_keys(*keys):
+    """
+    Offsets of the runs of equal keys in arrays already sorted by `keys`.
+
+    >>> offsets_from_sorted_keys(np.array([1, 1, 2, 2, 2]), np.array([5, 6, 6, 6, 7]))
+    array([0, 1, 2, 4, 5])
+    """
+    n = len(keys[0])
+    change = np.zeros(n, dtype=bool)
+    if n:
+        change[0] = True
+    for key in keys:
+        key = np.asarray(key)
+        change[1:] |= key[1:] != key[:-1]
+    return np.append(np.flatnonzero(change), n).astype(np.int64)
+
+
+def group_offsets(*keys):
+    """
+    Stable sort order and segment offsets for (possibly unsorted) keys.
+
+    Returns (order, offsets) such that `values[order]` is grouped by `keys`
+    and the rows of group `k` are `order[offsets[k]:offsets[k+1]]`.
+    """
+    keys = [np.asarray(k) for k in keys]
+    order = np.lexsort(keys[::-1])
+    offsets = offsets_from_sorted_keys(*[k[order] for k in keys])
+    return order, offsets
+
+
+def broadcast_segments(seg_values, offsets, order=None):
+    """
+    Repeat one value per segment over the rows of the segment, like a
+    groupby `transform`. With `order` (from `group_offsets`) the result is
+    returned in the original row order.
+    """
+    out = np.repeat(np.asarray(seg_values), np.diff(offsets))
+    if order is None:
+        return out
+    unsorted = np.empty_like(out)
+    unsorted[order] = out
+    return unsorted
+
+
+def _segment_ids(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+########################################################################################
+## Kernels
+########################################################################################
+
+@_njit
+def _cumprod_kernel(values, offsets):
+    out = np.empty(values.shape[0])
+    for k in range(offsets.shape[0] - 1):
+        acc = 1.0
+        for i in range(offsets[k], offsets[k + 1]):
+            v = values[i]
+            if np.isnan(v):
+                out[i] = np.nan
+            else:
+                acc *= v
+                out[i] = acc
+    return out
+
+
+@_njit
+def _cumsum_kernel(values, offsets):
+    out = np.empty(values.shape[0])
+    for k in range(offsets.shape[0] - 1):
+        acc = 0.0
+        for i in range(offsets[k], offsets[k + 1]):
+            v = values[i]
+            if np.isnan(v):
+                out[i] = np.nan
+            else:
+                acc += v
+                out[i] = acc
+    return out
+
+
+@_njit
+def _shift_kernel(values, offsets, periods):
+    out = np.full(values.shape[0], np.nan)
+    for k in range(offsets.shape[0] - 1):
+        start = offsets[k]
+        end = offsets[k + 1]
+        for i in range(start, end):
+            j = i - periods
+            if start <= j < end:
+                out[i] = values[j]
+    return out
+
+
+@_njit
+def _sum_kernel(values, offsets):
+    out = np.zeros(offsets.shape[0] - 1)
+    for k in range(offsets.shape[0] - 1):
+        acc = 0.0
+        for i in range(offsets[k], offsets[k + 1]):
+            if not np.isnan(values[i]):
+                acc += values[i]
+        out[k] = acc
+    return out
+
+
+@_njit
+def _prod_kernel(values, offsets):
+    out = np.ones(offsets.shape[0] - 1)
+    for k in range(offsets.shape[0] - 1):
+        acc = 1.0
+        for i in range(offsets[k], offsets[k + 1]):
+            if not np.isnan(values[i]):
+                acc *= values[i]
+        out[k] = acc
+    return out
+
+
+@_njit
+def _weighted_mean_kernel(values, weights, offsets):
+    out = np.full(offsets.shape[0] - 1, np.nan)
+    for k in range(offsets.shape[0] - 1):
+        num = 0.0
+        den = 0.0
+        for i in range(offsets[k], offsets[k + 1]):
+            if not (np.isnan(values[i]) or np.isnan(weights[i])):
+                num += values[i] * weights[i]
+                den += weights[i]
+        if den != 0.0:
+            out[k] = num / den
+    return out
+
+
+@_njit
+def _first_kernel(values, offsets):
+    out = np.full(offsets.shape[0] - 1, np.nan)
+    for k in range(offsets.shape[0] - 1):
+        for i in range(offsets[k], offsets[k + 1]):
+            if not np.isnan(values[i]):
+                out[k] = values[i]
+                break
+    return out
+
+
+@_njit
+def _last_kernel(values, offsets):
+    out = np.full(offsets.shape[0] - 1, np.nan)
+    for k in range(offsets.shape[0] - 1):
+        for i in range(offsets[k + 1] - 1, offsets[k] - 1, -1):
+            if not np.isnan(values[i]):
+                out[k] = values[i]
+                break
+    return out
+
+
+########################################################################################
+## Public functions
+########################################################################################
+
+def _as_float(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def _as_offsets(offsets):
+    return np.ascontiguousarray(offsets, dtype=np.int64)
+
+
+def _grouped(values, offsets):
+    return pd.Series(values).groupby(_segment_ids(offsets), sort=False)
+
+
+def segment_cumprod(values, offsets):
+    """Cumulative product within segments, like `groupby(...).cumprod()`."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _cumprod_kernel(values, offsets)
+    return _grouped(values, offsets).cumprod().to_numpy()
+
+
+def segment_cumsum(values, offsets):
+    """Cumulative sum within segments, like `groupby(...).cumsum()`."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _cumsum_kernel(values, offsets)
+    return _grouped(values, offsets).cumsum().to_numpy()
+
+
+def segment_shift(values, offsets, periods=1):
+    """Shift within segments, like `groupby(...).shift(periods)`."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _shift_kernel(values, offsets, periods)
+    return _grouped(values, offsets).shift(periods).to_numpy()
+
+
+def segment_sum(values, offsets):
+    """Sum of every segment (missing values skipped)."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _sum_kernel(values, offsets)
+    return _grouped(values, offsets).sum().to_numpy()
+
+
+def segment_prod(values, offsets):
+    """Product of every segment (missing values skipped)."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _prod_kernel(values, offsets)
+    return _grouped(values, offsets).prod().to_numpy()
+
+
+def segment_weighted_mean(values, weights, offsets):
+    """
+    Weighted mean of every segment, using only rows where both the value and
+    the weight are present. Segments with zero total weight are NaN.
+    """
+    values, weights, offsets = _as_float(values), _as_float(weights), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _weighted_mean_kernel(values, weights, offsets)
+    valid = ~(np.isnan(values) | np.isnan(weights))
+    ids = _segment_ids(offsets)
+    num = pd.Series(np.where(valid, values * weights, 0.0)).groupby(ids, sort=False).sum()
+    den = pd.Series(np.where(valid, weights, 0.0)).groupby(ids, sort=False).sum()
+    return (num / den.replace(0.0, np.nan)).to_numpy()
+
+
+def segment_first(values, offsets):
+    """First non-missing value of every segment, like `groupby(...).first()`."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _first_kernel(values, offsets)
+    return _grouped(values, offsets).first().to_numpy()
+
+
+def segment_last(values, offsets):
+    """Last non-missing value of every segment, like `groupby(...).last()`."""
+    values, offsets = _as_float(values), _as_offsets(offsets)
+    if NUMBA_AVAILABLE:
+        return _last_kernel(values, offsets)
+    return _grouped(values, offsets).last().to_numpy()
@@ -0,0 +1,100 @@
+"""
+Portfolio returns of many sorts as sparse matrix products.
+
+The portfolios of several sorts of the same stock-months (e.g. the decile,
+quintile, tercile and 30/40/30 sorts on E/P) are described by one sparse
+membership matrix with one row per (date, portfolio) cell and one column per
+stock-month, holding a one where the stock is in the portfolio. The per-row
+terms of the portfolio sums (`portfolio_aggregation.row_terms`: ret * w, w,
+ret, ...) form a dense matrix with one column per term, and all the sums of
+all portfolios are one sparse matrix product with it.
+
+The rows are sorted by date and split into blocks of whole dates of about
+`block_rows` stock-months, with one product per block, so the matrix of a
+block stays small however long the panel is. The results are wide arrays
+with one row per date and one column per portfolio, in the order of the
+sorts and of their labels, as the Ken French files lay them out.
+
+Missing values follow `portfolio_aggregation` (see `row_terms` and
+`stats_from_sums`).
+
+Functions:
+- membership_matrix(cells, rows, n_cells, n_rows): Sparse 0/1 matrix of (cell, row) pairs.
+- sparse_portfolio_stats(dates, membership, labels, ret, weight, ...): Returns,
+  counts and characteristics of every portfolio as (dates, portfolios) arrays.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from portfolio_aggregation import row_terms, stats_from_sums
+
+# stock-months per sparse product
+BLOCK_ROWS = 1_000_000
+
+
+def membership_matrix(cells, rows, n_cells, n_rows):
+    """CSR matrix of shape (n_cells, n_rows) with a one at every (cells[k], rows[k])."""
+    return sparse.csr_matrix((np.ones(len(cells)), (cells, rows)), shape=(n_cells, n_rows))
+
+
+def _date_blocks(counts, block_rows):
+    """Date boundaries of blocks of whole dates with about `block_rows` rows each."""
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    block = starts[:-1] // max(int(block_rows), 1)
+    edges = np.flatnonzero(np.diff(block)) + 1
+    return starts, np.concatenate([[0], edges, [len(counts)]])
+
+
+def sparse_portfolio_stats(
+    dates, membership, labels, ret, weight, size=None, vw=None, ratios=None, block_rows=BLOCK_ROWS
+):
+    """
+    Returns, counts and characteristics of the portfolios of several sorts of
+    the same rows, as wide arrays.
+
+    Parameters:
+    dates (array-like): Date of every row.
+    membership (np.ndarray): (rows, sorts) integer portfolio codes; -1 where
+        the row is in no portfolio of that sort.
+    labels (dict): Sort name -> portfolio labels (code i is labels[i]), in
+        the order of the membership columns.
+    ret, weight, size, vw, ratios: As in `portfolio_aggregation.row_terms`.
+    block_rows (int): Rows per sparse product (whole dates are kept together).
+
+    Returns:
+    (pd.Index, list, dict): The sorted dates, the (sort, label) of every
+    portfolio column, and statistic name (`vwret`, `ewret`, `n_firms`, the
+    characteristics and `n_rows`) -> array of shape (dates, portfolios).
+    """
+    membership = np.asarray(membership)
+    if membership.ndim == 1:
+        membership = membership[:, None]
+    names = list(labels)
+    offsets = np.concatenate([[0], np.cumsum([len(labels[name]) for name in names])]).astype(np.int64)
+    n_groups = int(offsets[-1])
+    columns = [(name, label) for name in names for label in labels[name]]
+
+    date_codes, uniques = pd.factorize(dates, sort=True)
+    n_dates = len(uniques)
+    terms, outputs = row_terms(ret, weight, size, vw, ratios)
+    terms = np.vstack([terms, np.ones(terms.shape[1])])
+
+    order = np.argsort(date_codes, kind="stable")
+    order = order[date_codes[order] >= 0]
+    starts, edges = _date_blocks(np.bincount(date_codes[order], minlength=n_dates), block_rows)
+
+    sums = np.zeros((terms.shape[0], n_dates * n_groups))
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        rows = order[starts[lo]:starts[hi]]
+        codes = membership[rows]
+        member, sort = np.nonzero(codes >= 0)
+        cells = (date_codes[rows][member] - lo).astype(np.int64) * n_groups + offsets[sort] + codes[member, sort]
+        matrix = membership_matrix(cells, member, (hi - lo) * n_groups, len(rows))
+        sums[:, lo * n_groups:hi * n_groups] = (matrix @ terms[:, rows].T).T
+
+    stats = stats_from_sums(sums[:-1], outputs)
+    stats["n_rows"] = sums[-1].astype(np.int64)
+    return pd.Index(uniques), columns, {name: values.reshape(n_dates, n_groups) for name, values in stats.items()}
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from breakpoints import (
+    _BREAKPOINTS,
+    DECILE_PERCENTILES,
+    QUINTILE_PERCENTILES,
+    _cache_path,
+    breakpoint_table,
+    bucket_codes,
+    grouped_quantiles,
+    interior_breakpoints,
+    universe_mask,
+)
+
+
+def _panel():
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame(data={"year": rng.integers(1990, 1996, n), "x": rng.normal(size=n)})
+    df.loc[rng.random(n) < 0.1, "x"] = np.nan
+    return df
+
+
+def test_grouped_quantiles_match_pandas():
+    df = _panel()
+    result = grouped_quantiles(df["x"], df["year"], DECILE_PERCENTILES)
+    expected = df.groupby("year")["x"].quantile(list(DECILE_PERCENTILES)).unstack()
+
+    assert result.index.name == "year"
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+
+
+def test_bucket_codes_match_searchsorted_per_year():
+    df = _panel()
+    bp = grouped_quantiles(df["x"], df["year"], QUINTILE_PERCENTILES)
+    codes = bucket_codes(df["x"], df["year"], bp)
+
+    for year, group in df.groupby("year"):
+        expected = np.searchsorted(bp.loc[year].to_numpy(), group["x"], side="right")
+        expected = np.where(group["x"].isna(), -1, expected)
+        np.testing.assert_array_equal(codes[group.index], expected)
+    # interior breakpoints only: the largest value of a year is in the top quintile
+    assert codes.max() == 4
+
+
+def test_group_without_breakpoints_is_missing():
+    bp = grouped_quantiles([1.0, 2.0, np.nan], [2000, 2000, 2001], [0.5])
+    assert np.isnan(bp.loc[2001, 0.5])
+    codes = bucket_codes([1.0, 2.0, 5.0, 1.0], [2000, 2000, 2001, 2002], bp)
+    np.testing.assert_array_equal(codes, [0, 1, -1, -1])
+
+
+def _cut_with_dropped_duplicates(values, n_portfolios):
+    """Per-date reference: quantile bins with duplicates dropped, as `pd.cut`."""
+    bins = values.quantile(np.linspace(0, 1, n_portfolios + 1)).drop_duplicates()
+    bins.iloc[0] = -np.inf
+    bins.iloc[bins.size - 1] = np.inf
+    return pd.cut(values, bins=bins, labels=range(1, bins.size), right=False).astype(float)
+
+
+def test_interior_breakpoints_drop_ties():
+    bp = pd.DataFrame([[0.0, 0.0, 1.0, 1.0, 2.0, 3.0], [0.0, 1.0, 1.0, 1.0, 1.0, 1.0]])
+    interior = interior_breakpoints(bp).to_numpy()
+    np.testing.assert_array_equal(interior, [[1.0, 2.0, np.inf, np.inf], [np.inf] * 4])
+
+
+def test_interior_breakpoints_match_cut_per_date():
+    df = _panel()
+    df["x"] = df["x"].round(1)
+    # many ties in one year merge its portfolios
+    df.loc[df["year"] == 1991, "x"] = (df.loc[df["year"] == 1991, "x"] > 0.5).astype(float)
+    percentiles = np.linspace(0, 1, 6)
+    breakpoints = interior_breakpoints(grouped_quantiles(df["x"], df["year"], percentiles))
+    numbers = bucket_codes(df["x"], df["year"], breakpoints, side="right") + 1
+
+    expected = df.groupby("year")["x"].transform(lambda x: _cut_with_dropped_duplicates(x, 5))
+    np.testing.assert_array_equal(numbers, expected.fillna(0))
+
+
+def test_nyse_universe():
+    ciz = pd.DataFrame(data={"primaryexch": ["N", "Q", "A"]})
+    siz = pd.DataFrame(data={"exchcd": [1, 3, 1]})
+
+    assert universe_mask(ciz, "nyse").tolist() == [True, False, False]
+    assert universe_mask(siz, "nyse").tolist() == [True, False, True]
+    assert universe_mask(siz, "all").tolist() == [True, True, True]
+    with pytest.raises(KeyError):
+        universe_mask(pd.DataFrame(data={"x": [1.0]}), "nyse")
+
+
+def test_breakpoint_table_uses_nyse_stocks_and_cache(tmp_path):
+    """
+    The NYSE median of 2000 is 2 (the Nasdaq stock with 100 is ignored). A
+    second call with a new year only computes that year and reuses 2000 from
+    the cache; a call whose 2000 NYSE values changed recomputes 2000.
+    """
+    df = pd.DataFrame(
+        data={
+            "year": [2000, 2000, 2000, 2000],
+            "exchcd": [1, 1, 1, 3],
+            "x": [1.0, 2.0, 3.0, 100.0],
+        }
+    )
+    bp = breakpoint_table(df, "x", [0.5], universe="nyse", cache_dir=tmp_path)
+    assert bp.loc[2000, 0.5] == 2.0
+    assert breakpoint_table(df, "x", [0.5], universe="all", cache_dir=tmp_path).loc[2000, 0.5] == 2.5
+
+    later = pd.concat([df, pd.DataFrame(data={"year": [2001], "exchcd": [1], "x": [7.0]})])
+    # a reused 2000 row is recognized by its fingerprint, not recomputed
+    _BREAKPOINTS[_cache_path(tmp_path, "x", (0.5,), "nyse")].loc[2000, 0.5] = -1.0
+    bp = breakpoint_table(later.sample(frac=1.0, random_state=0), "x", [0.5], universe="nyse", cache_dir=tmp_path)
+    assert bp[0.5].tolist() == [-1.0, 7.0]
+
+    # the 2000 NYSE values changed (e.g. after a re-pull): 2000 is recomputed
+    changed = pd.DataFrame(data={"year": [2000, 2001], "exchcd": [1, 1], "x": [50.0, 7.0]})
+    bp = breakpoint_table(changed, "x", [0.5], universe="nyse", cache_dir=tmp_path)
+    assert bp[0.5].tolist() == [50.0, 7.0]
+    # the Nasdaq stock is not in the NYSE reference values
+    nasdaq = pd.concat([changed, pd.DataFrame(data={"year": [2000], "exchcd": [3], "x": [0.0]})])
+    assert breakpoint_table(nasdaq, "x", [0.5], universe="nyse", cache_dir=tmp_path)[0.5].tolist() == [50.0, 7.0]
+
+    (path,) = tmp_path.glob("x_year_nyse_p50.parquet")
+    assert pd.read_parquet(path).index.tolist() == [2000, 2001]
+    # fingerprints survive the round trip through the parquet file
+    _BREAKPOINTS.clear()
+    stored = pd.read_parquet(path)
+    stored.loc[2000, "0.5"] = -2.0
+    stored.to_parquet(path)
+    assert breakpoint_table(changed, "x", [0.5], universe="nyse", cache_dir=tmp_path)[0.5].tolist() == [-2.0, 7.0]
+    refreshed = breakpoint_table(df, "x", [0.5], universe="nyse", cache_dir=tmp_path, refresh=True)
+    assert refreshed[0.5].tolist() == [2.0]
@@ -101,8 +101,10 @@ ccm = load_CRSP_Comp_Link_Table(data_dir=DATA_DIR)
 
 crsp2 = calculate_market_equity(ccm)
 crsp3, crsp_jun = use_dec_market_equity(crsp2)
-crsp3['industry5'] = crsp3['siccd'].apply(assign_industry5)
-crsp3['industry49'] = crsp3['siccd'].apply(assign_industry49)
+# Compustat historical SIC where available, CRSP SIC otherwise
+crsp3['sic'] = resolve_sic(crsp3, comp)
+crsp3['industry5'] = classify_industry5(crsp3['sic'])
+crsp3['industry49'] = classify_industry49(crsp3['sic'])
 vwret5, vwret_5n = create_industry_portfolios(crsp3, 5)
 vwret49, vwret_49n = create_industry_portfolios(crsp3, 49)
 
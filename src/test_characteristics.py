@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from characteristics import PRIOR_RETURN_WINDOWS, add_dividend_yield, add_prior_returns, prior_returns, trailing_sums
+from portfolio_sorts import SortDimension
+from rebalancing import MONTHLY, rebalanced_portfolios
+
+
+def _panel():
+    """Two stocks with gaps in their monthly histories."""
+    rng = np.random.default_rng(0)
+    months = np.arange(12 * 2000, 12 * 2004)
+    df = pd.DataFrame(
+        data={
+            "permno": np.repeat([10, 20], months.size),
+            "mdate": np.tile(months, 2),
+            "x": rng.normal(size=2 * months.size),
+        }
+    )
+    df = df[rng.random(len(df)) > 0.15].copy()
+    df.loc[df.sample(frac=0.1, random_state=0).index, "x"] = np.nan
+    # rows do not have to be sorted
+    return df.sample(frac=1.0, random_state=1)
+
+
+def _reference(df, window, skip):
+    """Sum over the calendar months of the window by reindexing to a full monthly grid."""
+    out = []
+    for _, group in df.groupby("permno"):
+        full = group.set_index("mdate")["x"].reindex(range(group["mdate"].min(), group["mdate"].max() + 1))
+        shifted = full.shift(skip)
+        sums = shifted.rolling(window, min_periods=1).sum()
+        counts = shifted.rolling(window, min_periods=1).count()
+        out.append(pd.DataFrame({"sum": sums, "count": counts}).loc[group["mdate"]].set_index(group.index))
+    return pd.concat(out).loc[df.index]
+
+
+def test_trailing_sums_match_calendar_rolling_sums():
+    df = _panel()
+    for window, skip in [(12, 0), (11, 1), (3, 2)]:
+        sums, counts = trailing_sums(df["x"], df["permno"], df["mdate"], window, skip=skip)
+        expected = _reference(df, window, skip)
+        np.testing.assert_array_equal(counts, expected["count"].fillna(0))
+        np.testing.assert_allclose(sums, expected["sum"].where(expected["count"] > 0))
+
+
+def test_dividend_yield_sums_twelve_months():
+    months = np.arange(12 * 2000, 12 * 2002)
+    df = pd.DataFrame(
+        data={
+            "permno": 1,
+            "mdate": months,
+            # a 1% dividend every quarter on 100 of lagged ME
+            "ret": np.where(months % 3 == 2, 0.02, 0.01),
+            "retx": 0.01,
+            "L_me": 100.0,
+            "me": 200.0,
+        }
+    )
+    add_dividend_yield(df)
+
+    np.testing.assert_allclose(df["div"], np.where(months % 3 == 2, 1.0, 0.0), atol=1e-12)
+    assert df["dy"].isna().sum() == 11
+    # four quarterly dividends of 1 over ME of 200
+    np.testing.assert_allclose(df["dy"].dropna(), 4 / 200)
+    np.testing.assert_allclose(add_dividend_yield(df, min_months=1)["dy"].iloc[2], 1 / 200)
+
+
+def test_prior_returns_compound_the_window_with_gaps():
+    df = _panel()
+    df["ret"] = df["x"] / 10
+    add_prior_returns(df)
+
+    for name, (window, skip, min_months) in PRIOR_RETURN_WINDOWS.items():
+        expected = []
+        for _, group in df.groupby("permno"):
+            full = group.set_index("mdate")["ret"].reindex(range(group["mdate"].min(), group["mdate"].max() + 1))
+            gross = (1 + full.shift(skip)).rolling(window, min_periods=min_months).apply(np.prod, raw=True) - 1
+            expected.append(gross.loc[group["mdate"]].set_axis(group.index))
+        np.testing.assert_allclose(df[name], pd.concat(expected).loc[df.index])
+    # a gap inside the window leaves momentum missing
+    assert df["mom_2_12"].isna().sum() > df["rev_1_1"].isna().sum()
+
+
+def test_a_total_loss_only_affects_its_windows():
+    ret = np.array([0.1, -1.0, 0.2, 0.1, 0.1, 0.1])
+    ids, months = np.zeros(6), np.arange(6)
+    result = prior_returns(ret, ids, months, window=2)
+
+    np.testing.assert_allclose(result, [np.nan, -1.0, -1.0, 1.2 * 1.1 - 1, 1.1 * 1.1 - 1, 1.1 * 1.1 - 1])
+    skipped = prior_returns(ret, ids, months, window=2, skip=1)
+    np.testing.assert_allclose(skipped, [np.nan, np.nan, -1.0, -1.0, 1.2 * 1.1 - 1, 1.1 * 1.1 - 1])
+
+
+def test_momentum_feeds_monthly_rebalancing(tmp_path):
+    rng = np.random.default_rng(1)
+    months = np.arange(12 * 2000, 12 * 2003)
+    df = pd.DataFrame(data={"permno": np.repeat(np.arange(50), months.size), "mdate": np.tile(months, 50)})
+    df["ret"] = rng.normal(0.01, 0.1, len(df))
+    df["L_me"] = 1.0
+    add_prior_returns(df)
+
+    dims = [SortDimension("mom_2_12", [0.5], labels=["Lo", "Hi"])]
+    holdings = rebalanced_portfolios(df, df, dims, [MONTHLY], universe="all", cache_dir=tmp_path)["monthly"]
+    # the first momentum (January to November 2000) is sorted at the end of
+    # December 2000 and held from January 2001
+    assert holdings["mdate"].min() == 12 * 2001
+    assert (holdings.groupby("mdate")["portfolio"].value_counts() == 25).all()
+    assert len(holdings) == 50 * (months.size - 12)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cross_section import cross_sectional_transforms, transform_characteristics, winsorize
+
+
+def _panel():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame(
+        data={
+            "year": rng.integers(1990, 1996, n),
+            "ep": rng.standard_t(2, n),
+            "op": rng.integers(0, 20, n).astype(float),  # many ties
+        }
+    )
+    df.loc[rng.random(n) < 0.1, "ep"] = np.nan
+    df.loc[df.sample(5, random_state=0).index, "year"] = np.nan
+    return df
+
+
+def _reference(df, column, limits=(0.01, 0.99)):
+    grouped = df.groupby("year")[column]
+    lower = grouped.transform(lambda x: x.quantile(limits[0]))
+    upper = grouped.transform(lambda x: x.quantile(limits[1]))
+    winsorized = df[column].clip(lower, upper).where(df["year"].notna())
+    wgrouped = winsorized.groupby(df["year"])
+    z = (winsorized - wgrouped.transform("mean")) / wgrouped.transform("std")
+    return winsorized, grouped.rank(pct=True), z
+
+
+def test_transforms_match_groupby():
+    df = _panel()
+    result = cross_sectional_transforms(df, ["ep", "op"])
+
+    assert list(result.columns) == ["ep_w", "ep_rank", "ep_z", "op_w", "op_rank", "op_z"]
+    for column in ["ep", "op"]:
+        winsorized, rank, z = _reference(df, column)
+        np.testing.assert_allclose(result[f"{column}_w"], winsorized)
+        np.testing.assert_allclose(result[f"{column}_rank"], rank)
+        np.testing.assert_allclose(result[f"{column}_z"], z)
+
+
+def test_winsorize_clips_outliers_per_year():
+    df = _panel()
+    clipped = winsorize(df, ["ep"], limits=(0.05, 0.95))
+
+    assert list(clipped.columns) == ["ep"]
+    bounds = df.groupby("year")["ep"].quantile([0.05, 0.95]).unstack()
+    assert (clipped["ep"].groupby(df["year"]).max() <= bounds[0.95] + 1e-12).all()
+    assert clipped["ep"].isna().equals(df["ep"].isna() | df["year"].isna())
+
+
+def test_without_winsorizing():
+    df = _panel()
+    result = cross_sectional_transforms(df, ["ep"], limits=None, transforms=("zscore",))
+
+    grouped = df.groupby("year")["ep"]
+    expected = (df["ep"] - grouped.transform("mean")) / grouped.transform("std")
+    np.testing.assert_allclose(result["ep_z"], expected)
+
+
+def test_transform_characteristics_replaces_the_columns():
+    df = _panel()
+    expected = cross_sectional_transforms(df, ["ep"], transforms=("zscore",))["ep_z"]
+
+    result = transform_characteristics(df.copy(), ["ep"], transform="zscore", limits=(0.01, 0.99))
+    np.testing.assert_allclose(result["ep"], expected)
+    assert transform_characteristics(df.copy(), ["ep"], transform="none")["ep"].equals(df["ep"])
+    with pytest.raises(ValueError):
+        transform_characteristics(df.copy(), ["ep"], transform="demean")
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from daily_portfolios import daily_industry_portfolios, daily_weights, june_formation_sic
+from month_index import month_index
+
+
+def _monthly():
+    """
+    Permno 1 (SIC 2834, Hlth) and permno 2 (SIC 7372, HiTec) with ME at the
+    end of December 1999 of 100 and 300, and of January 2000 of 200 and 300.
+    """
+    return pd.DataFrame(
+        data={
+            "permno": [1, 1, 2, 2],
+            "mdate": month_index(pd.to_datetime(["2000-01-31", "2000-02-29"] * 2)),
+            "sic": [2834, 2834, 7372, 7372],
+            "L_me": [100.0, 200.0, 300.0, 300.0],
+        }
+    )
+
+
+def _daily(year):
+    dates = pd.to_datetime(["2000-01-03", "2000-01-04", "2000-01-05", "2000-02-01"])
+    daily = pd.DataFrame(
+        data={
+            "permno": [1] * 4 + [2] * 4,
+            "date": list(dates) * 2,
+            "ret": [0.1, -0.5, 0.2, 0.0, 0.0, 0.1, np.nan, 0.1],
+            "retx": [0.1, -0.5, 0.2, 0.0, 0.0, 0.1, np.nan, 0.1],
+        }
+    )
+    return daily[daily["date"].dt.year == year].iloc[::-1]
+
+
+def test_june_formation_sic():
+    monthly = pd.DataFrame(
+        data={
+            "permno": [1, 1, 1, 1],
+            "mdate": month_index(
+                pd.to_datetime(["2000-05-31", "2000-06-30", "2001-06-30", "2001-07-31"])
+            ),
+            "sic": [100, 200, 300, 400],
+        }
+    )
+    # June 2000 is held from July 2000, so May and June 2000 have no assignment yet
+    np.testing.assert_array_equal(june_formation_sic(monthly), [np.nan, np.nan, 200.0, 300.0])
+
+
+def test_weights_drift_within_the_month():
+    panel = daily_weights(_daily(2000), _monthly())
+
+    # permno 1: 100, 100 * 1.1, 100 * 1.1 * 0.5, then February restarts from ME 200
+    np.testing.assert_allclose(panel["wt"][:4], [100.0, 110.0, 55.0, 200.0])
+    # a missing retx leaves the weight unchanged
+    np.testing.assert_allclose(panel["wt"][4:], [300.0, 300.0, 330.0, 300.0])
+
+
+def test_daily_industry_portfolios_streams_years():
+    loaded = []
+
+    def load_daily(year):
+        loaded.append(year)
+        return _daily(year)
+
+    ports = daily_industry_portfolios(_monthly(), [1999, 2000], load_daily=load_daily, schemes=(5,))
+
+    assert loaded == [1999, 2000]
+    assert ports["industry"].tolist() == ["HiTec", "Hlth"] * 4
+    assert ports["date"].nunique() == 4
+    hitec = ports[ports["industry"] == "HiTec"]
+    np.testing.assert_allclose(hitec["vwret"], [0.0, 0.1, np.nan, 0.1])
+    assert hitec["n_firms"].tolist() == [1, 1, 0, 1]
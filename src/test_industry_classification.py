@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from industry_classification import (
+    FAMA_FRENCH_SCHEMES,
+    INDUSTRY5_PORTFOLIOS,
+    INDUSTRY49,
+    INDUSTRY49_PORTFOLIOS,
+    IndustryClassifier,
+    classify_industry5,
+    classify_industry49,
+    format_siccodes,
+    get_classifier,
+    load_classifier,
+    parse_siccodes,
+    resolve_sic,
+    siccodes_path,
+    unofficial_siccodes,
+)
+
+
+def _reference(portfolios, sic_code, other):
+    """Row-by-row assignment: the first range that contains the code wins."""
+    for name, ranges in portfolios.items():
+        for start, end in ranges:
+            if start <= sic_code <= end:
+                return name
+    return other
+
+
+def test_lookup_matches_range_scan():
+    sic = np.arange(10_000)
+    expected = [_reference(INDUSTRY5_PORTFOLIOS, s, "Other") for s in sic]
+    assert classify_industry5(sic).tolist() == expected
+
+
+def test_first_match_wins():
+    classifier = IndustryClassifier({"A": [(10, 20)], "B": [(15, 30)]})
+    assert classifier.classify([12, 18, 25, 40]).tolist() == ["A", "A", "B", "Other"]
+
+
+def test_classify_returns_categorical_with_index():
+    siccd = pd.Series([2834.0, 7372.0, np.nan, 4950.0], index=[10, 11, 12, 13])
+    result = classify_industry49(siccd)
+
+    assert isinstance(result.dtype, pd.CategoricalDtype)
+    assert result.index.tolist() == [10, 11, 12, 13]
+    assert result.tolist() == ["Drugs", "Softw", "Invalid SIC Code", "Other"]
+    assert classify_industry5(siccd).tolist() == ["Hlth", "HiTec", "Other", "Other"]
+
+
+SICCODES_SAMPLE = """\
+ 1 Agric  Agriculture
+          0100-0199 Agricultural production - crops
+          0200-0299 Agricultural production - livestock
+
+ 2 Food   Food Products
+          2000-2009 Food and kindred products
+ 3 Other  Almost Nothing
+          4950-4959 Sanitary services
+"""
+
+
+def test_parse_siccodes():
+    portfolios = parse_siccodes(SICCODES_SAMPLE)
+    assert portfolios == {
+        "Agric": [(100, 199), (200, 299)],
+        "Food": [(2000, 2009)],
+        "Other": [(4950, 4959)],
+    }
+    assert parse_siccodes(format_siccodes(portfolios, header="comment")) == portfolios
+
+
+def test_official_siccodes_are_vendored():
+    missing = unofficial_siccodes()
+    if missing:
+        pytest.skip(f"no official Siccodes file for {missing}; run `python src/industry_classification.py`")
+    for n in FAMA_FRENCH_SCHEMES:
+        industries = parse_siccodes(siccodes_path(n))
+        # the last industry ("Other") may be defined without SIC ranges
+        assert n - 1 <= len(industries) <= n
+        assert get_classifier(n).classify_one(2834) in industries
+
+
+def test_definition_files_compile_to_the_builtin_schemes(tmp_path, monkeypatch):
+    import industry_classification
+
+    vendored = tmp_path / "vendored"
+    vendored.mkdir()
+    (vendored / "Siccodes49.txt").write_text(format_siccodes(INDUSTRY49_PORTFOLIOS), encoding="latin-1")
+    monkeypatch.setattr(industry_classification, "VENDORED_SICCODES_DIR", vendored)
+    assert unofficial_siccodes([49]) == []
+    assert parse_siccodes(siccodes_path(49)) == INDUSTRY49_PORTFOLIOS
+
+    classifier = load_classifier(49, cache_dir=tmp_path)
+    np.testing.assert_array_equal(classifier.lookup, INDUSTRY49.lookup)
+    assert classifier.labels == INDUSTRY49.labels
+
+    (cache_file,) = tmp_path.glob("siccodes49_*.npz")
+    cached = IndustryClassifier.load(cache_file)
+    np.testing.assert_array_equal(cached.lookup, INDUSTRY49.lookup)
+    assert cached.classify_one("abc") == "Invalid SIC Code"
+
+
+def test_every_scheme_is_read_from_its_definition_file(tmp_path, monkeypatch):
+    import industry_classification
+
+    for n, builtin in [(5, INDUSTRY5_PORTFOLIOS), (49, INDUSTRY49_PORTFOLIOS)]:
+        assert get_classifier(n) is load_classifier(n)
+        assert list(get_classifier(n).labels[: len(builtin)]) == list(builtin)
+    with pytest.raises(ValueError):
+        get_classifier(7)
+
+    # without the vendored files, a scheme asks for them to be vendored
+    monkeypatch.setattr(industry_classification, "VENDORED_SICCODES_DIR", tmp_path / "vendored")
+    monkeypatch.setattr(industry_classification, "PULLED_SICCODES_DIR", tmp_path / "pulled")
+    with pytest.raises(FileNotFoundError, match="vendor"):
+        get_classifier(10)
+
+
+def test_resolve_sic_prefers_compustat_sich():
+    """
+    gvkey 001 reports sich 2834 for fiscal 2000 and a missing sich for fiscal
+    2001, so only its 2001 row can use sich; the 2002 row falls back to siccd.
+    The permno without a gvkey always keeps siccd. Without a reporting lag
+    the 2001 row uses sich; with the default six-month lag it does not.
+    """
+    panel = pd.DataFrame(
+        data={
+            "gvkey": ["001", "001", "001", "002", "002", None],
+            "date": pd.to_datetime(
+                ["2000-01-31", "2001-01-31", "2002-06-30", "2000-01-31", "2003-01-31", "2000-01-31"]
+            ),
+            "siccd": [100, 100, 100, 200, 200, 300],
+        },
+        index=[5, 4, 3, 2, 1, 0],
+    )
+    comp = pd.DataFrame(
+        data={
+            "gvkey": ["001", "001", "002"],
+            "datadate": pd.to_datetime(["2001-12-31", "2000-12-31", "2001-12-31"]),
+            "sich": [np.nan, 2834.0, 7372.0],
+        }
+    )
+    result = resolve_sic(panel, comp, lag_months=0)
+
+    assert result.index.tolist() == [5, 4, 3, 2, 1, 0]
+    assert result.tolist() == [100.0, 2834.0, 100.0, 200.0, 7372.0, 300.0]
+    # by default fiscal 2000 is only known from June 2001
+    assert resolve_sic(panel, comp).tolist() == [100.0, 100.0, 100.0, 200.0, 7372.0, 300.0]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import MonthEnd, YearEnd
+
+import month_index
+
+
+dates = pd.Series(
+    pd.to_datetime(
+        [
+            "1951-07-31",
+            "1999-12-31",
+            "2000-01-31",
+            "2000-02-29",
+            "2000-06-30",
+            "2000-07-31",
+            "2020-01-30",  # last trading day, not a month end
+            "2023-12-29",
+        ]
+    )
+)
+
+
+def test_ff_year_and_month_match_month_end_offsets():
+    """
+    The integer Fama-French year/month must match the original
+    `date + MonthEnd(-6)` computation, including for dates that are not
+    month ends.
+    """
+    mi = month_index.month_index(dates)
+    ffdate = dates + MonthEnd(-6)
+
+    np.testing.assert_array_equal(month_index.ff_year(mi), ffdate.dt.year.values)
+    np.testing.assert_array_equal(month_index.ff_month(mi), ffdate.dt.month.values)
+    np.testing.assert_array_equal(month_index.year_of(mi), dates.dt.year.values)
+    np.testing.assert_array_equal(month_index.month_of(mi), dates.dt.month.values)
+
+
+def test_june_formation_month_matches_year_end_offsets():
+    mi = month_index.month_index(dates)
+    jdate = dates + YearEnd(0) + MonthEnd(6)
+
+    np.testing.assert_array_equal(
+        month_index.june_formation_month(mi),
+        month_index.month_index(jdate),
+    )
+
+
+def test_round_trip_to_month_end_dates():
+    mi = month_index.month_index(dates)
+
+    assert mi.dtype == np.int32
+    pd.testing.assert_index_equal(
+        month_index.month_index_to_date(mi),
+        pd.DatetimeIndex(dates + MonthEnd(0)),
+    )
+    assert month_index.month_index_to_yyyymm(mi)[0] == 195107
+    assert month_index.month_index_to_yyyymm(mi)[3] == 200002
+
+
+def test_add_month_index_columns():
+    df = pd.DataFrame({"date": pd.to_datetime(["2000-06-30", "2000-07-31"])})
+    df = month_index.add_month_index_columns(df, "date")
+
+    assert df["year"].tolist() == [2000, 2000]
+    assert df["month"].tolist() == [6, 7]
+    assert df["ffyear"].tolist() == [1999, 2000]
+    assert df["ffmonth"].tolist() == [12, 1]
+    assert (df["mdate"].diff().dropna() == 1).all()
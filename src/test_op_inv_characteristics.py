@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from calc_op_inv_portfolios import (
+    OP_INV_DIMENSIONS,
+    create_op_inv_characteristics,
+    create_op_inv_portfolios,
+    create_rebalanced_op_inv_portfolios,
+)
+from month_index import ff_year, month_index_to_date
+from portfolio_holdings import expand_holdings
+from portfolio_sorts import sort_codes
+
+
+def test_characteristics_come_from_the_weighted_holdings():
+    # CRSP ME and Compustat BE are both in $ millions
+    holdings = pd.DataFrame(
+        data={
+            "date": pd.to_datetime(["2000-07-31"] * 3 + ["2000-08-31"]),
+            "opport": ["OP1", "OP1", "OP5", "OP1"],
+            "invport": ["INV1", "INV1", "INV5", "INV1"],
+            "retx": [0.01, 0.02, 0.03, 0.04],
+            "weight": [1.0, 3.0, 2.0, 1.0],
+            "me": [1000.0, 3000.0, 500.0, 2000.0],
+            "be": [500.0, 3000.0, 250.0, 500.0],
+            "op": [0.1, 0.3, 0.2, 0.1],
+            "inv": [0.05, 0.15, 0.1, 0.05],
+        }
+    )
+    result = create_op_inv_characteristics(holdings)
+
+    # one row per holding month and portfolio, average firm size in $ millions
+    assert list(result["date"].dt.month) == [7, 7, 8]
+    np.testing.assert_allclose(result["avg_size"], [2000.0, 500.0, 2000.0])
+    # BE/ME is a plain ratio, weighted like the returns: (0.5 * 1 + 1.0 * 3) / 4
+    np.testing.assert_allclose(result["vw_beme"], [0.875, 0.5, 0.25])
+    np.testing.assert_allclose(result["sum_be_sum_me"], [3500 / 4000, 0.5, 0.25])
+    np.testing.assert_allclose(result["vw_op"], [0.25, 0.2, 0.1])
+
+    # the returns are those of create_op_inv_portfolios with the same weights
+    vwret_m = create_op_inv_portfolios(holdings, weight_col="weight")[0]
+    np.testing.assert_allclose(vwret_m.stack([1, 2])["value_weighted_ret"], result["vwret"])
+    np.testing.assert_allclose(result["vwret"], [(0.01 + 0.06) / 4, 0.03, 0.04])
+
+
+def test_rebalanced_sorts_match_the_annual_sort_in_july(tmp_path):
+    rng = np.random.default_rng(0)
+    permnos = np.arange(1, 51)
+    ccm3 = pd.DataFrame(data={"permno": np.repeat(permnos, 2), "year": np.tile([2000, 2001], permnos.size)})
+    ccm3["exchcd"] = np.where(ccm3["permno"] % 2 == 0, 1, 3)
+    ccm3["year_op"] = rng.normal(size=len(ccm3))
+    ccm3["year_inv"] = rng.normal(size=len(ccm3))
+    codes = sort_codes(ccm3, OP_INV_DIMENSIONS, date_col="year", cache_dir=tmp_path / "annual")
+    ccm3["opport"] = pd.Categorical.from_codes(codes[:, 0], categories=OP_INV_DIMENSIONS[0].labels)
+    ccm3["invport"] = pd.Categorical.from_codes(codes[:, 1], categories=OP_INV_DIMENSIONS[1].labels)
+    ccm3["formation_year"] = ccm3["year"] + 1
+
+    months = np.arange(12 * 2001 + 5, 12 * 2003 + 6)
+    crsp3 = pd.DataFrame(data={"permno": np.repeat(permnos, months.size), "mdate": np.tile(months, permnos.size)})
+    crsp3["exchcd"] = np.where(crsp3["permno"] % 2 == 0, 1, 3)
+    crsp3["date"] = month_index_to_date(crsp3["mdate"])
+    crsp3["ffyear"] = ff_year(crsp3["mdate"])
+    crsp3["retx"] = rng.normal(0.01, 0.05, len(crsp3))
+    crsp3["L_me"] = rng.lognormal(size=len(crsp3))
+    # the drifted annual weight is last month's ME in July
+    crsp3["wt"] = crsp3["L_me"]
+
+    holdings = expand_holdings(ccm3, crsp3, ["opport", "invport"], year_col="formation_year",
+                               date_col="date", ret_col="retx", weight_col="wt")
+    annual = create_op_inv_portfolios(holdings, weight_col="weight")
+    rebalanced = create_rebalanced_op_inv_portfolios(ccm3, crsp3, cache_dir=tmp_path / "rebalanced")
+
+    assert list(rebalanced) == ["quarterly", "monthly"]
+    for vwret, ewret, n_firms in rebalanced.values():
+        july = vwret.index.month == 7
+        assert july.sum() == 2
+        pd.testing.assert_frame_equal(vwret[july], annual[0].loc[vwret.index[july]], check_freq=False)
+        pd.testing.assert_frame_equal(n_firms[july], annual[2].loc[n_firms.index[july]], check_freq=False)
+        # formed every quarter / month: every month after the first formation is held
+        assert len(vwret) == months.size - 1
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel_index import PanelIndex
+
+
+def _panel():
+    """
+    permno 1 is observed in months 0, 1, 2, permno 2 in months 1, 2 and
+    permno 5 only in month 2.
+    """
+    return pd.DataFrame(
+        data={
+            "permno": [1, 1, 1, 2, 2, 5],
+            "mdate": [0, 1, 2, 1, 2, 2],
+            "me": [10.0, 11.0, 12.0, 20.0, 22.0, 50.0],
+        }
+    )
+
+
+def test_offsets():
+    idx = PanelIndex.from_frame(_panel(), "permno", "mdate")
+
+    np.testing.assert_array_equal(idx.ids, [1, 2, 5])
+    np.testing.assert_array_equal(idx.id_offsets, [0, 3, 5, 6])
+    np.testing.assert_array_equal(idx.times, [0, 1, 2])
+    np.testing.assert_array_equal(idx.time_offsets, [0, 1, 3, 6])
+    np.testing.assert_array_equal(idx.rows_for_time(2), [2, 4, 5])
+    np.testing.assert_array_equal(idx.time_codes(), [0, 1, 2, 1, 2, 2])
+    assert idx.rows_for_id(2) == slice(3, 5)
+    assert idx.rows_for_id(3) == slice(0, 0)
+
+
+def test_grouped_operations_match_groupby():
+    df = _panel()
+    idx = PanelIndex.from_frame(df, "permno", "mdate")
+
+    np.testing.assert_array_equal(
+        idx.cumcount(), df.groupby("permno").cumcount().values
+    )
+    for periods in [1, 2, -1]:
+        np.testing.assert_array_equal(
+            idx.shift(df["me"].values, periods),
+            df.groupby("permno")["me"].shift(periods).values,
+        )
+
+
+def test_unsorted_panel_is_rejected():
+    df = _panel().iloc[::-1]
+    with pytest.raises(ValueError):
+        PanelIndex.from_frame(df, "permno", "mdate")
+
+
+def test_save_and_load(tmp_path):
+    idx = PanelIndex.from_frame(_panel(), "permno", "mdate")
+    path = tmp_path / "panel_index.npz"
+    idx.save(path)
+    loaded = PanelIndex.load(path)
+
+    np.testing.assert_array_equal(loaded.id_offsets, idx.id_offsets)
+    np.testing.assert_array_equal(loaded.time_order, idx.time_order)
+    np.testing.assert_array_equal(loaded.row_time, idx.row_time)
+    assert len(loaded) == len(idx)
@@ -0,0 +1,228 @@
+import ast
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pl = pytest.importorskip("polars")
+import polars_backend
+
+
+def test_calculate_market_equity_aggregates_permco():
+    """
+    permnos 1 and 2 belong to permco 10. On each date the summed ME of the
+    permco (100 + 300 = 400, then 120 + 200 = 320) is assigned to the permno
+    with the largest ME.
+    """
+    crsp = pd.DataFrame(
+        data={
+            "permno": [1, 2, 1, 2, 3, 3],
+            "permco": [10, 10, 10, 10, 30, 30],
+            "mdate": [0, 0, 1, 1, 0, 1],
+            "mthprc": [1.0, 3.0, 1.2, 2.0, 5.0, 5.0],
+            "shrout": [100.0, 100.0, 100.0, 100.0, 10.0, 10.0],
+        }
+    )
+    result = polars_backend.collect_to_pandas(
+        polars_backend.calculate_market_equity(crsp)
+    )
+
+    assert result["permno"].tolist() == [2, 2, 3, 3]
+    assert result["me"].tolist() == [400.0, 320.0, 50.0, 50.0]
+
+
+def test_create_portfolios():
+    """
+    Portfolio A in month 0 holds ME 100 with return 0.1 and ME 300 with
+    return -0.1, so VW = (10 - 30) / 400 = -0.05 and EW = 0.
+    The missing return in portfolio B counts in neither the VW or EW return
+    nor the number of firms, as in `portfolio_aggregation`.
+    """
+    df = pd.DataFrame(
+        data={
+            "jdate": pd.to_datetime(["2000-01-31"] * 4),
+            "port": ["A", "A", "B", "B"],
+            "mthret": [0.1, -0.1, 0.2, np.nan],
+            "me": [100.0, 300.0, 50.0, 50.0],
+        }
+    )
+    result = polars_backend.collect_to_pandas(
+        polars_backend.create_portfolios(df, "jdate", ["port"], "mthret", "me")
+    )
+
+    np.testing.assert_allclose(result["value_weighted_ret"], [-0.05, 0.2])
+    np.testing.assert_allclose(result["equal_weighted_ret"], [0.0, 0.2])
+    assert result["n_firms"].tolist() == [2, 1]
+
+
+def _panel_with_missing_returns():
+    rng = np.random.default_rng(0)
+    n = 2000
+    df = pd.DataFrame(
+        data={
+            "date": pd.Timestamp("2000-01-31") + pd.to_timedelta(rng.integers(0, 12, n) * 31, "D"),
+            "industry5": rng.choice(["Cnsmr", "Manuf", "HiTec", "Hlth", "Other"], n),
+            "opport": rng.choice(["OP1", "OP2"], n),
+            "invport": rng.choice(["INV1", "INV2"], n),
+            "ret": rng.normal(0.01, 0.1, n),
+            "wt": rng.lognormal(size=n),
+        }
+    )
+    df["retx"] = df["ret"]
+    df.loc[rng.random(n) < 0.1, ["ret", "retx"]] = np.nan
+    # a portfolio-month without any return and one with zero total weight
+    df.loc[(df["industry5"] == "Hlth") & (df["date"] == df["date"].min()), ["ret", "retx"]] = np.nan
+    df.loc[(df["industry5"] == "Other") & (df["date"] == df["date"].max()), "wt"] = 0.0
+    return df
+
+
+def test_industry_portfolios_match_pandas_with_missing_returns():
+    from portfolio_aggregation import portfolio_table
+
+    df = _panel_with_missing_returns()
+    vwret, vwret_n = polars_backend.collect_to_pandas(*polars_backend.create_industry_portfolios(df, 5))
+
+    expected = portfolio_table(df, ["date", "industry5"], ret_col="ret", weight_col="wt")
+    assert vwret["vwret"].isna().sum() == 2
+    np.testing.assert_allclose(vwret["vwret"], expected["vwret"])
+    np.testing.assert_array_equal(vwret_n["ret"], expected["n_firms"])
+
+
+def test_op_inv_portfolios_match_pandas_with_missing_returns():
+    from calc_op_inv_portfolios import create_op_inv_portfolios
+
+    df = _panel_with_missing_returns()
+    result = polars_backend.create_op_inv_portfolios(df, weight_col="wt")
+    expected = create_op_inv_portfolios(df, weight_col="wt")
+    for got, want in zip(result, expected):
+        pd.testing.assert_frame_equal(got, want, check_dtype=False, check_names=False)
+
+
+def _univariate_stages():
+    """
+    The pandas CIZ stages of `calc_univariate_portfolios`. The script loads
+    WRDS data when imported, so only its imports and these functions are run.
+    """
+    names = {"calculate_market_equity", "use_dec_market_equity", "merge_CRSP_and_Compustat"}
+    path = Path(__file__).with_name("calc_univariate_portfolios.py")
+    tree = ast.parse(path.read_text())
+    body = [
+        node for node in tree.body
+        if isinstance(node, ast.Import)
+        or (isinstance(node, ast.ImportFrom) and not node.module.startswith("load_"))
+        or (isinstance(node, ast.FunctionDef) and node.name in names)
+    ]
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), str(path), "exec"), namespace)
+    return {name: namespace[name] for name in names}
+
+
+def _crsp_fixture():
+    """
+    Three years of monthly data for five permnos. permnos 1 and 5 share
+    permco 10, permno 4 starts in June 1999 and one return is missing.
+    """
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("1999-01-31", "2001-12-31", freq="M")
+    df = pd.DataFrame(
+        data=[
+            (permno, permco, date)
+            for permno, permco in [(1, 10), (5, 10), (2, 20), (3, 30), (4, 40)]
+            for date in dates[5 if permno == 4 else 0:]
+        ],
+        columns=["permno", "permco", "date"],
+    )
+    n = len(df)
+    df["mthprc"] = rng.uniform(5, 50, n)
+    df["shrout"] = rng.uniform(100, 1000, n)
+    df["mthretx"] = rng.normal(0.01, 0.05, n)
+    df["mthret"] = df["mthretx"] + 0.002
+    df.loc[7, ["mthretx", "mthret"]] = np.nan
+    return df
+
+
+def _ciz_fixture():
+    from month_index import month_index
+
+    crsp = _crsp_fixture().rename(columns={"date": "jdate"})
+    crsp["mthcaldt"] = crsp["jdate"] - pd.Timedelta(days=1)
+    crsp["mdate"] = month_index(crsp["mthcaldt"])
+    for column in ["sharetype", "securitytype", "securitysubtype", "usincflg",
+                   "issuertype", "primaryexch", "conditionaltype", "tradingstatusflg"]:
+        crsp[column] = "NS"
+    return crsp
+
+
+def _compustat_fixture():
+    """Fiscal years of three gvkeys; gvkey 200 changes its link in July 2000."""
+    comp = pd.DataFrame(
+        data={
+            "gvkey": [100, 100, 100, 200, 200, 400],
+            "datadate": pd.to_datetime(
+                ["1998-12-31", "1999-12-31", "2000-12-31", "1999-06-30", "2000-06-30", "2000-09-30"]
+            ),
+            "ni": [5.0, 6.0, np.nan, 2.0, 3.0, 1.0],
+            "ebit": [8.0, 9.0, 10.0, 4.0, 5.0, 2.0],
+            "dp": [1.0, np.nan, 1.0, 1.0, 1.0, 0.5],
+            "txditc": [0.5, 0.5, np.nan, 0.0, 0.0, 0.0],
+        }
+    )
+    ccm = pd.DataFrame(
+        data={
+            "gvkey": [100, 200, 200, 400],
+            "permno": [2, 3, 3, 4],
+            "linkdt": pd.to_datetime(["1990-01-01", "1990-01-01", "2000-07-01", "1999-01-01"]),
+            "linkenddt": pd.to_datetime([None, "2000-06-30", None, "2000-06-29"]),
+        }
+    )
+    return comp, ccm
+
+
+def _assert_same(got, want):
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), want.reset_index(drop=True))
+
+
+def test_use_dec_market_equity_matches_pandas():
+    stages = _univariate_stages()
+    crsp = _ciz_fixture()
+
+    crsp3, crsp_jun = stages["use_dec_market_equity"](stages["calculate_market_equity"](crsp.copy()))
+    result = polars_backend.collect_to_pandas(
+        *polars_backend.use_dec_market_equity(polars_backend.calculate_market_equity(crsp.copy()))
+    )
+
+    assert len(crsp_jun) > 0
+    _assert_same(result[0], crsp3)
+    _assert_same(result[1], crsp_jun)
+
+
+def test_use_dec_market_equity_siz_matches_pandas():
+    from calc_op_inv_portfolios import calculate_market_equity, use_dec_market_equity
+
+    crsp = _crsp_fixture().rename(columns={"mthretx": "retx", "mthret": "ret"})
+    crsp["me"] = crsp["mthprc"] * crsp["shrout"]
+
+    crsp3, crsp_jun = use_dec_market_equity(calculate_market_equity(crsp.copy()))
+    crsp2 = polars_backend.calculate_market_equity(crsp.copy(), date_col="date", price_col=None)
+    result = polars_backend.collect_to_pandas(*polars_backend.use_dec_market_equity(crsp2, flavor="siz"))
+
+    assert len(crsp_jun) > 0
+    _assert_same(result[0], crsp3)
+    _assert_same(result[1], crsp_jun)
+
+
+def test_merge_CRSP_and_Compustat_matches_pandas():
+    stages = _univariate_stages()
+    comp, ccm = _compustat_fixture()
+    _, crsp_jun = stages["use_dec_market_equity"](stages["calculate_market_equity"](_ciz_fixture()))
+
+    ccm_jun, ccm1 = stages["merge_CRSP_and_Compustat"](crsp_jun.copy(), comp.copy(), ccm.copy())
+    result = polars_backend.collect_to_pandas(
+        *polars_backend.merge_CRSP_and_Compustat(crsp_jun.copy(), comp.copy(), ccm.copy())
+    )
+
+    # open links end "today", which differs between the two calls
+    assert len(ccm_jun) == 3
+    _assert_same(result[0].drop(columns="linkenddt"), ccm_jun.drop(columns="linkenddt"))
+    _assert_same(result[1].drop(columns="linkenddt"), ccm1.drop(columns="linkenddt"))
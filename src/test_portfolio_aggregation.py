@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from industry_classification import classify_industry5
+from portfolio_aggregation import (
+    group_stats,
+    industry_portfolios,
+    membership_portfolios,
+    portfolio_table,
+    scheme_frames,
+)
+
+
+def _panel():
+    """
+    Two months; SIC 2834 is Hlth (5 industries) and Drugs (49 industries),
+    SIC 7372 is HiTec and Softw, SIC 2000 is Cnsmr and Food.
+    """
+    return pd.DataFrame(
+        data={
+            "date": pd.to_datetime(["2000-01-31"] * 3 + ["2000-02-29"] * 3),
+            "sic": [2834, 2834, 7372, 2834, 7372, 2000],
+            "ret": [0.1, -0.1, 0.05, 0.2, np.nan, 0.0],
+            "wt": [100.0, 300.0, 50.0, 10.0, 20.0, 30.0],
+        }
+    )
+
+
+def test_group_stats():
+    keys = np.array([0, 0, 1, 1])
+    result = group_stats(keys, 3, [0.1, -0.1, 0.2, np.nan], [100.0, 300.0, 50.0, 50.0])
+
+    np.testing.assert_allclose(result["vwret"], [-0.05, 0.2, np.nan])
+    np.testing.assert_allclose(result["ewret"], [0.0, 0.2, np.nan])
+    assert result["n_firms"].tolist() == [2, 1, 0]
+    assert result["n_rows"].tolist() == [2, 2, 0]
+
+
+def test_industry_portfolios_all_schemes_in_one_frame():
+    ports = industry_portfolios(_panel(), schemes=(5, 49))
+
+    assert ports[["scheme", "industry"]].values.tolist() == [
+        [5, "HiTec"], [5, "Hlth"],
+        [5, "Cnsmr"], [5, "HiTec"], [5, "Hlth"],
+        [49, "Drugs"], [49, "Softw"],
+        [49, "Food"], [49, "Drugs"], [49, "Softw"],
+    ]
+    hlth = ports[(ports["scheme"] == 5) & (ports["industry"] == "Hlth")]
+    np.testing.assert_allclose(hlth["vwret"], [-0.05, 0.2])
+    np.testing.assert_allclose(hlth["ewret"], [0.0, 0.2])
+    assert hlth["n_firms"].tolist() == [2, 1]
+
+    # the only February HiTec stock has no return
+    softw = ports[(ports["scheme"] == 49) & (ports["industry"] == "Softw")]
+    assert softw["n_firms"].tolist() == [1, 0]
+    assert np.isnan(softw["vwret"].iloc[1])
+
+
+def test_scheme_frames_match_groupby():
+    df = _panel()
+    ports = industry_portfolios(df, schemes=(5, 49))
+    vwret, vwret_n = scheme_frames(ports, 5)
+
+    df["industry5"] = classify_industry5(df["sic"])
+    expected_n = df.groupby(["date", "industry5"], observed=True)["ret"].count().reset_index()
+    pd.testing.assert_frame_equal(vwret_n, expected_n, check_dtype=False)
+    assert list(vwret.columns) == ["date", "industry5", "vwret"]
+
+
+def test_membership_portfolios():
+    """
+    Two sorts of the same three stocks; the third stock is in no portfolio of
+    the "size" sort, and the stock with a missing return is left out of the
+    VW return.
+    """
+    membership = np.array([[0, 1], [1, 1], [-1, 0]])
+    labels = {"size": ["Small", "Big"], "value": ["Lo", "Hi"]}
+    ports = membership_portfolios(
+        ["2000-06"] * 3, membership, labels, [0.1, np.nan, 0.3], [1.0, 3.0, 2.0]
+    )
+
+    assert ports[["sort", "portfolio"]].values.tolist() == [
+        ["size", "Small"], ["size", "Big"], ["value", "Lo"], ["value", "Hi"],
+    ]
+    np.testing.assert_allclose(ports["vwret"], [0.1, np.nan, 0.3, 0.1])
+    assert ports["n_firms"].tolist() == [1, 0, 1, 1]
+
+
+def test_portfolio_table_characteristics():
+    """
+    Portfolio (2000, A) holds ME 100 and 300 with BE 50 and 150 (BE/ME 0.5
+    each) and OP 0.1 and a missing OP. Portfolio B's only stock has no BE.
+    """
+    df = pd.DataFrame(
+        data={
+            "year": [2000, 2000, 2000],
+            "port": ["A", "A", "B"],
+            "ret": [0.1, -0.1, 0.2],
+            "me": [100.0, 300.0, 50.0],
+            "be": [50.0, 150.0, np.nan],
+            "op": [0.1, np.nan, 0.3],
+        }
+    )
+    df["beme"] = df["be"] / df["me"]
+    result = portfolio_table(
+        df, ["year", "port"], weight_col="me", size_col="me",
+        vw_cols=("beme", "op"), ratio_cols={"sum_be_sum_me": ("be", "me")},
+    )
+
+    assert result["port"].tolist() == ["A", "B"]
+    np.testing.assert_allclose(result["vwret"], [-0.05, 0.2])
+    np.testing.assert_allclose(result["avg_size"], [200.0, 50.0])
+    np.testing.assert_allclose(result["vw_beme"], [0.5, np.nan])
+    np.testing.assert_allclose(result["sum_be_sum_me"], [0.5, np.nan])
+    np.testing.assert_allclose(result["vw_op"], [0.1, 0.3])
+    assert result["n_rows"].tolist() == [2, 1]
+
+
+def test_vw_return_skips_the_weight_of_a_missing_return():
+    """
+    Portfolio A holds ME 100 with return 0.1, ME 300 with return -0.1 and
+    ME 600 without a return: VW = (10 - 30) / 400 = -0.05, not -20 / 1000.
+    """
+    df = pd.DataFrame(
+        data={
+            "date": [0, 0, 0],
+            "port": ["A", "A", "A"],
+            "ret": [0.1, -0.1, np.nan],
+            "me": [100.0, 300.0, 600.0],
+        }
+    )
+    result = portfolio_table(df, ["date", "port"], weight_col="me", size_col="me")
+
+    np.testing.assert_allclose(result["vwret"], [-0.05])
+    np.testing.assert_allclose(result["ewret"], [0.0], atol=1e-12)
+    assert result["n_firms"].tolist() == [2]
+    np.testing.assert_allclose(result["avg_size"], [1000.0 / 3])
+
+
+def test_portfolio_table_matches_wavg_with_missing_and_zero_weights():
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame(
+        data={
+            "date": rng.integers(0, 60, n),
+            "industry49": rng.integers(0, 49, n),
+            "ret": rng.normal(0.01, 0.1, n),
+            "wt": rng.lognormal(size=n),
+        }
+    )
+    df.loc[rng.random(n) < 0.05, "ret"] = np.nan
+    df.loc[rng.random(n) < 0.05, "wt"] = np.nan
+    df.loc[df["industry49"] == 7, "wt"] = 0.0
+    result = portfolio_table(df, ["date", "industry49"])
+
+    def wavg(group):
+        # `calc_industry_portfolios.wavg` on the rows with a return
+        group = group.dropna(subset=["ret"])
+        d, w = group["ret"], group["wt"]
+        return (d * w).sum() / w.sum() if w.sum() != 0 and d.notna().any() else np.nan
+
+    grouped = df.groupby(["date", "industry49"])
+    expected = grouped[["ret", "wt"]].apply(wavg).reset_index(name="vwret")
+    np.testing.assert_allclose(result["vwret"], expected["vwret"])
+    np.testing.assert_allclose(result["ewret"], grouped["ret"].mean())
+    np.testing.assert_array_equal(result["n_firms"], grouped["ret"].count())
+    assert result.loc[result["industry49"] == 7, "vwret"].isna().all()
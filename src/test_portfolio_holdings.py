@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from month_index import ff_year
+from portfolio_holdings import expand_holdings
+
+
+def _monthly():
+    # permno 1 and 2 from January 2000 to December 2001
+    months = np.arange(12 * 2000, 12 * 2002)
+    df = pd.DataFrame(
+        data={
+            "permno": np.repeat([1, 2], months.size),
+            "mdate": np.tile(months, 2),
+        }
+    )
+    df["ffyear"] = ff_year(df["mdate"])
+    df["ret"] = np.arange(len(df)) / 100
+    df["wt"] = np.arange(len(df)) + 1.0
+    return df
+
+
+def test_june_assignments_are_held_from_july_to_june():
+    monthly = _monthly()
+    assignments = pd.DataFrame(
+        data={"permno": [1, 2, 1], "year": [2000, 2000, 2001], "port": ["Lo", "Hi", "Hi"]}
+    )
+    holdings = expand_holdings(assignments, monthly, ["port"], date_col="mdate")
+
+    assert list(holdings.columns) == ["permno", "mdate", "port", "weight", "ret"]
+    first = holdings[holdings["permno"] == 1]
+    # July 2000 to June 2001 in Lo, July 2001 to December 2001 in Hi
+    assert first["mdate"].min() == 12 * 2000 + 6
+    assert (first.loc[first["mdate"] < 12 * 2001 + 6, "port"] == "Lo").all()
+    assert (first.loc[first["mdate"] >= 12 * 2001 + 6, "port"] == "Hi").all()
+    assert len(first) == 18
+    # permno 2 is not assigned in 2001
+    assert holdings.loc[holdings["permno"] == 2, "mdate"].max() == 12 * 2001 + 5
+
+    expected = monthly.set_index(["permno", "mdate"]).loc[
+        pd.MultiIndex.from_frame(holdings[["permno", "mdate"]])
+    ]
+    np.testing.assert_array_equal(holdings["weight"], expected["wt"])
+    np.testing.assert_array_equal(holdings["ret"], expected["ret"])
+
+
+def test_last_assignment_wins_and_categoricals_are_kept():
+    monthly = _monthly()
+    assignments = pd.DataFrame(
+        data={
+            "permno": [1, 1, 2, 3],
+            "year": [2000, 2000, np.nan, 2000],
+            "port": pd.Categorical(["Lo", "Hi", "Hi", "Lo"], categories=["Lo", "Hi"]),
+        }
+    )
+    holdings = expand_holdings(assignments, monthly, ["port"], date_col="mdate")
+
+    assert holdings["permno"].unique().tolist() == [1]
+    assert holdings["port"].dtype == assignments["port"].dtype
+    assert (holdings["port"] == "Hi").all()
+    assert len(holdings) == 12
+
+
+def test_no_assignments():
+    assignments = pd.DataFrame(data={"permno": [], "year": [], "port": []})
+    holdings = expand_holdings(assignments, _monthly(), ["port"], date_col="mdate")
+    assert holdings.empty
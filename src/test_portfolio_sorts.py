@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio_sorts import (
+    SortDimension,
+    batch_sort_codes,
+    portfolio_codes,
+    portfolio_labels,
+    sort_codes,
+    sort_portfolios,
+)
+
+
+def _panel():
+    rng = np.random.default_rng(0)
+    n = 2000
+    df = pd.DataFrame(
+        data={
+            "year": rng.integers(2000, 2004, n),
+            "exchcd": rng.choice([1, 2, 3], n),
+            "me": rng.lognormal(size=n),
+            "ep": rng.normal(0.05, 0.1, n),
+            "op": rng.normal(size=n),
+        }
+    )
+    df.loc[rng.random(n) < 0.05, "ep"] = np.nan
+    return df
+
+
+def _reference_codes(values, reference, percentiles):
+    bp = reference.quantile(list(percentiles)).to_numpy()
+    return np.where(values.isna(), -1, np.searchsorted(bp, values, side="right"))
+
+
+def test_independent_2x3_uses_nyse_breakpoints_per_year(tmp_path):
+    df = _panel()
+    dims = [
+        SortDimension("me", [0.5], labels=["SMALL", "BIG"]),
+        SortDimension("ep", [0.3, 0.7], labels=["LoEP", "MedEP", "HiEP"], nonnegative=True),
+    ]
+    codes = sort_codes(df, dims, date_col="year", cache_dir=tmp_path)
+
+    for year, group in df.groupby("year"):
+        nyse = group[group["exchcd"] == 1]
+        rows = df.index.get_indexer(group.index)
+        np.testing.assert_array_equal(
+            codes[rows, 0], _reference_codes(group["me"], nyse["me"], [0.5])
+        )
+        ep = group["ep"].where(group["ep"] >= 0)
+        nyse_ep = nyse["ep"].where(nyse["ep"] >= 0)
+        np.testing.assert_array_equal(codes[rows, 1], _reference_codes(ep, nyse_ep, [0.3, 0.7]))
+
+
+def test_dependent_sort_within_previous_portfolios(tmp_path):
+    df = _panel()
+    dims = [SortDimension("me", [0.5]), SortDimension("op", [0.25, 0.5, 0.75])]
+    codes = sort_codes(df, dims, date_col="year", mode="dependent", universe="all", cache_dir=tmp_path)
+
+    # every size group of every year is split into op quartiles of its own
+    counts = pd.crosstab([df["year"], codes[:, 0]], codes[:, 1])
+    assert (counts.max(axis=1) - counts.min(axis=1)).max() <= 1
+    for (year, size), group in df.groupby(["year", codes[:, 0]]):
+        rows = df.index.get_indexer(group.index)
+        expected = _reference_codes(group["op"], group["op"], [0.25, 0.5, 0.75])
+        np.testing.assert_array_equal(codes[rows, 1], expected)
+
+
+def test_three_dimensional_labels_and_codes(tmp_path):
+    df = _panel()
+    dims = [
+        SortDimension("me", [0.5], labels=["S", "B"]),
+        SortDimension("op", [0.25, 0.5, 0.75]),
+        SortDimension("ep", [0.25, 0.5, 0.75]),
+    ]
+    ports = sort_portfolios(df, dims, date_col="year", universe="all", cache_dir=tmp_path)
+
+    assert len(ports.cat.categories) == 32
+    assert ports.cat.categories[:2].tolist() == ["S op1 ep1", "S op1 ep2"]
+    assert ports.isna().tolist() == df["ep"].isna().tolist()
+
+
+def test_portfolio_codes():
+    dims = [SortDimension("a", [0.5]), SortDimension("b", [0.3, 0.7])]
+    codes = np.array([[0, 0], [1, 2], [1, -1]])
+
+    np.testing.assert_array_equal(portfolio_codes(codes, dims), [0, 5, -1])
+    assert portfolio_labels(dims) == ["a1 b1", "a1 b2", "a1 b3", "a2 b1", "a2 b2", "a2 b3"]
+    with pytest.raises(ValueError):
+        SortDimension("a", [0.5], labels=["only one"])
+    with pytest.raises(ValueError):
+        sort_codes(pd.DataFrame(data={"year": [2000], "a": [1.0]}), dims[:1], mode="sideways")
+
+
+def test_batch_sort_matches_one_sort_per_dimension(tmp_path):
+    df = _panel()
+    df.loc[df.index[:50], "op"] = 0.0
+    dims = [
+        SortDimension("ep", [0.3, 0.7], side="left", nonnegative=True, name="ep_30_40_30"),
+        SortDimension("ep", [0.2, 0.4, 0.6, 0.8], nonnegative=True, name="ep_quintile"),
+        SortDimension("op", [0.2, 0.4, 0.6, 0.8], merge_ties=True),
+        SortDimension("me", [0.5]),
+    ]
+    codes = batch_sort_codes(df, dims, date_col="year", cache_dir=tmp_path / "batch")
+
+    assert list(codes.columns) == ["ep_30_40_30", "ep_quintile", "op", "me"]
+    assert (codes.dtypes == np.int16).all()
+    for dimension in dims:
+        expected = sort_codes(df, [dimension], date_col="year", cache_dir=tmp_path / "single")
+        np.testing.assert_array_equal(codes[dimension.name], expected[:, 0])
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from month_index import ff_year, month_of
+from portfolio_sorts import SortDimension, sort_codes
+from rebalancing import (
+    ANNUAL,
+    MONTHLY,
+    QUARTERLY,
+    RebalanceSchedule,
+    accounting_in_force,
+    formation_dates,
+    hold_formations,
+    rebalanced_portfolios,
+    schedule,
+)
+
+
+def test_formation_months_of_the_schedules():
+    months = np.arange(12 * 2000, 12 * 2002)
+
+    # annual: June of the Fama-French year
+    np.testing.assert_array_equal(ANNUAL.formation_month(months), 12 * ff_year(months) + 5)
+    np.testing.assert_array_equal(MONTHLY.formation_month(months), months - 1)
+    # January to March are held under the December formation, April under March
+    quarterly = QUARTERLY.formation_month(months[:4])
+    np.testing.assert_array_equal(quarterly, [12 * 1999 + 11] * 3 + [12 * 2000 + 2])
+    assert QUARTERLY.is_formation(months).sum() == 8
+
+
+def test_custom_schedule():
+    custom = RebalanceSchedule(
+        "custom", formation_dates=pd.to_datetime(["2000-09-30", "2000-02-29"]), max_holding=6
+    )
+    months = np.arange(12 * 2000, 12 * 2001 + 6)
+    formation = custom.formation_month(months)
+
+    feb, sep = 12 * 2000 + 1, 12 * 2000 + 8
+    expected = np.where(months <= feb, -1, np.where(months <= sep, feb, sep))
+    # held for at most six months
+    expected[months - expected > 6] = -1
+    np.testing.assert_array_equal(formation, expected)
+    np.testing.assert_array_equal(custom.is_formation([feb, sep, sep + 1]), [True, True, False])
+
+    with pytest.raises(ValueError):
+        RebalanceSchedule("none")
+    with pytest.raises(ValueError):
+        schedule("weekly")
+
+
+def _panels():
+    rng = np.random.default_rng(0)
+    months = np.arange(12 * 2000, 12 * 2003)
+    permnos = np.arange(1, 61)
+    df = pd.DataFrame(
+        data={
+            "permno": np.repeat(permnos, months.size),
+            "mdate": np.tile(months, permnos.size),
+        }
+    )
+    df["exchcd"] = np.where(df["permno"] % 3 == 0, 3, 1)
+    df["me"] = rng.lognormal(size=len(df))
+    df["bm"] = rng.normal(size=len(df))
+    df["ret"] = rng.normal(0.01, 0.05, len(df))
+    df["L_me"] = rng.lognormal(size=len(df))
+    return df
+
+
+def test_rebalanced_portfolios_share_the_sort_of_a_formation_date(tmp_path):
+    df = _panels()
+    dims = [SortDimension("me", [0.5], labels=["S", "B"]), SortDimension("bm", [0.3, 0.7])]
+    holdings = rebalanced_portfolios(
+        df, df, dims, ["annual", QUARTERLY, MONTHLY], ret_col="ret", cache_dir=tmp_path
+    )
+
+    assert list(holdings) == ["annual", "quarterly", "monthly"]
+    expected_codes = sort_codes(df, dims, date_col="mdate", cache_dir=tmp_path / "direct")
+    expected = df.assign(me_code=expected_codes[:, 0], bm_code=expected_codes[:, 1])
+    expected = expected.set_index(["permno", "mdate"])
+
+    for s in (ANNUAL, QUARTERLY, MONTHLY):
+        result = holdings[s.name]
+        formation = s.formation_month(result["mdate"])
+        at_formation = expected.loc[pd.MultiIndex.from_arrays([result["permno"], formation])]
+        np.testing.assert_array_equal(result["me"].cat.codes, at_formation["me_code"])
+        np.testing.assert_array_equal(result["bm"].cat.codes, at_formation["bm_code"])
+        assert (result["portfolio"] == result["me"].astype(str) + " " + result["bm"].astype(str)).all()
+        held = expected.loc[pd.MultiIndex.from_frame(result[["permno", "mdate"]])]
+        np.testing.assert_array_equal(result["weight"], held["L_me"])
+        np.testing.assert_array_equal(result["ret"], held["ret"])
+
+    # monthly holdings start one month after the first formation, annual in July 2000
+    assert holdings["monthly"]["mdate"].min() == 12 * 2000 + 1
+    assert holdings["annual"]["mdate"].min() == 12 * 2000 + 6
+    assert len(holdings["quarterly"]) == 60 * (36 - 3)
+
+
+def test_accounting_in_force_from_june_to_may():
+    annual = pd.DataFrame(
+        data={"permno": [1, 1, 2], "formation_year": [2000, 2001, 2001], "ni": [1.0, 2.0, 3.0]}
+    )
+    monthly = pd.DataFrame(
+        data={"permno": [1, 1, 1, 1, 2, 2, 3], "mdate": 12 * np.array([2000, 2001, 2001, 2002, 2001, 2002, 2001])
+              + np.array([4, 4, 5, 4, 5, 5, 5])},
+        index=np.arange(10, 17),
+    )
+    values = accounting_in_force(annual, monthly, ["ni"])
+
+    # May 2000 is before the first June formation; June 2001 starts the 2001 data
+    assert list(values.index) == list(monthly.index)
+    np.testing.assert_array_equal(values["ni"], [np.nan, 1.0, 2.0, 2.0, 3.0, np.nan, np.nan])
+
+
+def test_hold_formations_carries_any_assignment():
+    df = _panels()
+    formed = df[formation_dates(df["mdate"], [QUARTERLY])].copy()
+    # e.g. an extra bucket for negative values
+    formed["bucket"] = np.where(formed["bm"] < 0, "Negative", "Positive")
+    holdings = hold_formations(formed, df, ["bucket"], [QUARTERLY, "monthly"], value_cols=("me",))
+
+    monthly = holdings["monthly"].set_index(["permno", "mdate"])
+    # only the quarter ends are formation dates of either schedule
+    assert set(month_of(monthly.index.get_level_values("mdate") - 1)) == {3, 6, 9, 12}
+    quarterly = holdings["quarterly"]
+    at_formation = formed.set_index(["permno", "mdate"]).loc[
+        pd.MultiIndex.from_arrays([quarterly["permno"], QUARTERLY.formation_month(quarterly["mdate"])])
+    ]
+    np.testing.assert_array_equal(quarterly["bucket"], at_formation["bucket"])
+    held = df.set_index(["permno", "mdate"]).loc[pd.MultiIndex.from_frame(quarterly[["permno", "mdate"]])]
+    np.testing.assert_array_equal(quarterly["me"], held["me"])
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import segment_kernels
+from segment_kernels import (
+    broadcast_segments,
+    group_offsets,
+    offsets_from_sorted_keys,
+    segment_cumprod,
+    segment_cumsum,
+    segment_first,
+    segment_last,
+    segment_prod,
+    segment_shift,
+    segment_sum,
+    segment_weighted_mean,
+)
+
+
+def _frame():
+    rng = np.random.default_rng(0)
+    n = 200
+    df = pd.DataFrame(
+        data={
+            "permno": rng.integers(0, 15, n),
+            "ffyear": rng.integers(1990, 1994, n),
+            "x": rng.normal(1.0, 0.05, n),
+            "w": rng.random(n),
+        }
+    )
+    df.loc[rng.random(n) < 0.1, "x"] = np.nan
+    return df.sort_values(["permno", "ffyear"], kind="stable").reset_index(drop=True)
+
+
+@pytest.fixture(params=[True, False], ids=["numba", "pandas"])
+def backend(request, monkeypatch):
+    if request.param and not segment_kernels.NUMBA_AVAILABLE:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(segment_kernels, "NUMBA_AVAILABLE", request.param)
+
+
+def test_offsets():
+    offsets = offsets_from_sorted_keys(np.array([1, 1, 2, 2, 2]), np.array([5, 6, 6, 6, 7]))
+    np.testing.assert_array_equal(offsets, [0, 1, 2, 4, 5])
+
+    order, offsets = group_offsets(np.array([2, 1, 2, 1]))
+    np.testing.assert_array_equal(order, [1, 3, 0, 2])
+    np.testing.assert_array_equal(offsets, [0, 2, 4])
+    np.testing.assert_array_equal(broadcast_segments([10, 20], offsets, order), [20, 10, 20, 10])
+
+
+def test_row_kernels_match_groupby(backend):
+    df = _frame()
+    offsets = offsets_from_sorted_keys(df["permno"].values, df["ffyear"].values)
+    grouped = df.groupby(["permno", "ffyear"])["x"]
+
+    np.testing.assert_allclose(segment_cumprod(df["x"].values, offsets), grouped.cumprod())
+    np.testing.assert_allclose(segment_cumsum(df["x"].values, offsets), grouped.cumsum())
+    for periods in [1, 2, -1]:
+        np.testing.assert_allclose(
+            segment_shift(df["x"].values, offsets, periods), grouped.shift(periods)
+        )
+
+
+def test_reductions_match_groupby(backend):
+    df = _frame()
+    offsets = offsets_from_sorted_keys(df["permno"].values, df["ffyear"].values)
+    grouped = df.groupby(["permno", "ffyear"])["x"]
+
+    np.testing.assert_allclose(segment_sum(df["x"].values, offsets), grouped.sum())
+    np.testing.assert_allclose(segment_prod(df["x"].values, offsets), grouped.prod())
+    np.testing.assert_allclose(segment_first(df["x"].values, offsets), grouped.first())
+    np.testing.assert_allclose(segment_last(df["x"].values, offsets), grouped.last())
+
+    valid = df["x"].notna()
+    expected = (
+        (df["x"] * df["w"]).groupby([df["permno"], df["ffyear"]]).sum()
+        / df["w"].where(valid).groupby([df["permno"], df["ffyear"]]).sum()
+    )
+    np.testing.assert_allclose(
+        segment_weighted_mean(df["x"].values, df["w"].values, offsets), expected
+    )
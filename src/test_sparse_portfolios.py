@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from portfolio_aggregation import membership_portfolios
+from sparse_portfolios import sparse_portfolio_stats
+
+
+def _panel():
+    rng = np.random.default_rng(0)
+    n = 4000
+    dates = rng.integers(0, 40, n)
+    membership = np.column_stack([rng.integers(-1, 10, n), rng.integers(-1, 3, n)]).astype(np.int16)
+    labels = {"dec": [f"Dec {i}" for i in range(1, 11)], "ter": ["Lo 30", "Med 40", "Hi 30"]}
+    ret = rng.normal(0.01, 0.1, n)
+    ret[rng.random(n) < 0.05] = np.nan
+    weight = rng.lognormal(size=n)
+    return dates, membership, labels, ret, weight
+
+
+def test_matches_membership_portfolios_across_blocks():
+    dates, membership, labels, ret, weight = _panel()
+    expected = membership_portfolios(dates, membership, labels, ret, weight, size=weight)
+
+    for block_rows in [250, 10**6]:
+        index, columns, stats = sparse_portfolio_stats(
+            dates, membership, labels, ret, weight, size=weight, block_rows=block_rows
+        )
+        assert list(index) == list(range(40))
+        assert columns[:2] == [("dec", "Dec 1"), ("dec", "Dec 2")] and len(columns) == 13
+        wide = {}
+        for name in ["vwret", "ewret", "n_firms", "avg_size"]:
+            frame = pd.DataFrame(stats[name], index=index, columns=pd.MultiIndex.from_tuples(columns))
+            wide[name] = frame.stack([0, 1], future_stack=True)
+        for name, values in wide.items():
+            cells = expected.set_index(["date", "sort", "portfolio"])[name]
+            np.testing.assert_allclose(values.loc[cells.index], cells)
+        # cells without members are empty
+        assert stats["n_rows"].sum() == (membership >= 0).sum()
+
+
+def test_rows_without_a_date_are_left_out():
+    dates = np.array([1.0, np.nan, 1.0, 2.0])
+    index, columns, stats = sparse_portfolio_stats(
+        dates, np.array([0, 0, 1, 1]), {"half": ["Lo", "Hi"]}, [0.1, 0.5, 0.3, np.nan], [1.0, 1.0, 3.0, 2.0]
+    )
+    assert list(index) == [1.0, 2.0]
+    np.testing.assert_allclose(stats["vwret"], [[0.1, 0.3], [np.nan, np.nan]])
+    np.testing.assert_array_equal(stats["n_rows"], [[1, 1], [0, 1]])
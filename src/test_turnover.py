@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from turnover import NOT_SORTED, portfolio_turnover, transition_matrix
+
+
+def _panel():
+    """Random annual memberships of stocks that enter, leave and skip years."""
+    rng = np.random.default_rng(0)
+    years = np.arange(2000, 2008)
+    df = pd.DataFrame(data={"permno": np.repeat(np.arange(200), years.size), "year": np.tile(years, 200)})
+    df["port"] = pd.Categorical.from_codes(rng.integers(-1, 3, len(df)), categories=["Lo", "Mid", "Hi"])
+    df["me"] = rng.lognormal(size=len(df))
+    df = df[rng.random(len(df)) > 0.2]
+    return df.sample(frac=1.0, random_state=1)
+
+
+def _reference(df):
+    """Turnover from one portfolio weight vector per year, stock by stock."""
+    rows = []
+    years = sorted(df["year"].unique())
+    for previous, year in zip(years[:-1], years[1:]):
+        for port in df["port"].cat.categories:
+            old = df[(df["year"] == previous) & (df["port"] == port)].set_index("permno")["me"]
+            new = df[(df["year"] == year) & (df["port"] == port)].set_index("permno")["me"]
+            old, new = old / old.sum(), new / new.sum()
+            changes = new.sub(old, fill_value=0).abs().sum()
+            rows.append(
+                {
+                    "period": year,
+                    "portfolio": port,
+                    "n_firms": len(new),
+                    "n_entries": (~new.index.isin(old.index)).sum(),
+                    "n_exits": (~old.index.isin(new.index)).sum(),
+                    "turnover": (~new.index.isin(old.index)).mean(),
+                    "weight_turnover": changes / 2,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def test_turnover_matches_weight_vectors():
+    df = _panel()
+    result = portfolio_turnover(df, "port", weight_col="me")
+
+    first = result[result["period"] == 2000]
+    assert first["turnover"].isna().all() and first["weight_turnover"].isna().all()
+    later = result[result["period"] > 2000].reset_index(drop=True)
+    pd.testing.assert_frame_equal(later, _reference(df), check_dtype=False)
+
+
+def test_unchanged_portfolios_have_no_turnover():
+    df = pd.DataFrame(
+        data={
+            "permno": [1, 2, 3, 1, 2, 3, 1, 2],
+            "year": [1, 1, 1, 2, 2, 2, 4, 4],
+            "port": ["A", "A", "B", "A", "A", "B", "A", "B"],
+        }
+    )
+    result = portfolio_turnover(df, "port").set_index(["period", "portfolio"])
+
+    assert result.loc[(2, "A"), "turnover"] == 0.0
+    assert result.loc[(2, "B"), "weight_turnover"] == 0.0
+    # year 3 is missing from the panel, so year 4 is compared with year 2
+    assert result.loc[(4, "A"), "n_exits"] == 1
+    assert result.loc[(4, "B"), "n_entries"] == 1
+    assert result.loc[(4, "B"), "weight_turnover"] == 1.0
+
+
+def test_transition_matrix_counts_moves():
+    df = _panel()
+    counts = transition_matrix(df, "port", normalize=False)
+
+    assert list(counts.index) == ["Lo", "Mid", "Hi", NOT_SORTED]
+    assert counts.loc[NOT_SORTED, NOT_SORTED] == 0
+    turnover = portfolio_turnover(df, "port")
+    later = turnover[turnover["period"] > 2000].groupby("portfolio")
+    for port in ["Lo", "Mid", "Hi"]:
+        stays = counts.loc[port, port]
+        assert counts.loc[port].sum() - stays == later["n_exits"].sum()[port]
+        assert counts[port].sum() - stays == later["n_entries"].sum()[port]
+
+    shares = transition_matrix(df, "port")
+    np.testing.assert_allclose(shares.sum(axis=1), 1.0)
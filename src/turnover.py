@@ -0,0 +1,174 @@
+"""
+Portfolio turnover and membership churn between consecutive formations.
+
+At every rebalance some stocks stay in their portfolio, some move to
+another portfolio and some enter or leave the sorted universe. The
+membership of every stock at every formation period is given by a portfolio
+column (categorical, or any labels) of a panel with one row per (stock,
+formation period), e.g. `ccm3[["permno", "year", "opport"]]` or the June
+rows of the univariate sorts.
+
+The panel is sorted once by (stock, period) and every row is linked to the
+row of the same stock in the previous and the next formation period by a
+positional diff of the sorted keys (the periods are factorized, so
+"consecutive" means the previous formation date present in the panel, for
+annual, quarterly or monthly schedules alike). All statistics are then
+bincount reductions over (period, portfolio) keys:
+
+- one-way turnover: the share of a portfolio's stocks that were not in it
+  at the previous formation.
+- weight turnover: half the sum of the absolute changes in portfolio
+  weights (formation weights, e.g. ME, normalized within the portfolio),
+  counting stocks that left the portfolio with their old weight.
+- transition matrix: the frequency of moves from every portfolio (or from
+  outside the sort) to every portfolio (or out of the sort).
+
+Functions:
+- portfolio_turnover(df, portfolio_col, ...): Turnover of every portfolio at every formation.
+- transition_matrix(df, portfolio_col, ...): Transition frequencies between portfolios.
+"""
+import numpy as np
+import pandas as pd
+
+NOT_SORTED = "Not sorted"
+
+
+def _portfolio_codes(column):
+    """Integer codes (-1 when missing) and labels of a portfolio column."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64), list(column.cat.categories)
+    codes, uniques = pd.factorize(column, sort=True)
+    return codes.astype(np.int64), list(uniques)
+
+
+def _consecutive_links(ids, period_codes):
+    """
+    Position of the row of the same id in the previous and in the next
+    formation period (-1 if there is none), from one sort by (id, period).
+    """
+    n = len(ids)
+    order = np.lexsort((period_codes, ids))
+    sorted_ids, sorted_periods = ids[order], period_codes[order]
+    linked = (
+        (sorted_ids[1:] == sorted_ids[:-1])
+        & (sorted_periods[1:] == sorted_periods[:-1] + 1)
+        & (sorted_periods[:-1] >= 0)
+    )
+    previous, following = np.full(n, -1), np.full(n, -1)
+    previous[order[1:][linked]] = order[:-1][linked]
+    following[order[:-1][linked]] = order[1:][linked]
+    return previous, following
+
+
+def _panel_codes(df, portfolio_col, id_col, period_col):
+    period_codes, periods = pd.factorize(df[period_col], sort=True)
+    codes, labels = _portfolio_codes(df[portfolio_col])
+    codes = np.where(period_codes >= 0, codes, -1)
+    previous, following = _consecutive_links(df[id_col].to_numpy(), period_codes)
+    return period_codes, periods, codes, labels, previous, following
+
+
+def portfolio_turnover(df, portfolio_col, id_col="permno", period_col="year", weight_col=None):
+    """
+    Turnover of every portfolio at every formation period.
+
+    Parameters:
+    df (pd.DataFrame): One row per (`id_col`, `period_col`) with the portfolio
+        of the stock in `portfolio_col` (missing if not sorted).
+    weight_col (str, optional): Formation weights (e.g. "me"); equal weights if None.
+
+    Returns:
+    pd.DataFrame: `period`, `portfolio`, `n_firms`, `n_entries` (stocks not
+    in the portfolio at the previous formation), `n_exits` (stocks of the
+    previous formation no longer in it), `turnover` (n_entries / n_firms) and
+    `weight_turnover` (half the sum of absolute weight changes); turnover is
+    missing at the first formation period.
+    """
+    period_codes, periods, codes, labels, previous, following = _panel_codes(
+        df, portfolio_col, id_col, period_col
+    )
+    n_periods, n_ports = len(periods), len(labels)
+    n_keys = n_periods * n_ports
+    member = codes >= 0
+    keys = np.where(member, period_codes * n_ports + codes, -1)
+
+    if weight_col is None:
+        weights = np.ones(len(df))
+    else:
+        weights = np.nan_to_num(df[weight_col].to_numpy(dtype=float))
+    totals = np.bincount(keys[member], weights=weights[member], minlength=n_keys)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = np.where(member, weights / totals[np.maximum(keys, 0)], 0.0)
+
+    # stocks in the same portfolio at the previous formation
+    previous_codes = np.where(previous >= 0, codes[np.maximum(previous, 0)], -1)
+    stayed = member & (previous_codes == codes)
+    previous_shares = np.where(stayed, shares[np.maximum(previous, 0)], 0.0)
+
+    # stocks that leave their portfolio before the next formation period
+    next_codes = np.where(following >= 0, codes[np.maximum(following, 0)], -1)
+    left = member & (next_codes != codes) & (period_codes + 1 < n_periods)
+    exit_keys = (period_codes[left] + 1) * n_ports + codes[left]
+
+    n_firms = np.bincount(keys[member], minlength=n_keys)
+    n_entries = np.bincount(keys[member & ~stayed], minlength=n_keys)
+    n_exits = np.bincount(exit_keys, minlength=n_keys)
+    changes = np.bincount(keys[member], weights=np.abs(shares - previous_shares)[member], minlength=n_keys)
+    changes += np.bincount(exit_keys, weights=shares[left], minlength=n_keys)
+
+    cells = np.flatnonzero((n_firms > 0) | (n_exits > 0))
+    period, portfolio = np.divmod(cells, n_ports)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        turnover = n_entries[cells] / n_firms[cells]
+        weight_turnover = 0.5 * changes[cells]
+    first = period == 0
+    return pd.DataFrame(
+        data={
+            "period": periods[period],
+            "portfolio": np.array(labels, dtype=object)[portfolio],
+            "n_firms": n_firms[cells],
+            "n_entries": n_entries[cells],
+            "n_exits": n_exits[cells],
+            "turnover": np.where(first, np.nan, turnover),
+            "weight_turnover": np.where(first, np.nan, weight_turnover),
+        }
+    )
+
+
+def transition_matrix(df, portfolio_col, id_col="permno", period_col="year", normalize=True):
+    """
+    Moves of stocks between portfolios from one formation period to the next,
+    over all periods.
+
+    Stocks without a portfolio (not sorted, or not in the panel) are in the
+    `NOT_SORTED` row and column, so entries into and exits from the sort are
+    counted too. Returns a DataFrame with the previous portfolio in the
+    index (`from`) and the new one in the columns (`to`), as counts or, if
+    `normalize`, as the share of every row.
+    """
+    period_codes, periods, codes, labels, previous, following = _panel_codes(
+        df, portfolio_col, id_col, period_col
+    )
+    n_periods, n_ports = len(periods), len(labels)
+    outside = n_ports
+    states = n_ports + 1
+
+    # every row after the first period: where it came from and where it is
+    later = period_codes > 0
+    origin = np.where(previous >= 0, codes[np.maximum(previous, 0)], -1)
+    origin = np.where(origin >= 0, origin, outside)[later]
+    target = np.where(codes >= 0, codes, outside)[later]
+    # stocks sorted at a period but absent from the panel at the next one
+    vanished = (codes >= 0) & (following < 0) & (period_codes >= 0) & (period_codes + 1 < n_periods)
+    origin = np.concatenate([origin, codes[vanished]])
+    target = np.concatenate([target, np.full(vanished.sum(), outside)])
+
+    moved = (origin != outside) | (target != outside)
+    counts = np.bincount(origin[moved] * states + target[moved], minlength=states * states)
+    counts = counts.reshape(states, states).astype(float if normalize else np.int64)
+    if normalize:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            counts = counts / counts.sum(axis=1, keepdims=True)
+
+    index = pd.Index([*labels, NOT_SORTED], name="from")
+    return pd.DataFrame(counts, index=index, columns=pd.Index([*labels, NOT_SORTED], name="to"))